@@ -0,0 +1,67 @@
+"""
+
+datagen.py generates synthetic Outdoorsy customer files for the benchmarks in run_benchmarks.py.
+
+Files look like the partner exports we receive: six comma or pipe delimited columns, a unique email for every
+customer, vehicle types with mixed casing and vehicle lengths written in many different ways. Rows are written as
+they are generated, so files with millions of rows can be created without holding them in memory. The same seed
+always produces the same file.
+
+To generate a file from the command line:
+python -m benchmarks.datagen /tmp/customers.csv --rows 1000000 --delimiter pipe
+
+"""
+
+import argparse
+import random
+
+FIRST_NAMES = ['Greta', 'Xiuhtezcatl', 'Mandip', 'Jimmy', 'Ansel', 'Steve', 'Isatou', 'Naomi', 'Wangari', 'Jacques',
+               'Sylvia', 'Rachel', 'John', 'Jane', 'David', 'Chico', 'Berta', 'Ken', 'Vandana', 'Autumn']
+
+LAST_NAMES = ['Thunberg', 'Martinez', 'Singh Soin', 'Buffet', 'Adams', 'Irwin', 'Ceesay', 'Uemura', 'Maathai',
+              'Cousteau', 'Earle', 'Carson', 'Muir', 'Goodall', 'Attenborough', 'Mendes', 'Cáceres', 'Saro-Wiwa',
+              'Shiva', 'Peltier']
+
+DOMAINS = ['future.com', 'earthguardian.org', 'ecotourism.net', 'sailor.com', 'gmail.com', 'recycle.com']
+
+VEHICLE_TYPES = ['sailboat', 'campervan', 'motorboat', 'RV', 'rv', 'bicycle', 'Campervan', 'trailer', 'kayak']
+
+VEHICLE_NAMES = ['Fridays For Future', 'Earth Guardian', 'Frozen Trekker', 'Margaritaville', 'Rushing Water',
+                 'G’Day For Adventure', 'Plastic To Purses', 'Glacier Glider', 'Sea Shepherd', 'Green Belt']
+
+# Formats the length of a vehicle in feet is written in, the same variety seen in partner files.
+LENGTH_FORMATS = ['{feet}’', '{feet} feet', '{feet} ft', "{feet}'", '{feet}', '{feet} FT.', '{meters} m',
+                  '{inches} inches', '{feet}\' {extra}"']
+
+DELIMITERS = {'comma': ',', 'pipe': '|'}
+
+
+def generate_rows(rows, seed=0):
+    generator = random.Random(seed)
+    for number in range(rows):
+        first_name = generator.choice(FIRST_NAMES)
+        last_name = generator.choice(LAST_NAMES)
+        email = f"{first_name}.{last_name}.{number}@{generator.choice(DOMAINS)}".lower().replace(' ', '')
+        feet = generator.randint(4, 45)
+        length = generator.choice(LENGTH_FORMATS).format(feet=feet, meters=round(feet / 3.28084, 1),
+                                                         inches=feet * 12, extra=generator.randint(1, 11))
+        yield (first_name, last_name, email, generator.choice(VEHICLE_TYPES), generator.choice(VEHICLE_NAMES),
+               length)
+
+
+def write_file(path, rows, delimiter='comma', seed=0):
+    separator = DELIMITERS[delimiter]
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        for row in generate_rows(rows, seed):
+            file.write(separator.join(row) + "\n")
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic Outdoorsy customer file.")
+    parser.add_argument("path", help="Path of the file to create")
+    parser.add_argument("--rows", type=int, default=1000, help="Number of rows. Defaults to 1000")
+    parser.add_argument("--delimiter", choices=list(DELIMITERS), default='comma', help="Defaults to comma")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed. Defaults to 0")
+    args = parser.parse_args()
+    write_file(args.path, args.rows, args.delimiter, args.seed)
@@ -0,0 +1,234 @@
+"""
+
+run_benchmarks.py measures the performance of the paths outdoorsy relies on, using files from datagen.py:
+
+- ingest: rows per second uploading a file with insert_csv_to_db, for both delimiters
+- ingest-without-search: the same upload into a database without the customers_fts search table, so the difference
+  with the ingest case is the cost of keeping the search filter's full-text index up to date
+- view: the time taken by get_entries, format_results and stream_results for every sort order
+- memory: the memory held by the result of get_entries (a ResultSet) against a list of sqlite3.Row for the same rows
+
+Every case runs in its own process, so the peak RSS reported for a case only includes that case. The results are
+written as JSON, and can be compared against a stored baseline to catch regressions.
+
+Examples:
+
+Run the default sizes and save the results as the baseline:
+python -m benchmarks.run_benchmarks --output benchmarks/baseline.json
+
+Run again after a change and compare, failing if anything got more than 10% slower:
+python -m benchmarks.run_benchmarks --output results.json --baseline benchmarks/baseline.json --tolerance 0.1
+
+Run an ingest only benchmark on 10 million rows:
+python -m benchmarks.run_benchmarks --rows 10000000 --skip-view
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from .datagen import write_file, DELIMITERS
+
+try:
+    import resource
+except ImportError:
+    # The resource module isn't available on Windows, where peak memory is reported as null.
+    resource = None
+
+DEFAULT_ROWS = [1000, 100000]
+
+# Views of tables larger than this are skipped, since format_results holds the whole table in memory.
+MAX_VIEW_ROWS = 1000000
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_ingest(rows, delimiter, directory, search=True):
+    from outdoorsy import create_table, insert_csv_to_db, parse_delimiter, get_connection
+    from outdoorsy.database import SEARCH_TABLE, SEARCH_TRIGGERS
+
+    path = write_file(os.path.join(directory, f"customers-{rows}.{delimiter}"), rows, delimiter)
+    db_path = os.path.join(directory, f"ingest-{rows}-{delimiter}{'' if search else '-without-search'}.db")
+    create_table(db_path)
+    if not search:
+        connection = get_connection(db_path)
+        with connection:
+            for trigger_name in SEARCH_TRIGGERS:
+                connection.execute(f'DROP TRIGGER IF EXISTS "{trigger_name}";')
+            connection.execute(f'DROP TABLE IF EXISTS "{SEARCH_TABLE}";')
+
+    started = time.perf_counter()
+    insert_csv_to_db(path, parse_delimiter(delimiter), db_path)
+    seconds = time.perf_counter() - started
+
+    return {'rows': rows, 'seconds': seconds, 'rows_per_sec': rows / seconds, 'peak_rss_kb': peak_rss_kb()}
+
+
+def run_view(rows, sort_order, directory):
+    from outdoorsy import create_table, insert_csv_to_db, get_entries, iter_entries, format_results, stream_results
+
+    db_path = os.path.join(directory, f"view-{rows}.db")
+    if not os.path.exists(db_path):
+        path = write_file(os.path.join(directory, f"customers-{rows}.comma"), rows)
+        create_table(db_path)
+        insert_csv_to_db(path, ',', db_path)
+
+    started = time.perf_counter()
+    results = get_entries(sort_order, db_path)
+    get_entries_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    format_results(results)
+    format_results_seconds = time.perf_counter() - started
+    del results
+
+    started = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        stream_results(iter_entries(sort_order, db_path), file=devnull)
+    stream_results_seconds = time.perf_counter() - started
+
+    return {'rows': rows, 'get_entries_seconds': get_entries_seconds,
+            'format_results_seconds': format_results_seconds, 'stream_results_seconds': stream_results_seconds,
+            'peak_rss_kb': peak_rss_kb()}
+
+
+def run_memory(rows, directory):
+    from outdoorsy import create_table, insert_csv_to_db, get_entries, get_connection
+    from outdoorsy.database import SELECT_SQL
+
+    db_path = os.path.join(directory, f"view-{rows}.db")
+    if not os.path.exists(db_path):
+        path = write_file(os.path.join(directory, f"customers-{rows}.comma"), rows)
+        create_table(db_path)
+        insert_csv_to_db(path, ',', db_path)
+    connection = get_connection(db_path)
+
+    def held_bytes(read):
+        # The memory still allocated once the rows are read is the memory the result holds.
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = read()
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del result
+        return held
+
+    row_list_bytes = held_bytes(lambda: connection.execute(f"{SELECT_SQL} ORDER BY email;").fetchall())
+    result_set_bytes = held_bytes(lambda: get_entries('email', db_path))
+
+    return {'rows': rows, 'row_list_bytes': row_list_bytes, 'result_set_bytes': result_set_bytes,
+            'result_set_bytes_per_row': result_set_bytes / rows, 'peak_rss_kb': peak_rss_kb()}
+
+
+def run_case(case, directory):
+    """Runs a single case in a new process and returns its results."""
+    command = [sys.executable, '-m', 'benchmarks.run_benchmarks', '--case', json.dumps(case), '--directory',
+               directory]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=root).stdout
+    return json.loads(output)
+
+
+def plan_cases(row_counts, skip_view=False):
+    from outdoorsy.sorting import SORT_ORDERS
+
+    for rows in row_counts:
+        for delimiter in DELIMITERS:
+            yield {'name': f"ingest/{delimiter}/{rows}", 'kind': 'ingest', 'rows': rows, 'delimiter': delimiter}
+        yield {'name': f"ingest-without-search/comma/{rows}", 'kind': 'ingest', 'rows': rows, 'delimiter': 'comma',
+               'search': False}
+        if skip_view or rows > MAX_VIEW_ROWS:
+            continue
+        for sort_order in SORT_ORDERS:
+            yield {'name': f"view/{sort_order}/{rows}", 'kind': 'view', 'rows': rows, 'sort_order': sort_order}
+        yield {'name': f"memory/{rows}", 'kind': 'memory', 'rows': rows}
+
+
+def compare(results, baseline, tolerance):
+    """Compares results against a baseline.
+
+        Returns:
+            A list of messages, one for every measurement that is more than tolerance slower than the baseline.
+
+        """
+    regressions = []
+    for name, measurements in results['cases'].items():
+        for metric, value in measurements.items():
+            previous = baseline.get('cases', {}).get(name, {}).get(metric)
+            # Measurements missing from either run, such as peak RSS on Windows, aren't compared.
+            if previous is None or value is None or metric == 'rows':
+                continue
+            # Throughput should go up, everything else (seconds and memory) should go down.
+            higher_is_better = metric == 'rows_per_sec'
+            change = (previous - value) / previous if higher_is_better else (value - previous) / previous
+            if change > tolerance:
+                regressions.append(f"{name} {metric}: {previous:.4g} -> {value:.4g} ({change:+.0%})")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the outdoorsy benchmarks.")
+    parser.add_argument("--rows", type=int, nargs='+', default=DEFAULT_ROWS,
+                        help=f"Row counts to benchmark. Defaults to {DEFAULT_ROWS}")
+    parser.add_argument("--skip-view", action='store_true', help="Only run the ingest benchmarks")
+    parser.add_argument("--output", help="Path to write the results JSON to. Defaults to stdout")
+    parser.add_argument("--baseline", help="Path of a results JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed slowdown against the baseline before failing. Defaults to 0.1 (10%%)")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        case = json.loads(args.case)
+        if case['kind'] == 'ingest':
+            result = run_ingest(case['rows'], case['delimiter'], args.directory, case.get('search', True))
+        elif case['kind'] == 'memory':
+            result = run_memory(case['rows'], args.directory)
+        else:
+            result = run_view(case['rows'], case['sort_order'], args.directory)
+        print(json.dumps(result))
+        return 0
+
+    results = {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'cases': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for case in plan_cases(args.rows, args.skip_view):
+            print(f"Running {case['name']}", file=sys.stderr)
+            results['cases'][case['name']] = run_case(case, directory)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,3 @@
+# The version specified here is used in pyproject.toml for the package's version uploaded to pypi
+# and in the --version argparse argument in cli.py
+__version__ = '1.0.0'
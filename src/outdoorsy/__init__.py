@@ -7,7 +7,7 @@ Features
 - Use as command-line tool interactively or by passing arguments
 - Creates a local SQL Lite Database for storing files
 - View database in a table format from the command-line
-- Sort by "Name" or "Vehicle Type" columns (from sample files)
+- Sort by "Name", "Vehicle Type", "Email" or "Vehicle Length" columns in either direction
 
 Usage
 
@@ -21,117 +21,74 @@ https://github.com/rachaelcrook/outdoorsy
 
 """
 
-# The InvalidDelimiter class below is imported in order for import references in tests to function,
-# but is not used in this __init__.py file directly.
-import os
+# The names below are loaded from their modules the first time they are used (PEP 562), rather than when outdoorsy is
+# imported, so that outdoorsy --version and outdoorsy -h don't pay for importing sqlite3, tabulate and colorama.
+# They are kept here in order for import references such as from outdoorsy import create_table to function.
 import sys
-from os.path import exists
-from .app import run_interactively, format_results, parse_delimiter, parse_args, InvalidDelimiter
-from .database import get_entries, insert_csv_to_db, create_table
-from colorama import Fore, Style
+from .__about__ import __version__
+
+_LAZY_NAMES = {
+    'app': ['run_interactively', 'format_results', 'stream_results', 'view_entries', 'upload_files',
+            'parse_delimiter', 'InvalidDelimiter', 'run', 'run_with_args'],
+    'cli': ['create_parser', 'parse_args'],
+    'migrations': ['migrate', 'UnsupportedSchema'],
+    'database': ['get_entries', 'iter_entries', 'insert_csv_to_db', 'create_table', 'get_connection',
+                 'close_connections', 'get_summary', 'rebuild_summary'],
+    'lengths': ['parse_length', 'normalize_lengths', 'InvalidLength'],
+    'reader': ['sniff_delimiter', 'iter_records', 'DelimiterNotDetected'],
+    'stats': ['STATS', 'profile_hook'],
+    'ingest': ['ingest_files', 'expand_paths'],
+    'sorting': ['SORT_ORDERS', 'InvalidSortOrder', 'InvalidCursor'],
+    'filters': ['Filters'],
+    'export': ['export_rows', 'read_columnar', 'EXPORT_FORMATS'],
+    'server': ['serve', 'Server'],
+    'client': ['Client', 'ServerError'],
+    'shards': ['iter_merged_entries', 'insert_partitioned'],
+    'results': ['ResultSet'],
+    'stream': ['insert_stream', 'follow_file', 'read_lines'],
+    'rejects': ['RejectFile', 'validate_file'],
+    'locking': ['WriteLock'],
+    'session': ['Session'],
+}
+_LAZY_MODULES = {name: module for module, names in _LAZY_NAMES.items() for name in names}
+
+
+def __getattr__(name):
+    module = _LAZY_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_MODULES))
 
 
 def main():
+    if sys.argv[1:2] == ['serve']:
+        from .cli import parse_serve_args
+        from .server import run_server
+        run_server(parse_serve_args(sys.argv[2:]))
+        return
+
     if len(sys.argv) == 1:
         # Run interactively if no arguments are passed.
+        from .app import run_interactively
         run_interactively()
 
+    from .cli import parse_args
     args = parse_args(sys.argv[1:])
     # if troubleshooting issues with parsing args, uncomment the line below to see what args are being captured
     # print(sys.argv)
 
-    if args.file and args.delimiter and not args.dbpath:
-        input_path = args.file
-
-        # check if the file specified in the -f argument exists first, if not throw an error.
-        file_exists = exists(input_path)
-        if file_exists:
-            create_table()
-            delimiter = parse_delimiter(args.delimiter)
-            try:
-                insert_csv_to_db(input_path, delimiter)
-                print(Fore.GREEN + f"File uploaded successfully ")
-                print(Style.RESET_ALL)
-            except TypeError:
-                print(Fore.RED + f"Error: TypeError - Please verify {args.delimiter} is the correct "
-                                 f"delimiter for this file type.")
-
-        else:
-            print(Fore.RED + f"Error: Could not find file at path:\n {input_path}."
-                             f"\n Please verify the file exists and try again.")
-            print(Style.RESET_ALL)
-
-    if args.delimiter and not args.file:
-        print(Fore.RED + "Please specify both a file and delimiter. For example: outdoorsy -f comma.csv -d comma")
-        print(Style.RESET_ALL)
-
-    if args.file and not args.delimiter:
-        print(Fore.RED + "Please specify both a file and delimiter. For example: outdoorsy -f comma.csv -d comma")
-        print(Style.RESET_ALL)
-
-    if args.file and args.delimiter and args.dbpath:
-        # check if the file specified in the -f argument exists first, if not throw an error.
-        file_exists = exists(args.file)
-        db_path_file_exists = exists(args.dbpath)
-
-        if file_exists and db_path_file_exists:
-            delimiter = parse_delimiter(args.delimiter)
-            dbpath = os.path.join(args.dbpath, "customers.db")
-            create_table(dbpath)
-            insert_csv_to_db(args.file, delimiter, dbpath)
-            print(Fore.GREEN + f"File uploaded successfully to Database at path: {args.dbpath}. \n"
-                               f"Note: this database path will need to be specified everytime you would like to view"
-                               f" the results. Otherwise, outdoorsy defaults to the current"
-                               f" path which is {os.getcwd()} .")
-            print(Style.RESET_ALL)
-        else:
-            print(Fore.RED + f"Error: Could either \n1. Not find the comma or pipe delimited file at the path specified"
-                             f"\nor \n2. Not find the path specified to create the database.\n"
-                             f" Please verify the file exists at {args.dbpath}"
-                             f" and the path to create the database exists at {args.dbpath} "
-                             f"  and try again.")
-            print(Style.RESET_ALL)
-
-    if args.view and not args.sort:
-        results = get_entries('name')
-        print(format_results(results))
-
-    if args.sort and not args.view:
-        print(Fore.RED + "Please specify both a view and sort argument. For example: outdoorsy -v -s vehicle_type")
-        print(Style.RESET_ALL)
-
-    if args.view and args.sort and not args.dbpath:
-        sorted_by = args.sort
-        if sorted_by == 'name':
-            results = get_entries(sorted_by)
-            print(format_results(results))
-        elif sorted_by == 'vehicle_type':
-            results = get_entries(sorted_by)
-            print(format_results(results))
-        else:
-            print(Fore.RED + "Invalid option, please try again!")
-            print(Style.RESET_ALL)
-
-    if args.view and args.sort and args.dbpath:
-        if exists(args.dbpath):
-            sorted_by = args.sort
-            if sorted_by == 'name':
-                dbpath = os.path.join(args.dbpath, "customers.db")
-                create_table(dbpath)
-                results = get_entries(sorted_by, dbpath)
-                print(format_results(results))
-            elif sorted_by == 'vehicle_type':
-                dbpath = os.path.join(args.dbpath, "customers.db")
-                create_table(dbpath)
-                results = get_entries(sorted_by, dbpath)
-                print(format_results(results))
-            else:
-                print(Fore.RED + "Invalid option, please try again!")
-                print(Style.RESET_ALL)
-        else:
-            print(Fore.RED + f"The path specified for the database path does not exist."
-                             f" Please try again. path: {args.dbpath}")
-            print(Style.RESET_ALL)
+    from .app import run
+    # A failed upload exits with a status of 1, which is how the server tells a failed upload job apart.
+    if not run(args):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
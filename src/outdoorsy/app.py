@@ -30,101 +30,32 @@ outdoorsy
 
 """
 
+import io
+import json
 import os
+import sys
+from itertools import chain, islice
 from os.path import exists
 import sqlite3
-from tabulate import tabulate
-from .database import get_entries, create_table, insert_csv_to_db
+from .__about__ import __version__
+from .database import iter_entries, next_cursor, create_table, insert_csv_to_db, DEFAULT_BATCH_SIZE, \
+    ensure_email_key, file_fingerprint, is_loaded, record_load, get_checkpoint, get_range_checkpoints, \
+    get_changed_checkpoint, clear_checkpoints, get_summary, rebuild_summary, Summary, get_change_counter
+from .client import Client, ServerError
+from .export import export_rows
+from .filters import Filters
+from .ingest import ingest_files, expand_paths
+from .lengths import InvalidLength
+from .migrations import UnsupportedSchema
+from .reader import DELIMITERS, DEFAULT_FLUSH_INTERVAL, DelimiterNotDetected
+from .rejects import RejectFile, validate_file
+from .render_cache import RenderCache, cache_key
+from .session import Session
+from .shards import iter_merged_entries, next_merged_cursor, insert_partitioned, shard_directories
+from .stats import STATS, profile_hook
+from .stream import read_lines, follow_file, insert_stream, STDIN
+from .sorting import InvalidCursor
 from colorama import Fore, Style
-import argparse
-
-# The version specified here is used in pyproject.toml for the package's version uploaded to pypi
-# and in the --version argparse argument below
-__version__ = '1.0.0'
-
-
-def create_parser():
-    """Creates the Argument Parser Object and
-        adds all the required arguments to it.
-
-        Returns:
-            Parser
-
-        """
-    # create a parser object
-    parser = argparse.ArgumentParser(prog="outdoorsy",
-                                     add_help=True,
-                                     formatter_class=argparse.RawDescriptionHelpFormatter,
-                                     description="""
-***Outdoorsy***
-Command Line tool for displaying Outdoorsy user information from a local database.
-
-***Features***
--Use as command-line tool interactively or by passing arguments
--Creates a local SQL Lite Database for storing files
--View database in a table format from the command-line
--Sort by "Name" or "Vehicle Type" columns (from sample files)
-
-Please see examples at the end of this help page or visit the project's github for more information.
-https://github.com/rachaelcrook/outdoorsy""",
-                                     epilog="""
-                                     
-***Examples***
-
-Run in interactive mode:
-outdoorsy
-                                     
-Upload CSV file to database:
-outdoorsy -f C:\\folder\\file.csv -d comma
-
-Upload Pipe delimited file to database:
-outdoorsy -f C:\\folder\\pipes.text -d pipe
-
-View data that has previously been uploaded to the database:
-outdoorsy -v
-
-View data sorted by Vehicle Type:
-outdoorsy -v -s vehicle_type
-
-View data sorted by name:
-outdoorsy -v -s name """)
-
-    # Defining arguments
-    file_group = parser.add_argument_group(title="options - Upload a new file.")
-    file_group.add_argument("-f", "--file",
-                            required=False,
-                            help="Full path to file")
-
-    file_group.add_argument("-d", "--delimiter",
-                            choices=['comma', 'pipe'],
-                            required=False,
-                            help="File's delimiter")
-
-    file_group.add_argument("-db", "--dbpath",
-                            required=False,
-                            help="Directory to create database. Defaults to current directory")
-
-    view_group = parser.add_argument_group(title="options - View and Sort data")
-
-    view_group.add_argument("-v", "--view",
-                            required=False, action='store_true',
-                            help="View the Outdoorsy Customer Table.")
-
-    view_group.add_argument("-s", "--sort",
-                            choices=['name', 'vehicle_type'],
-                            required=False,
-                            help="Sort the database table by the Outdoorsy Customer's Fullname or Vehicle Type")
-
-    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
-
-    return parser
-
-
-def parse_args(args):
-    # Creating the parser and parsing the arguments
-    parser = create_parser()
-    parsed_args = parser.parse_args(args)
-    return parsed_args
 
 
 def run_interactively():
@@ -134,105 +65,120 @@ def run_interactively():
     Please select one of the following options:
     1) Upload new file (comma or pipe delimited)
     2) View entries
-    3) Exit.
+    3) Change database
+    4) Exit.
     
     
     Your selection:  '''
 
+    # The session keeps the selected database, and the rows and pages already displayed, between menu choices.
+    session = Session(render=format_results, upload=upload_files)
+
     # using walrus operator to ask for user input directly in the while loop.
-    while (user_input := input(menu)) != "3":
+    while (user_input := input(menu)) != "4":
         if user_input == "1":
             input_path = input("Enter the path to the comma or pipe delimited file you would like to upload: ")
             input_delimiter = input('Enter the delimiter "comma" or "pipe" : ').lower()
-            delimiter = parse_delimiter(input_delimiter)
-            input_dbpath_option = input('Would you like to specify the DB Path? (Y/n): ').lower()
-            if input_dbpath_option == "y":
-                input_dbpath = input("Enter the path to create the Database: ")
-                if exists(input_dbpath):
-                    try:
-                        dbpath = os.path.join(input_dbpath, "customers.db")
-                        create_table(dbpath)
-                        insert_csv_to_db(input_path, delimiter, dbpath)
-                        print(Fore.GREEN + f"File Uploaded successfully! Database is located at: "
-                                           f"{dbpath}")
-                        print(Style.RESET_ALL)
-                    except FileNotFoundError:
-                        print(Fore.RED + f"no comma or pipe delimited files were found at that path. Path entered was:"
-                                         f" {input_path} Please verify a comma or pipe delimited file exists"
-                                         f" at this path and try again.")
-                        print(Style.RESET_ALL)
-                    except sqlite3.OperationalError:
-                        print(Fore.RED + f"The path specified was not found. Please try again. Path: {input_dbpath}")
-                        print(Style.RESET_ALL)
-
-                    except TypeError:
-                        print(Fore.RED + f"The delimiter specified must be either comma or pipe."
-                                         f" The delimiter entered was: {input_delimiter} Please try again.")
-                        print(Style.RESET_ALL)
-                else:
-                    print(Fore.RED + f"Error: The path specified to create the database does not exist. Please"
-                                     f"try again using a valid path. Path entered was: {input_dbpath}")
+            if not session.selected and not choose_database(session, 'Would you like to specify the DB Path? (Y/n): ',
+                                                            "Enter the path to create the Database: "):
+                continue
+            try:
+                # A file that was already uploaded is skipped, with the message printed by upload_files.
+                rows = session.upload(input_path, parse_delimiter(input_delimiter))
+                if rows:
+                    print(Fore.GREEN + f"File Uploaded successfully! {rows} rows were added to the database located "
+                                       f"at: {os.path.abspath(session.db_path)}")
                     print(Style.RESET_ALL)
-
-            elif input_dbpath_option == "n":
-                try:
-                    create_table()
-                    insert_csv_to_db(input_path, delimiter)
-                    print(Fore.GREEN + f"File Uploaded successfully! Database is located in "
-                                       f"the current working directory: {os.getcwd()}")
-                    print(Style.RESET_ALL)
-
-                except FileNotFoundError:
-                    print(Fore.RED + f"no comma or pipe delimited files were found at that path. Path entered was:"
-                                     f" {input_path} Please verify a comma or pipe delimited file exists"
-                                     f" at this path and try again.")
-                    print(Style.RESET_ALL)
-                except TypeError:
-                    print(Fore.RED + f"The delimiter specified must be either comma or pipe."
-                                     f" The delimiter entered was: {input_delimiter} Please try again.")
-                    print(Style.RESET_ALL)
-            else:
-                print(Fore.RED + f"Please specify 'y' to specify the path to create the database or 'n' "
-                                 f"to default to the current directory.")
+            except FileNotFoundError:
+                print(Fore.RED + f"no comma or pipe delimited files were found at that path. Path entered was:"
+                                 f" {input_path} Please verify a comma or pipe delimited file exists"
+                                 f" at this path and try again.")
+                print(Style.RESET_ALL)
+            except sqlite3.OperationalError:
+                print(Fore.RED + f"The database could not be written. Please try again. Path: {session.db_path}")
+                print(Style.RESET_ALL)
+            except (TypeError, InvalidDelimiter):
+                print(Fore.RED + f"The delimiter specified must be either comma or pipe."
+                                 f" The delimiter entered was: {input_delimiter} Please try again.")
+                print(Style.RESET_ALL)
+            except InvalidLength as error:
+                print(Fore.RED + f"Error: {error}. Please verify the vehicle length column of the file and try again.")
                 print(Style.RESET_ALL)
+            except UnicodeDecodeError:
+                print(Fore.RED + f"Error: {input_path} could not be read as UTF-8 text. Please verify it is a comma or"
+                                 f" pipe delimited file and try again.")
+                print(Style.RESET_ALL)
+
         elif user_input == "2":
-            custom_db_path = input("Did you previously set a custom DB Path? (Y/n): ").lower()
-            if custom_db_path == "y":
-                input_dbpath = input("Please enter path to database: ")
-                dbpath = os.path.join(input_dbpath, "customers.db")
-                if exists(dbpath):
-                    select_info = input("Would you like to sort by Full Name (1) or by Vehicle Type (2)?  (1|2): ")
-                    if select_info == "1":
-                        # dbpath = os.path.join(input_dbpath, "customers.db")
-                        create_table(dbpath)
-                        results = get_entries('name', dbpath)
-                        print(format_results(results))
-                    elif select_info == "2":
-                        results = get_entries('vehicle_type', dbpath)
-                        print(format_results(results))
-                    else:
-                        print(Fore.RED + "Invalid option, please try again!")
-                        print(Style.RESET_ALL)
-                else:
-                    print(Fore.RED + f"Error: Unable to locate database at path: {dbpath}. Please try again! ")
-                    print(Style.RESET_ALL)
-            elif custom_db_path == "n":
-                select_info = input("Would you like to sort by Full Name (1) or by Vehicle Type (2)?  (1|2): ")
-                if select_info == "1":
-                    results = get_entries('name')
-                    print(format_results(results))
-                elif select_info == "2":
-                    results = get_entries('vehicle_type')
-                    print(format_results(results))
-                else:
-                    print(Fore.RED + "Invalid option, please try again!")
-                    print(Style.RESET_ALL)
+            if not session.selected and not choose_database(session, "Did you previously set a custom DB Path? (Y/n): ",
+                                                            "Please enter path to database: ", must_exist=True):
+                continue
+            select_info = input("Would you like to sort by Full Name (1) or by Vehicle Type (2)?  (1|2): ")
+            sort_order = {"1": 'name', "2": 'vehicle_type'}.get(select_info)
+            if sort_order:
+                page_through(session, sort_order)
             else:
                 print(Fore.RED + "Invalid option, please try again!")
                 print(Style.RESET_ALL)
 
         elif user_input == "3":
-            break
+            choose_database(session, "Would you like to use a database at a custom DB Path? (Y/n): ",
+                            "Please enter path to database: ")
+
+        else:
+            print(Fore.RED + "Invalid option, please try again!")
+            print(Style.RESET_ALL)
+
+
+def choose_database(session, question, path_prompt, must_exist=False):
+    """Asks for the database to use for the rest of the session.
+
+        Returns:
+            True if a database was selected.
+
+        """
+    option = input(question).lower()
+    if option == "y":
+        input_dbpath = input(path_prompt)
+        dbpath = os.path.join(input_dbpath, "customers.db")
+        if not exists(dbpath if must_exist else input_dbpath):
+            print(Fore.RED + f"Error: Unable to locate the path: {input_dbpath}. Please try again using a valid path.")
+            print(Style.RESET_ALL)
+            return False
+        session.select_database(dbpath)
+    elif option == "n":
+        session.select_database("customers.db")
+    else:
+        print(Fore.RED + f"Please specify 'y' to specify the path of the database or 'n' "
+                         f"to default to the current directory.")
+        print(Style.RESET_ALL)
+        return False
+
+    return True
+
+
+def page_through(session, sort_order):
+    # Large tables are shown a page at a time, moving between pages until the user goes back to the menu.
+    page = 1
+    while True:
+        print(session.render_page(sort_order, page))
+        pages = session.page_count(sort_order)
+        if pages == 1:
+            return
+
+        choice = input(f"Page {page} of {pages}. Enter n for the next page, p for the previous page, a page number, "
+                       f"a to show every row or b to go back to the menu: ").lower().strip()
+        if choice in ("n", ""):
+            page = min(page + 1, pages)
+        elif choice == "p":
+            page = max(page - 1, 1)
+        elif choice.isdigit() and 1 <= int(choice) <= pages:
+            page = int(choice)
+        elif choice == "a":
+            stream_results(session.results(sort_order))
+            return
+        elif choice == "b":
+            return
         else:
             print(Fore.RED + "Invalid option, please try again!")
             print(Style.RESET_ALL)
@@ -246,15 +192,456 @@ in a command line or terminal window.
 """
 
 
+HEADERS = ['First Name', 'Last Name', 'Email', 'Vehicle Type', 'Vehicle Name', 'Vehicle Length (in FT.)']
+
+# Number of rows used by stream_results to work out the column widths before printing starts.
+DEFAULT_SAMPLE_SIZE = 1000
+
+
 def format_results(results):
-    table = tabulate(
-        results,
-        headers=['First Name', 'Last Name', 'Email', 'Vehicle Type', 'Vehicle Name', 'Vehicle Length (in FT.)'],
-        tablefmt='psql')
+    # tabulate is slow to import, so it is only imported by the functions using it. stream_results, used by -v and
+    # --server, doesn't need it.
+    from tabulate import tabulate
+
+    with STATS.stage('render'):
+        table = tabulate(
+            results,
+            headers=HEADERS,
+            tablefmt='psql')
 
     return table
 
 
+"""
+
+stream_results prints rows in the same table format as format_results, but writes each row as soon as it is read 
+instead of building the whole table in memory first. The column widths are taken from the headers and the first 
+sample_size rows, so a longer value further down the table will widen its row rather than the whole column.
+
+"""
+
+
+def stream_results(rows, file=None, sample_size=DEFAULT_SAMPLE_SIZE):
+    with STATS.stage('render'):
+        return _stream_results(rows, file or sys.stdout, sample_size)
+
+
+def _stream_results(rows, file, sample_size):
+    rows = iter(rows)
+    sample = list(islice(rows, sample_size))
+
+    # tabulate pads headers by two spaces, which is matched here so both outputs look the same.
+    widths = [len(header) + 2 for header in HEADERS]
+    for row in sample:
+        for column, width in enumerate(widths):
+            widths[column] = max(width, len(str(row[column])))
+
+    # The vehicle length column is right aligned like tabulate does for numbers.
+    def format_line(values):
+        cells = [str(value).ljust(width) for value, width in zip(values[:-1], widths)]
+        cells.append(str(values[-1]).rjust(widths[-1]))
+        return "| " + " | ".join(cells) + " |\n"
+
+    dashes = "+".join("-" * (width + 2) for width in widths)
+    border = f"+{dashes}+\n"
+    file.write(border)
+    file.write(format_line(HEADERS))
+    file.write(f"|{dashes}|\n")
+
+    count = 0
+    last_row = None
+    for row in chain(sample, rows):
+        file.write(format_line(tuple(row)[:len(HEADERS)]))
+        count += 1
+        last_row = row
+    file.write(border)
+    STATS.count('rows_rendered', count)
+
+    return count, last_row
+
+
+"""
+
+upload_files is used by the -f option. A single file is uploaded with insert_csv_to_db, several files are parsed in 
+parallel by ingest_files and a report with the rows uploaded and throughput for every file is printed at the end. 
+Files that have already been uploaded to the database are skipped, and so are files whose previous upload stopped part
+way through unless resume (--resume) or force (--force) is used. Returns False if any of the files could not be 
+uploaded.
+
+With reject_path, rows that can't be uploaded are written to that file and the other rows are uploaded, see rejects.py.
+With concurrent (--concurrent), several uploads can write to the same database at once, see locking.py.
+
+"""
+
+
+def upload_files(paths, delimiter, db_path="customers.db", batch_size=DEFAULT_BATCH_SIZE, single_transaction=False,
+                 workers=None, upsert=False, force=False, resume=False, reject_path=None, concurrent=False):
+    rejects = RejectFile(reject_path) if reject_path else None
+    try:
+        return _upload_files(paths, delimiter, db_path, batch_size, single_transaction, workers, upsert, force, resume,
+                             rejects, concurrent)
+    finally:
+        if rejects is not None:
+            rejects.close()
+            report_rejects(rejects)
+
+
+def _upload_files(paths, delimiter, db_path, batch_size, single_transaction, workers, upsert, force, resume, rejects,
+                  concurrent):
+    if upsert:
+        removed = ensure_email_key(db_path)
+        if removed:
+            print(f"Removed {removed} duplicate customers so email can be used as the customer key.")
+
+    # Files already recorded in the ingest manifest are skipped, unless --force is used.
+    fingerprints = {path: file_fingerprint(path) for path in paths}
+    if not force:
+        for path, fingerprint in list(fingerprints.items()):
+            if is_loaded(fingerprint, db_path):
+                print(f"Skipping {path}, it has already been uploaded. Use --force to upload it again.")
+                del fingerprints[path]
+    paths = list(fingerprints)
+
+    # A file changed since an upload of it stopped part way through can't be resumed, and uploading it from the start
+    # would add the rows committed from the earlier version a second time, so it is only uploaded again with --force.
+    changed = {path: get_changed_checkpoint(fingerprints[path], db_path) for path in paths}
+    for path in [path for path in paths if changed[path]]:
+        if force:
+            clear_checkpoints(fingerprints[path], db_path)
+        else:
+            print(Fore.RED + f"Skipping {path}, an upload of it stopped after {changed[path]} rows and the file has "
+                             f"changed since, so it can't be resumed. Use --force --upsert to upload it again, "
+                             f"updating the customers already added instead of adding them a second time.")
+            print(Style.RESET_ALL)
+            paths.remove(path)
+
+    # A file with a checkpoint from an upload that stopped part way through is only uploaded again with --resume,
+    # which continues after the rows already committed, or with --force, which starts again from the first row.
+    # Uploading it from the start otherwise would add the committed rows a second time.
+    checkpoints = {path: get_checkpoint(fingerprints[path], db_path) for path in paths}
+    range_checkpoints = {path: get_range_checkpoints(fingerprints[path], db_path) for path in paths}
+    stopped = [path for path in paths if checkpoints[path] or range_checkpoints[path]]
+    for path in stopped:
+        committed = checkpoints[path].row_number if checkpoints[path] else \
+            sum(checkpoint.row_number for checkpoint in range_checkpoints[path])
+        if resume:
+            print(f"Resuming the upload of {path} after {committed} rows.")
+        elif force:
+            clear_checkpoints(fingerprints[path], db_path)
+            checkpoints[path] = None
+            range_checkpoints[path] = []
+        else:
+            print(Fore.RED + f"Skipping {path}, a previous upload of it stopped after {committed} rows. Use --resume "
+                             f"to continue from there, or --force to upload it again from the start.")
+            print(Style.RESET_ALL)
+            paths.remove(path)
+    if resume:
+        # A file stopped by insert_csv_to_db is resumed on its own, the others are uploaded by ingest_files, which
+        # resumes the files with range checkpoints.
+        for path in [path for path in paths if checkpoints[path]]:
+            insert_csv_to_db(path, delimiter, db_path, batch_size=batch_size, upsert=upsert,
+                             fingerprint=fingerprints[path], resume=True, rejects=rejects, concurrent=concurrent)
+            paths.remove(path)
+    skipped = not force and (any(changed.values()) or not resume and bool(stopped))
+
+    if len(paths) == 1 and not range_checkpoints[paths[0]]:
+        insert_csv_to_db(paths[0], delimiter, db_path, batch_size=batch_size, single_transaction=single_transaction,
+                         upsert=upsert, fingerprint=fingerprints[paths[0]], rejects=rejects, concurrent=concurrent)
+        return not skipped
+    elif not paths:
+        return not skipped
+
+    results, seconds = ingest_files(paths, delimiter, db_path, batch_size=batch_size, workers=workers, upsert=upsert,
+                                    rejects=rejects, concurrent=concurrent,
+                                    fingerprints={path: fingerprints[path] for path in paths}, resume=resume)
+    for result in results:
+        if not result.error:
+            record_load(fingerprints[result.path], result.rows, db_path)
+
+    print(format_ingest_report(results, seconds))
+    failed = [result for result in results if result.error]
+    if failed:
+        print(Fore.RED + f"{len(failed)} of {len(results)} files could not be fully uploaded. Please verify the "
+                         f"delimiter is correct for these files.")
+        print(Style.RESET_ALL)
+
+    return not failed and not skipped
+
+
+def format_ingest_report(results, seconds):
+    from tabulate import tabulate
+
+    rows = [[result.path, result.rows, f"{result.seconds:.2f}", _rate(result.rows, result.seconds),
+             result.error or "OK"] for result in results]
+    total_rows = sum(result.rows for result in results)
+    rows.append(["Total", total_rows, f"{seconds:.2f}", _rate(total_rows, seconds), ""])
+    return tabulate(rows, headers=['File', 'Rows', 'Seconds', 'Rows/sec', 'Status'], tablefmt='psql')
+
+
+def _rate(rows, seconds):
+    return int(rows / seconds) if seconds else rows
+
+
+def report_rejects(rejects):
+    if rejects.count:
+        print(Fore.RED + f"{rejects.count:,} rows could not be uploaded. They were written to {rejects.path} with "
+                         f"their line numbers and the reasons.")
+        print(Style.RESET_ALL)
+
+
+"""
+
+validate_files is used by --validate-only. Every row of the files is read and checked the same way as when uploading,
+without opening the database, and a report with the number of rows and rejected rows of every file is printed,
+followed by the first rejected rows. Returns False if any row would be rejected.
+
+"""
+
+
+def validate_files(paths, delimiter, reject_path=None):
+    with RejectFile(reject_path) as rejects:
+        results = [validate_file(path, delimiter, rejects) for path in paths]
+
+    print(format_validation_report(results))
+    if rejects.samples:
+        from tabulate import tabulate
+
+        rows = [[reject.path, reject.line, reject.reason] for reject in rejects.samples]
+        print(f"First {len(rows)} of {rejects.count:,} rejected rows:")
+        print(tabulate(rows, headers=['File', 'Line', 'Reason'], tablefmt='psql'))
+    if rejects.count and reject_path:
+        print(f"Every rejected row was written to {reject_path}.")
+
+    return not rejects.count
+
+
+def format_validation_report(results):
+    from tabulate import tabulate
+
+    rows = [[result.path, result.rows, result.rejected, f"{result.seconds:.2f}", _rate(result.rows, result.seconds)]
+            for result in results]
+    total_rows = sum(result.rows for result in results)
+    total_seconds = sum(result.seconds for result in results)
+    rows.append(["Total", total_rows, sum(result.rejected for result in results), f"{total_seconds:.2f}",
+                 _rate(total_rows, total_seconds)])
+    return tabulate(rows, headers=['File', 'Rows', 'Rejected', 'Seconds', 'Rows/sec'], tablefmt='psql')
+
+
+"""
+
+upload_partitioned is used instead of upload_files when uploading to several databases (several -db paths or 
+--shards). Every file is split between the databases by email with insert_partitioned, see shards.py. A file is 
+skipped when it has already been uploaded to every database.
+
+"""
+
+
+def upload_partitioned(paths, delimiter, db_paths, batch_size=DEFAULT_BATCH_SIZE, upsert=False, force=False,
+                       reject_path=None, concurrent=False):
+    for db_path in db_paths:
+        create_table(db_path)
+        if upsert:
+            removed = ensure_email_key(db_path)
+            if removed:
+                print(f"Removed {removed} duplicate customers from {db_path} so email can be used as the customer "
+                      f"key.")
+
+    rejects = RejectFile(reject_path) if reject_path else None
+    try:
+        for path in paths:
+            fingerprint = file_fingerprint(path)
+            # Every database is checked on its own, so a file that an earlier upload only finished for some of them
+            # is only inserted into the others.
+            shards = [shard for shard, db_path in enumerate(db_paths) if force or not is_loaded(fingerprint, db_path)]
+            if not shards:
+                print(f"Skipping {path}, it has already been uploaded. Use --force to upload it again.")
+                continue
+            counts = insert_partitioned(path, delimiter, db_paths, batch_size=batch_size, upsert=upsert,
+                                        fingerprint=fingerprint, rejects=rejects, concurrent=concurrent, shards=shards)
+            print(f"Uploaded {sum(counts):,} rows from {path}: " +
+                  ", ".join(f"{counts[shard]:,} to {db_paths[shard]}" for shard in shards))
+    finally:
+        if rejects is not None:
+            rejects.close()
+            report_rejects(rejects)
+
+    return True
+
+
+"""
+
+view_entries is used by the -v option to print the customers table one row at a time. When --limit is used and there 
+are more rows to show, a cursor is printed at the end which can be passed to --after to show the next page. The 
+filter options (--vehicle-type, --email, --name, --min-length, --max-length and --search) are read into a Filters 
+by filters_from_args and applied in the SQL query, see filters.py.
+
+The printed table is saved in the render cache (see render_cache.py), and printed from there when the same view is 
+asked for again before anything else is uploaded, unless cache is False (the --no-cache option).
+
+"""
+
+
+def view_entries(sort_order, db_path="customers.db", limit=None, page=None, after=None, filters=None, cache=True):
+    offset = (page - 1) * limit if page and limit else None
+    # Views of several databases (a list of paths) aren't cached.
+    merged = not isinstance(db_path, str)
+    version = get_change_counter(db_path) if cache and not merged else None
+    output = sys.stdout
+    if version is not None:
+        render_cache = RenderCache(db_path)
+        key = cache_key(__version__, sort_order, limit, offset, after, filters)
+        if render_cache.copy(key, version, sys.stdout):
+            STATS.count('render_cache_hits')
+            return
+        STATS.count('render_cache_misses')
+        output = render_cache.writer(key, version, sys.stdout)
+
+    try:
+        rows = read_entries(sort_order, db_path, limit=limit, offset=offset, after=after, filters=filters)
+        # rows is None when a database has no customers table, which iter_entries has already printed.
+        if rows is not None:
+            count, last_row = stream_results(rows, file=output)
+    except BaseException as error:
+        # Nothing is cached for a view that failed or was interrupted.
+        if output is not sys.stdout:
+            output.discard()
+        if not isinstance(error, InvalidCursor):
+            raise
+        print(Fore.RED + f"The cursor passed to --after is not valid for the sort order {sort_order}. Please use the "
+                         f"cursor printed at the end of the previous page with the same sort order.")
+        print(Style.RESET_ALL)
+        return
+
+    if rows is None:
+        if output is not sys.stdout:
+            output.discard()
+        return
+
+    if limit and count == limit:
+        cursor = next_merged_cursor(sort_order, last_row) if merged else next_cursor(sort_order, last_row)
+        print(f"More rows are available. To see the next page, add: --after {cursor}", file=output)
+
+    if output is not sys.stdout:
+        output.commit()
+
+
+def read_entries(sort_order, db_path="customers.db", limit=None, offset=None, after=None, filters=None):
+    """Reads the rows of one database with iter_entries, or of a list of databases with iter_merged_entries. Both
+        return None if a database has no customers table."""
+    if isinstance(db_path, str):
+        return iter_entries(sort_order, db_path, limit=limit, offset=offset, after=after, filters=filters)
+    return iter_merged_entries(sort_order, db_path, limit=limit, offset=offset, after=after, filters=filters)
+
+
+"""
+
+export_entries is used by the --output option to write the customers table as csv, jsonl or the columnar format 
+instead of displaying it. Rows are streamed from read_entries straight into the writers in export.py, to the 
+standard output or to output_path.
+
+"""
+
+
+def export_entries(sort_order, output_format, output_path=None, db_path="customers.db", limit=None, page=None,
+                   after=None, filters=None):
+    offset = (page - 1) * limit if page and limit else None
+    try:
+        rows = read_entries(sort_order, db_path, limit=limit, offset=offset, after=after, filters=filters)
+        # Nothing is exported, not even the header, from a database without a customers table.
+        if rows is not None:
+            write_export(rows, output_format, output_path)
+    except InvalidCursor:
+        print(Fore.RED + f"The cursor passed to --after is not valid for the sort order {sort_order}. Please use the "
+                         f"cursor printed at the end of the previous page with the same sort order.")
+        print(Style.RESET_ALL)
+
+
+def write_export(rows, output_format, output_path=None):
+    binary = output_format == 'columnar'
+    if output_path is None:
+        export_rows(rows, output_format, sys.stdout.buffer if binary else sys.stdout)
+        sys.stdout.flush()
+        return
+
+    file = open(output_path, 'wb') if binary else open(output_path, 'w', encoding='utf-8', newline='')
+    with file:
+        count = export_rows(rows, output_format, file)
+    print(Fore.GREEN + f"Exported {count:,} rows to {output_path}")
+    print(Style.RESET_ALL)
+
+
+"""
+
+view_summary is used by the --summary option to print the summary of every vehicle type. The summary is read from the 
+summary tables maintained by the database as files are uploaded, so it takes the same time no matter how many 
+customers there are. The --rebuild-summary option recomputes those tables from the customers table with 
+check_summary.
+
+"""
+
+SUMMARY_HEADERS = ['Vehicle Type', 'Customers', 'Average Length (in FT.)', 'Shortest (in FT.)', 'Longest (in FT.)',
+                   'Most Common Vehicle Names']
+
+
+def format_summary(summary):
+    from tabulate import tabulate
+
+    rows = [(item.vehicle_type, item.customers, f"{item.average_length:.1f}", item.min_length, item.max_length,
+             ", ".join(item.top_vehicle_names)) for item in summary]
+    with STATS.stage('render'):
+        return tabulate(rows, headers=SUMMARY_HEADERS, tablefmt='psql')
+
+
+def view_summary(db_path="customers.db"):
+    print(format_summary(get_summary(db_path)))
+
+
+def check_summary(db_path="customers.db"):
+    if rebuild_summary(db_path):
+        print(Fore.GREEN + "The vehicle type summary was up to date.")
+    else:
+        print(Fore.RED + "The vehicle type summary was out of date and has been rebuilt.")
+    print(Style.RESET_ALL)
+
+
+def filters_from_args(args):
+    """Returns the Filters given on the command line, or None if no filter option was used."""
+    filters = Filters(args.vehicle_type, args.email, args.name, args.min_length, args.max_length, args.search)
+    return filters if any(value is not None for value in filters) else None
+
+
+"""
+
+upload_stream is used instead of upload_files when reading from stdin (-f -) or following a file (--follow). The 
+records are committed in micro-batches of batch_size rows or flush_interval seconds as they arrive, see stream.py.
+
+"""
+
+
+def upload_stream(path, delimiter, db_path="customers.db", batch_size=DEFAULT_BATCH_SIZE,
+                  flush_interval=DEFAULT_FLUSH_INTERVAL, upsert=False, reject_path=None, concurrent=False):
+    if upsert:
+        removed = ensure_email_key(db_path)
+        if removed:
+            print(f"Removed {removed} duplicate customers so email can be used as the customer key.")
+
+    if path == STDIN:
+        lines = read_lines(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'))
+    else:
+        print(f"Following {path}, press Ctrl-C to stop.")
+        lines = follow_file(path)
+    rejects = RejectFile(reject_path) if reject_path else None
+    try:
+        rows = insert_stream(lines, delimiter, db_path, batch_size=batch_size, flush_interval=flush_interval,
+                             upsert=upsert, name=path, rejects=rejects, concurrent=concurrent)
+    finally:
+        if rejects is not None:
+            rejects.close()
+            report_rejects(rejects)
+    print(f"Uploaded {rows:,} rows from {'stdin' if path == STDIN else path}.")
+    return True
+
+
 """
 
 Invalid Delimiter is a custom exception to be raised when an invalid delimited is specified when running interactively.
@@ -271,20 +658,401 @@ class InvalidDelimiter(Exception):
 """
 
 The parse_delimiter function is referenced when a delimiter is specified either with a 
-command line argument or when running interactively. 
+command line argument or when running interactively. The supported delimiters are defined in reader.py.
 
 """
 
 
 def parse_delimiter(delimiter):
-    if delimiter == "comma":
-        delimiter = ","
-    elif delimiter == "pipe":
-        delimiter = "|"
-    else:
+    if delimiter not in DELIMITERS:
         raise InvalidDelimiter
 
-    return delimiter
+    return DELIMITERS[delimiter]
+
+
+def run(args):
+    """Runs outdoorsy with the parsed command line arguments, collecting stats and a profile when asked to. With
+        --server the requests are sent to the server instead, see run_with_server.
+
+        Returns:
+            False if the files given to -f could not be uploaded, or the database could not be opened, so that main
+            exits with a status of 1. True otherwise.
+
+        """
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        STATS.enable(hook=profile_hook(profiler))
+    elif args.stats or args.stats_json:
+        STATS.enable()
+
+    try:
+        if args.server:
+            return run_with_server(args)
+        return run_with_args(args)
+    except UnsupportedSchema as error:
+        print(Fore.RED + f"Error: Could not open the database, {error}")
+        print(Style.RESET_ALL)
+        return False
+    finally:
+        if args.stats:
+            print(STATS.summary(), file=sys.stderr)
+        if args.stats_json:
+            STATS.write_json(args.stats_json)
+        if profiler:
+            profiler.dump_stats(args.profile)
+        STATS.disable()
+
+
+def run_with_args(args):
+    # With several -db directories or --shards, uploads and views use every database, see shards.py.
+    databases = database_directories(args)
+    dbpath = args.dbpath[0] if args.dbpath and not databases else None
+    # -f - reads the records from stdin and --follow tails a file, both committing micro-batches as records arrive.
+    streaming = args.file and (args.follow or STDIN in args.file)
+    # Set to False when the files given to -f are missing or could not all be uploaded, see run.
+    uploaded = True
+
+    if args.validate_only and not args.file:
+        print(Fore.RED + "Please specify the files to validate with -f. For example: outdoorsy -f customers.csv"
+                         " --validate-only")
+        print(Style.RESET_ALL)
+
+    elif args.validate_only:
+        validate_with_args(args)
+
+    elif streaming:
+        uploaded = upload_streaming(args, databases, dbpath)
+
+    elif args.file and databases:
+        uploaded = upload_to_databases(args, databases)
+
+    elif args.file and not dbpath:
+        # check the files specified in the -f argument exist first, if not throw an error.
+        input_paths, missing_paths = expand_paths(args.file)
+        if input_paths and not missing_paths:
+            create_table()
+            # The delimiter of every file is detected when -d isn't specified.
+            delimiter = parse_delimiter(args.delimiter) if args.delimiter else None
+            uploaded = run_upload(args, upload_files, input_paths, delimiter, batch_size=args.batch_size,
+                                  single_transaction=args.single_transaction, workers=args.workers,
+                                  upsert=args.upsert, force=args.force, resume=args.resume,
+                                  reject_path=args.reject_file, concurrent=args.concurrent)
+            if uploaded:
+                print(Fore.GREEN + f"File uploaded successfully ")
+                print(Style.RESET_ALL)
+
+        else:
+            print(Fore.RED + f"Error: Could not find file at path:\n {', '.join(missing_paths)}."
+                             f"\n Please verify the file exists and try again.")
+            print(Style.RESET_ALL)
+            uploaded = False
+
+    if args.delimiter and not args.file:
+        print(Fore.RED + "Please specify both a file and delimiter. For example: outdoorsy -f comma.csv -d comma")
+        print(Style.RESET_ALL)
+
+    if args.file and dbpath and not streaming and not args.validate_only:
+        # check if the file specified in the -f argument exists first, if not throw an error.
+        input_paths, missing_paths = expand_paths(args.file)
+        file_exists = input_paths and not missing_paths
+        db_path_file_exists = exists(dbpath)
+
+        if file_exists and db_path_file_exists:
+            delimiter = parse_delimiter(args.delimiter) if args.delimiter else None
+            db_file = os.path.join(dbpath, "customers.db")
+            create_table(db_file)
+            uploaded = run_upload(args, upload_files, input_paths, delimiter, db_file, batch_size=args.batch_size,
+                                  single_transaction=args.single_transaction, workers=args.workers,
+                                  upsert=args.upsert, force=args.force, resume=args.resume,
+                                  reject_path=args.reject_file, concurrent=args.concurrent)
+            if uploaded:
+                print(Fore.GREEN + f"File uploaded successfully to Database at path: {dbpath}. \n"
+                                   f"Note: this database path will need to be specified everytime you would like to"
+                                   f" view the results. Otherwise, outdoorsy defaults to the current"
+                                   f" path which is {os.getcwd()} .")
+                print(Style.RESET_ALL)
+        else:
+            print(Fore.RED + f"Error: Could either \n1. Not find the comma or pipe delimited file at the path specified"
+                             f"\nor \n2. Not find the path specified to create the database.\n"
+                             f" Please verify the file exists at {dbpath}"
+                             f" and the path to create the database exists at {dbpath} "
+                             f"  and try again.")
+            print(Style.RESET_ALL)
+            uploaded = False
+
+    if args.sort and not args.view:
+        print(Fore.RED + "Please specify both a view and sort argument. For example: outdoorsy -v -s vehicle_type")
+        print(Style.RESET_ALL)
+
+    filters = filters_from_args(args)
+    if filters and not args.view:
+        print(Fore.RED + "Please specify a view argument with the filters. For example: outdoorsy -v --vehicle-type"
+                         " campervan")
+        print(Style.RESET_ALL)
+
+    if args.output and not args.view:
+        print(Fore.RED + "Please specify a view argument with the output format. For example: outdoorsy -v --output csv")
+        print(Style.RESET_ALL)
+
+    if args.output_path and not args.output:
+        print(Fore.RED + "Please specify the output format with the output path. For example: outdoorsy -v --output"
+                         " csv --output-path customers.csv")
+        print(Style.RESET_ALL)
+
+    if (args.rebuild_summary or args.summary) and databases:
+        print(Fore.RED + "The summary can only be viewed for one database at a time. Please specify a single -db "
+                         "path.")
+        print(Style.RESET_ALL)
+
+    elif args.rebuild_summary or args.summary:
+        summary_db_path = os.path.join(dbpath, "customers.db") if dbpath else "customers.db"
+        if dbpath and not exists(dbpath):
+            print(Fore.RED + f"The path specified for the database path does not exist."
+                             f" Please try again. path: {dbpath}")
+            print(Style.RESET_ALL)
+        else:
+            create_table(summary_db_path)
+            if args.rebuild_summary:
+                check_summary(summary_db_path)
+            if args.summary:
+                view_summary(summary_db_path)
+
+    if args.page and not args.limit:
+        print(Fore.RED + "Please specify the number of rows per page with --limit. For example: outdoorsy -v --limit 100"
+                         " --page 2")
+        print(Style.RESET_ALL)
+
+    elif args.view and databases:
+        missing = [directory for directory in databases if not exists(directory)]
+        if missing:
+            print(Fore.RED + f"The path specified for the database path does not exist."
+                             f" Please try again. path: {', '.join(missing)}")
+            print(Style.RESET_ALL)
+        else:
+            db_files = [os.path.join(directory, "customers.db") for directory in databases]
+            for db_file in db_files:
+                create_table(db_file)
+            show_entries(args, filters, db_files)
+
+    elif args.view and not dbpath:
+        # Databases created by an older outdoorsy are upgraded before they are read, the same as with -db.
+        create_table()
+        show_entries(args, filters)
+
+    elif args.view and dbpath:
+        if exists(dbpath):
+            db_file = os.path.join(dbpath, "customers.db")
+            create_table(db_file)
+            show_entries(args, filters, db_file)
+        else:
+            print(Fore.RED + f"The path specified for the database path does not exist."
+                             f" Please try again. path: {dbpath}")
+            print(Style.RESET_ALL)
+
+    return uploaded
+
+
+def database_directories(args):
+    """Returns the database directories given by several -db paths or --shards, or None for a single database."""
+    if args.shards:
+        return shard_directories(args.dbpath[0] if args.dbpath else os.getcwd(), args.shards)
+    if args.dbpath and len(args.dbpath) > 1:
+        return args.dbpath
+    return None
+
+
+def upload_to_databases(args, databases):
+    input_paths, missing_paths = expand_paths(args.file)
+    if missing_paths:
+        print(Fore.RED + f"Error: Could not find file at path:\n {', '.join(missing_paths)}."
+                         f"\n Please verify the file exists and try again.")
+        print(Style.RESET_ALL)
+        return False
+
+    # The shard directories are created by the first upload, any other -db directories must already exist.
+    if args.shards:
+        for directory in databases:
+            os.makedirs(directory, exist_ok=True)
+    missing = [directory for directory in databases if not exists(directory)]
+    if missing:
+        print(Fore.RED + f"The path specified for the database path does not exist."
+                         f" Please try again. path: {', '.join(missing)}")
+        print(Style.RESET_ALL)
+        return False
+
+    db_files = [os.path.join(directory, "customers.db") for directory in databases]
+    delimiter = parse_delimiter(args.delimiter) if args.delimiter else None
+    uploaded = run_upload(args, upload_partitioned, input_paths, delimiter, db_files, batch_size=args.batch_size,
+                          upsert=args.upsert, force=args.force, reject_path=args.reject_file,
+                          concurrent=args.concurrent)
+    if uploaded:
+        print(Fore.GREEN + f"File uploaded successfully to {len(db_files)} databases. Note: the same -db paths"
+                           f"{' and --shards' if args.shards else ''} will need to be specified to view the "
+                           f"results.")
+        print(Style.RESET_ALL)
+    return uploaded
+
+
+def run_upload(args, upload, *upload_args, **options):
+    """Runs upload (upload_files, upload_partitioned or upload_stream) for the files given to -f, printing the error
+        when the upload stops because of the delimiter or a vehicle length.
+
+        Returns:
+            What upload returned, or False if it stopped with an error.
+
+        """
+    try:
+        return upload(*upload_args, **options)
+    except TypeError:
+        print(Fore.RED + f"Error: TypeError - Please verify {args.delimiter or 'the detected delimiter'} is the"
+                         f" correct delimiter for this file type, or use --reject-file to upload the other rows.")
+    except DelimiterNotDetected as error:
+        print(Fore.RED + f"Error: Could not detect the delimiter of {error}. Please specify it with -d.")
+    except InvalidLength as error:
+        print(Fore.RED + f"Error: {error}. Please verify the vehicle length column of the file, or use --reject-file"
+                         f" to upload the other rows.")
+    print(Style.RESET_ALL)
+    return False
+
+
+def validate_with_args(args):
+    input_paths, missing_paths = expand_paths(args.file)
+    if missing_paths:
+        print(Fore.RED + f"Error: Could not find file at path:\n {', '.join(missing_paths)}."
+                         f"\n Please verify the file exists and try again.")
+        print(Style.RESET_ALL)
+        return
+
+    delimiter = parse_delimiter(args.delimiter) if args.delimiter else None
+    try:
+        if validate_files(input_paths, delimiter, args.reject_file):
+            print(Fore.GREEN + "Every row of the files can be uploaded.")
+            print(Style.RESET_ALL)
+    except DelimiterNotDetected as error:
+        print(Fore.RED + f"Error: Could not detect the delimiter of {error}. Please specify it with -d.")
+        print(Style.RESET_ALL)
+
+
+def upload_streaming(args, databases, dbpath):
+    if len(args.file) > 1:
+        print(Fore.RED + "Error: Only one file can be followed or read from stdin at a time. For example: outdoorsy "
+                         "-f customers.csv --follow")
+        print(Style.RESET_ALL)
+        return False
+    if databases:
+        print(Fore.RED + "Error: Reading from stdin and --follow can only upload to one database. Please specify a "
+                         "single -db path.")
+        print(Style.RESET_ALL)
+        return False
+    if dbpath and not exists(dbpath):
+        print(Fore.RED + f"The path specified for the database path does not exist."
+                         f" Please try again. path: {dbpath}")
+        print(Style.RESET_ALL)
+        return False
+
+    db_file = os.path.join(dbpath, "customers.db") if dbpath else "customers.db"
+    create_table(db_file)
+    delimiter = parse_delimiter(args.delimiter) if args.delimiter else None
+    uploaded = run_upload(args, upload_stream, args.file[0], delimiter, db_file, batch_size=args.batch_size,
+                          flush_interval=args.flush_interval, upsert=args.upsert, reject_path=args.reject_file,
+                          concurrent=args.concurrent)
+    if uploaded:
+        print(Fore.GREEN + f"File uploaded successfully ")
+        print(Style.RESET_ALL)
+    return uploaded
+
+
+def show_entries(args, filters, db_path="customers.db"):
+    # -v either displays the table or, with --output, exports it.
+    if args.output:
+        export_entries(args.sort or 'name', args.output, args.output_path, db_path, limit=args.limit, page=args.page,
+                       after=args.after, filters=filters)
+    else:
+        view_entries(args.sort or 'name', db_path, limit=args.limit, page=args.page, after=args.after,
+                     filters=filters, cache=not args.no_cache)
+
+
+"""
+
+run_with_server is used instead of run_with_args when --server is given. Views (with their filters), summaries and 
+uploads are sent to a server started with outdoorsy serve, and the results are displayed the same way as without a 
+server. Uploads are queued on the server, and their progress can be followed with --job.
+
+"""
+
+
+def run_with_server(args):
+    uploaded = True
+    try:
+        with Client(args.server) as client:
+            if args.status:
+                print(json.dumps(client.request('status'), indent=2))
+
+            if args.job:
+                job = client.request('job', id=args.job)['job']
+                print(f"Job {job['id']} is {job['state']}: {', '.join(job['paths'])}")
+                if job['output']:
+                    print(job['output'])
+
+            if args.file:
+                input_paths, missing_paths = expand_paths(args.file)
+                if missing_paths:
+                    print(Fore.RED + f"Error: Could not find file at path:\n {', '.join(missing_paths)}."
+                                     f"\n Please verify the file exists and try again.")
+                    print(Style.RESET_ALL)
+                    uploaded = False
+                else:
+                    # The server may have a different working directory, so it is sent absolute paths.
+                    job_id = client.request('ingest', paths=[os.path.abspath(path) for path in input_paths],
+                                            delimiter=args.delimiter, batch_size=args.batch_size,
+                                            upsert=args.upsert, force=args.force)['job']
+                    print(Fore.GREEN + f"Upload queued as job {job_id}. To follow it, run: outdoorsy --server "
+                                       f"{args.server} --job {job_id}")
+                    print(Style.RESET_ALL)
+
+            if args.summary:
+                summary = client.request('summary')['rows']
+                print(format_summary([Summary(*item) for item in summary]))
+
+            if args.view:
+                filters = filters_from_args(args)
+                request = {'sort': args.sort or 'name', 'limit': args.limit, 'page': args.page, 'after': args.after,
+                           'filters': filters._asdict() if filters else None}
+                if args.limit:
+                    response = client.request('view', **request)
+                    rows, cursor = response['rows'], response['cursor']
+                else:
+                    # The server returns a page at a time, so a view without --limit reads every page in turn.
+                    rows, cursor = _server_pages(client, request), None
+                if args.output:
+                    write_export(rows, args.output, args.output_path)
+                else:
+                    stream_results(rows)
+                    if cursor:
+                        print(f"More rows are available. To see the next page, add: --after {cursor}")
+
+    except ServerError as error:
+        print(Fore.RED + f"Error: The server could not answer the request. {error}")
+        print(Style.RESET_ALL)
+        # An upload that could not be queued failed, the same as one that could not be uploaded without --server.
+        return not args.file
+    except OSError as error:
+        print(Fore.RED + f"Error: Could not connect to the server at {args.server}. Please check it was started with "
+                         f"outdoorsy serve. {error}")
+        print(Style.RESET_ALL)
+        return not args.file
+    return uploaded
+
+
+def _server_pages(client, request):
+    while True:
+        response = client.request('view', **request)
+        yield from response['rows']
+        if not response['cursor']:
+            return
+        request = {**request, 'after': response['cursor']}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,406 @@
+"""
+
+cli.py contains the command line arguments of outdoorsy. It is kept separate from app.py and only imports
+lightweight modules, so that outdoorsy --version and outdoorsy -h don't load the database, file parsing or table
+formatting code.
+
+"""
+
+import argparse
+from .__about__ import __version__
+from .export import EXPORT_FORMATS
+from .reader import DELIMITERS, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+from .sorting import SORT_ORDERS
+
+DESCRIPTION = """
+***Outdoorsy***
+Command Line tool for displaying Outdoorsy user information from a local database.
+
+***Features***
+-Use as command-line tool interactively or by passing arguments
+-Creates a local SQL Lite Database for storing files
+-View database in a table format from the command-line
+-Sort by "Name", "Vehicle Type", "Email" or "Vehicle Length" columns in either direction
+
+Please see examples at the end of this help page or visit the project's github for more information.
+https://github.com/rachaelcrook/outdoorsy"""
+
+EPILOG = """
+                                     
+***Examples***
+
+Run in interactive mode:
+outdoorsy
+                                     
+Upload CSV file to database:
+outdoorsy -f C:\\folder\\file.csv -d comma
+
+Upload Pipe delimited file to database:
+outdoorsy -f C:\\folder\\pipes.text -d pipe
+
+Upload a file, detecting its delimiter:
+outdoorsy -f C:\\folder\\file.txt
+
+Upload every file in a folder and all csv files in another folder in parallel:
+outdoorsy -f C:\\exports\\daily C:\\archive\\*.csv -d comma
+
+Upload files compressed with gzip, bz2 or xz, decompressing them while they are read:
+outdoorsy -f C:\\exports\\*.csv.gz -d comma
+
+Upload a file again, updating customers that already exist by email:
+outdoorsy -f C:\\folder\\file.csv -d comma --upsert --force
+
+Run two uploads to the same database at the same time:
+outdoorsy -f C:\\exports\\east.csv -d comma --concurrent
+outdoorsy -f C:\\exports\\west.csv -d comma --concurrent
+
+Check a file before uploading it, then upload it writing the rows that can't be uploaded to rejects.csv:
+outdoorsy -f C:\\folder\\export.csv --validate-only
+outdoorsy -f C:\\folder\\export.csv --reject-file rejects.csv
+
+Upload the records written to stdin by another program, committing them at least every 5 seconds:
+export_customers | outdoorsy -f - -d comma --flush-interval 5
+
+Keep uploading the records appended to a log file, following it when it is rotated:
+outdoorsy -f /var/log/customers.csv -d comma --follow --upsert
+
+View data that has previously been uploaded to the database:
+outdoorsy -v
+
+View data sorted by Vehicle Type:
+outdoorsy -v -s vehicle_type
+
+View data sorted by name:
+outdoorsy -v -s name
+
+View data sorted by the longest vehicles first:
+outdoorsy -v -s vehicle_length_desc
+
+View the first 100 rows sorted by Vehicle Type, then the rows after the cursor printed at the end of the page:
+outdoorsy -v -s vehicle_type --limit 100
+outdoorsy -v -s vehicle_type --limit 100 --after CURSOR
+
+View the campervans between 20 and 30 feet long:
+outdoorsy -v --vehicle-type campervan --min-length 20 --max-length 30
+
+Find a customer by email, or search names and vehicle names:
+outdoorsy -v --email jane@example.com
+outdoorsy -v --search airstream
+
+Export the campervans sorted by vehicle length to a csv file:
+outdoorsy -v --vehicle-type campervan -s vehicle_length --output csv --output-path campervans.csv
+
+View the customers of two databases together, sorted by email:
+outdoorsy -v -s email -db C:\\east C:\\west
+
+Upload a file split between 4 databases by email, then view them:
+outdoorsy -f C:\\folder\\file.csv -db C:\\database --shards 4
+outdoorsy -v -db C:\\database --shards 4
+
+View the number of customers and vehicle lengths for every vehicle type:
+outdoorsy --summary
+
+Start a server keeping the database open, then send it views and uploads:
+outdoorsy serve --port 8765
+outdoorsy --server 8765 -v -s vehicle_type --limit 100
+outdoorsy --server 8765 -f C:\\folder\\file.csv """
+
+SERVE_DESCRIPTION = """
+Start a server that keeps the customers database open and recent views cached, and answers requests from
+outdoorsy --server. The server listens on a Unix socket or a localhost port, by default port {port}."""
+
+DEFAULT_PORT = 8765
+
+
+def create_parser():
+    """Creates the Argument Parser Object and
+        adds all the required arguments to it.
+
+        Returns:
+            Parser
+
+        """
+    # create a parser object
+    parser = argparse.ArgumentParser(prog="outdoorsy",
+                                     add_help=True,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description=DESCRIPTION,
+                                     epilog=EPILOG)
+
+    # Defining arguments
+    file_group = parser.add_argument_group(title="options - Upload a new file.")
+    file_group.add_argument("-f", "--file",
+                            nargs='+',
+                            required=False,
+                            help="Full path to file. Several files, directories and glob patterns such as "
+                                 "/exports/*.csv can be given to upload them all in parallel. Use - to read the "
+                                 "records from stdin")
+
+    file_group.add_argument("-d", "--delimiter",
+                            choices=list(DELIMITERS),
+                            required=False,
+                            help="File's delimiter. Detected from the start of the file when not specified")
+
+    file_group.add_argument("-db", "--dbpath",
+                            nargs='+',
+                            required=False,
+                            help="Directory to create database. Defaults to current directory. With several "
+                                 "directories, uploads are split between their databases by email and views "
+                                 "combine the rows of every database")
+
+    file_group.add_argument("--shards",
+                            type=positive_int,
+                            required=False,
+                            help="Split the database into this many databases, in the shard-00, shard-01... "
+                                 "directories of the -db directory. Must be given when uploading and viewing")
+
+    file_group.add_argument("--batch-size",
+                            type=positive_int,
+                            default=DEFAULT_BATCH_SIZE,
+                            required=False,
+                            help=f"Number of rows inserted and committed together. Defaults to {DEFAULT_BATCH_SIZE}")
+
+    file_group.add_argument("--single-transaction",
+                            required=False, action='store_true',
+                            help="Load the whole file in one transaction instead of committing every batch.")
+
+    file_group.add_argument("--workers",
+                            type=positive_int,
+                            required=False,
+                            help="Number of processes used to parse files when uploading several files. "
+                                 "Defaults to the number of CPUs")
+
+    file_group.add_argument("--upsert",
+                            required=False, action='store_true',
+                            help="Update customers that already exist (matched by email) instead of adding them again.")
+
+    file_group.add_argument("--force",
+                            required=False, action='store_true',
+                            help="Upload files again even if they have already been uploaded, or from the start if "
+                                 "their upload stopped part way through.")
+
+    file_group.add_argument("--resume",
+                            required=False, action='store_true',
+                            help="Continue an upload that stopped part way through from its last committed batch.")
+
+    file_group.add_argument("--follow",
+                            required=False, action='store_true',
+                            help="Keep uploading the records added to the file as it grows, like tail -F, until "
+                                 "interrupted with Ctrl-C. Follows the file across log rotation")
+
+    file_group.add_argument("--flush-interval",
+                            type=positive_float,
+                            default=DEFAULT_FLUSH_INTERVAL,
+                            required=False,
+                            help="When reading from stdin or following a file, the number of seconds after which the "
+                                 "records read are committed even if there are fewer than --batch-size. "
+                                 f"Defaults to {DEFAULT_FLUSH_INTERVAL}")
+
+    file_group.add_argument("--concurrent",
+                            required=False, action='store_true',
+                            help="Let other uploads using --concurrent write to the same database at the same time, "
+                                 "waiting in turn for every batch instead of failing with \"database is locked\"")
+
+    file_group.add_argument("--reject-file",
+                            metavar='PATH',
+                            required=False,
+                            help="Write the rows that can't be uploaded to this csv file, with their line number and "
+                                 "the reason, and keep uploading the other rows instead of stopping")
+
+    file_group.add_argument("--validate-only",
+                            required=False, action='store_true',
+                            help="Check every row of the files without uploading them, reporting the rows that "
+                                 "couldn't be uploaded. Use with --reject-file to write all of them to a file")
+
+    view_group = parser.add_argument_group(title="options - View and Sort data")
+
+    view_group.add_argument("-v", "--view",
+                            required=False, action='store_true',
+                            help="View the Outdoorsy Customer Table.")
+
+    view_group.add_argument("-s", "--sort",
+                            choices=SORT_ORDERS,
+                            required=False,
+                            help="Sort the database table by the Outdoorsy Customer's Fullname, Vehicle Type, Email or "
+                                 "Vehicle Length. Add _desc to sort in descending order, for example: email_desc")
+
+    view_group.add_argument("--limit",
+                            type=positive_int,
+                            required=False,
+                            help="Maximum number of rows to display.")
+
+    page_group = view_group.add_mutually_exclusive_group()
+    page_group.add_argument("--page",
+                            type=positive_int,
+                            required=False,
+                            help="Page number to display, with --limit rows per page.")
+
+    page_group.add_argument("--after",
+                            required=False,
+                            help="Display the rows after the cursor printed at the end of the previous page.")
+
+    view_group.add_argument("--no-cache",
+                            required=False, action='store_true',
+                            help="Read and display the rows again instead of using the table saved by an earlier "
+                                 "view.")
+
+    view_group.add_argument("--output",
+                            choices=EXPORT_FORMATS,
+                            required=False,
+                            help="Export the customers table as csv, jsonl or columnar instead of displaying it, to "
+                                 "the standard output or the file given with --output-path.")
+
+    view_group.add_argument("--output-path",
+                            metavar="PATH",
+                            required=False,
+                            help="File to write the export to.")
+
+    summary_group = parser.add_argument_group(title="options - Vehicle type summary")
+
+    summary_group.add_argument("--summary",
+                               required=False, action='store_true',
+                               help="View the number of customers, the average, shortest and longest vehicle and the "
+                                    "most common vehicle names for every vehicle type.")
+
+    summary_group.add_argument("--rebuild-summary",
+                               required=False, action='store_true',
+                               help="Recompute the vehicle type summary from the customers table and report whether "
+                                    "it was up to date.")
+
+    filter_group = parser.add_argument_group(title="options - Filter data, used with -v")
+
+    filter_group.add_argument("--vehicle-type",
+                              required=False,
+                              help="Only show customers with this vehicle type, for example: campervan")
+
+    filter_group.add_argument("--email",
+                              required=False,
+                              help="Only show the customer with this email address.")
+
+    filter_group.add_argument("--name",
+                              required=False,
+                              help="Only show customers with this first or last name, or this full name when both are "
+                                   "given, for example: \"Jane Doe\"")
+
+    filter_group.add_argument("--min-length",
+                              type=int,
+                              required=False,
+                              help="Only show vehicles at least this many feet long.")
+
+    filter_group.add_argument("--max-length",
+                              type=int,
+                              required=False,
+                              help="Only show vehicles at most this many feet long.")
+
+    filter_group.add_argument("--search",
+                              required=False,
+                              help="Only show customers with every word in their first name, last name or vehicle "
+                                   "name. Parts of words are matched, for example: stream finds Airstream")
+
+    server_group = parser.add_argument_group(title="options - Use a server started with outdoorsy serve")
+
+    server_group.add_argument("--server",
+                              metavar="ADDRESS",
+                              required=False,
+                              help="Send views, summaries and uploads to the server at ADDRESS, a Unix socket path, a"
+                                   " port on localhost or host:port, instead of opening the database.")
+
+    server_group.add_argument("--status",
+                              required=False, action='store_true',
+                              help="Show the status of the server.")
+
+    server_group.add_argument("--job",
+                              type=positive_int,
+                              required=False,
+                              help="Show the state and output of an upload queued on the server.")
+
+    stats_group = parser.add_argument_group(title="options - Performance statistics")
+
+    stats_group.add_argument("--stats",
+                             required=False, action='store_true',
+                             help="Print the time taken by every stage, row counts and peak memory when finished.")
+
+    stats_group.add_argument("--stats-json",
+                             metavar="PATH",
+                             required=False,
+                             help="Write the statistics as JSON to PATH, or to the standard output if PATH is -")
+
+    stats_group.add_argument("--profile",
+                             metavar="PATH",
+                             required=False,
+                             help="Run cProfile during every stage and save the profile to PATH.")
+
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+
+    return parser
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+
+def positive_float(value):
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be a positive number, got {value}")
+    return number
+
+
+def parse_args(args):
+    # Creating the parser and parsing the arguments
+    parser = create_parser()
+    parsed_args = parser.parse_args(args)
+
+    # Uploads to several databases are split between them by upload_partitioned (see shards.py), which has no
+    # checkpoints, single transaction or worker processes, so those options are refused rather than ignored.
+    if parsed_args.shards or (parsed_args.dbpath and len(parsed_args.dbpath) > 1):
+        unsupported = [option for option, value in (('--resume', parsed_args.resume),
+                                                    ('--single-transaction', parsed_args.single_transaction),
+                                                    ('--workers', parsed_args.workers)) if value]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} can't be used with --shards or several -db directories")
+    return parsed_args
+
+
+def create_serve_parser():
+    parser = argparse.ArgumentParser(prog="outdoorsy serve",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description=SERVE_DESCRIPTION.format(port=DEFAULT_PORT))
+
+    parser.add_argument("-db", "--dbpath",
+                        required=False,
+                        help="Directory of the database. Defaults to current directory")
+
+    address_group = parser.add_mutually_exclusive_group()
+    address_group.add_argument("--socket",
+                               metavar="PATH",
+                               required=False,
+                               help="Listen on a Unix socket at PATH.")
+
+    address_group.add_argument("--port",
+                               type=positive_int,
+                               required=False,
+                               help=f"Listen on this TCP port. Defaults to {DEFAULT_PORT}")
+
+    parser.add_argument("--host",
+                        default="127.0.0.1",
+                        required=False,
+                        help="Address to listen on with --port. Defaults to 127.0.0.1. Addresses other than "
+                             "localhost need --allow-remote")
+
+    parser.add_argument("--allow-remote",
+                        required=False, action='store_true',
+                        help="Allow --host to be an address other machines can reach. The server has no "
+                             "authentication, only use this on a trusted network")
+
+    return parser
+
+
+def parse_serve_args(args):
+    parsed_args = create_serve_parser().parse_args(args)
+    if not parsed_args.socket and not parsed_args.port:
+        parsed_args.port = DEFAULT_PORT
+    return parsed_args
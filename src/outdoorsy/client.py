@@ -0,0 +1,63 @@
+"""
+
+client.py contains the client used by the --server option to send requests to a server started with outdoorsy serve,
+see server.py for the requests it answers.
+
+A server address is either the path of a Unix socket, a port on localhost, or host:port.
+
+"""
+
+import json
+import socket
+
+# Seconds to wait for the server to answer a request.
+TIMEOUT = 60
+
+
+class ServerError(Exception):
+    pass
+
+
+def parse_address(address):
+    """Returns the socket family and address of a server address such as /tmp/outdoorsy.sock, 8765 or
+        localhost:8765."""
+    host, separator, port = address.rpartition(':')
+    if address.isdigit():
+        return socket.AF_INET, ('127.0.0.1', int(address))
+    if separator and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+class Client:
+    def __init__(self, address, timeout=TIMEOUT):
+        family, self.address = parse_address(address)
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(self.address)
+        self.file = self.socket.makefile('rb')
+
+    def request(self, command, **parameters):
+        """Sends a request and waits for its response.
+
+            Raises ServerError if the server couldn't answer the request.
+
+            """
+        self.socket.sendall(json.dumps({'command': command, **parameters}).encode('utf-8') + b"\n")
+        line = self.file.readline()
+        if not line:
+            raise ServerError("the server closed the connection")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise ServerError(response.get('error'))
+        return response
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,21 +1,257 @@
-import csv
-import re
+import atexit
+import hashlib
+import os
 import sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
 from colorama import Fore, Style
+from .lengths import normalize_lengths, parse_length, InvalidLength
+from .reader import iter_records, sniff_delimiter, DEFAULT_BATCH_SIZE
+from .results import ResultSet
+from .stats import STATS
+from .filters import where_conditions
+from .locking import WriteLock, begin_immediate
+from .migrations import Migration, migrate, table_exists
+from .sorting import order_by_clause, cursor_columns, keyset_condition, encode_cursor, decode_cursor
 
 """
 database.py contains the logic and functions to create a SQL Lite database (if it doesn't already exist) or connect
 to the existing database. It is used by app.py when a new file is added or when the view option is selected.
 
+All functions get their connection from get_connection, which keeps one open connection per database path for the
+life of the process (or interactive session) so the page cache stays warm between operations. The connections are
+closed by close_connections, which is registered to run when the program exits.
+
 """
 
+FIELD_NAMES = ['first_name', 'last_name', 'email', 'vehicle_type', 'vehicle_name', 'vehicle_length']
+
+# Rows are inserted with their vehicle type as text, which is looked up in vehicle_types. insert_rows adds the vehicle
+# types of the rows to vehicle_types first.
+INSERT_SQL = """INSERT INTO 'customers'
+    VALUES (?, ?, ?, (SELECT id FROM vehicle_types WHERE key = lower(?)), ?, ?);"""
+
+# Used instead of INSERT_SQL with --upsert. A customer already in the table with the same email is updated instead of
+# inserted again, and only when one of its values changed.
+UPSERT_SQL = """INSERT INTO 'customers'
+    VALUES (?, ?, ?, (SELECT id FROM vehicle_types WHERE key = lower(?)), ?, ?)
+    ON CONFLICT (email) DO UPDATE SET
+        first_name = excluded.first_name, last_name = excluded.last_name,
+        vehicle_type_id = excluded.vehicle_type_id, vehicle_name = excluded.vehicle_name,
+        vehicle_length = excluded.vehicle_length
+    WHERE (first_name, last_name, vehicle_type_id, vehicle_name, vehicle_length) IS NOT
+        (excluded.first_name, excluded.last_name, excluded.vehicle_type_id, excluded.vehicle_name,
+         excluded.vehicle_length);"""
+
+# Adds a vehicle type to vehicle_types, keeping the spelling it was first uploaded with.
+VEHICLE_TYPE_SQL = "INSERT INTO vehicle_types (key, name) VALUES (lower(?1), ?1) ON CONFLICT (key) DO NOTHING;"
+
+EMAIL_KEY_INDEX = 'idx_customers_email_key'
+
+# Number of seconds a connection waits for another connection's write lock before failing with "database is locked".
+BUSY_TIMEOUT = 30.0
+
+# PRAGMAs applied once when get_connection opens a connection.
+CONNECTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'cache_size': -65536,  # 64 MB, a negative value is in KiB
+    'mmap_size': 268435456,  # 256 MB
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
+# PRAGMAs applied for the duration of a load. In WAL mode synchronous=NORMAL avoids an fsync on every commit.
+LOAD_PRAGMAS = {
+    'synchronous': 'NORMAL',
+}
+
+# Indexes backing every sort order in sorting.SORT_KEYS, so views are served by an index scan instead of a sort, and
+# every filter in filters.py, so filtered views are served by an index lookup.
+INDEXES = {
+    'idx_customers_name': '(first_name, last_name)',
+    'idx_customers_last_name': '(last_name, first_name)',
+    'idx_customers_vehicle_type': '(vehicle_type_id, first_name, last_name)',
+    'idx_customers_email': '(email)',
+    'idx_customers_vehicle_length': '(vehicle_length, first_name, last_name)',
+}
+
+# The full-text table used by the search filter, an external content table indexing the customers table. The
+# tokenizers are tried in order, trigram needs SQLite 3.34 or later.
+SEARCH_TABLE = 'customers_fts'
+SEARCH_TOKENIZERS = ['trigram', 'unicode61']
+SEARCH_TABLE_SQL = f"""CREATE VIRTUAL TABLE "{SEARCH_TABLE}" USING fts5(
+    first_name, last_name, vehicle_name, content='customers', content_rowid='rowid', tokenize='{{tokenizer}}');"""
+
+# While a load's transaction holds a row in this table, the insert trigger below is skipped and insert_rows indexes
+# every batch with one INSERT ... SELECT instead, which is several times faster than indexing the rows one at a time.
+# The row is deleted before the transaction commits, so other connections never see it.
+SEARCH_DEFERRED_TABLE = 'customers_fts_deferred'
+
+# Triggers keeping customers_fts in sync with every insert, update and delete of the customers table.
+SEARCH_TRIGGERS = {
+    'customers_fts_insert': f"""AFTER INSERT ON customers WHEN NOT EXISTS (SELECT 1 FROM {SEARCH_DEFERRED_TABLE})
+    BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, first_name, last_name, vehicle_name)
+            VALUES (new.rowid, new.first_name, new.last_name, new.vehicle_name);
+    END""",
+    'customers_fts_delete': f"""AFTER DELETE ON customers BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, first_name, last_name, vehicle_name)
+            VALUES ('delete', old.rowid, old.first_name, old.last_name, old.vehicle_name);
+    END""",
+    'customers_fts_update': f"""AFTER UPDATE OF first_name, last_name, vehicle_name ON customers BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, first_name, last_name, vehicle_name)
+            VALUES ('delete', old.rowid, old.first_name, old.last_name, old.vehicle_name);
+        INSERT INTO {SEARCH_TABLE} (rowid, first_name, last_name, vehicle_name)
+            VALUES (new.rowid, new.first_name, new.last_name, new.vehicle_name);
+    END""",
+}
+
+# The summary tables hold the number of customers and vehicle lengths of every vehicle type, and the number of
+# customers with every vehicle name, so get_summary doesn't have to read the customers table. They are keyed by
+# vehicle_type_id, so vehicle types are grouped case insensitively, the same as the vehicle_type sort order and filter.
+SUMMARY_TABLES = {
+    'vehicle_type_summary': '''(
+	"vehicle_type_id" INTEGER PRIMARY KEY,
+	"customers" INTEGER,
+	"total_length" INTEGER,
+	"min_length" INTEGER,
+	"max_length" INTEGER
+)''',
+    'vehicle_name_counts': '''(
+	"vehicle_type_id" INTEGER,
+	"vehicle_name" TEXT,
+	"customers" INTEGER,
+	PRIMARY KEY ("vehicle_type_id", "vehicle_name")
+) WITHOUT ROWID''',
+}
+
+# The statements adding a row of the customers table to the summary tables, and removing it. {row} is replaced by new
+# or old in the triggers below. When a removed row had the shortest or longest vehicle of its type, the new minimum
+# or maximum is read from the customers table with idx_customers_vehicle_type.
+_SUMMARY_ADD = """
+        INSERT INTO vehicle_type_summary VALUES
+            ({row}.vehicle_type_id, 1, {row}.vehicle_length, {row}.vehicle_length, {row}.vehicle_length)
+            ON CONFLICT (vehicle_type_id) DO UPDATE SET customers = customers + 1,
+                total_length = total_length + excluded.total_length,
+                min_length = min(min_length, excluded.min_length), max_length = max(max_length, excluded.max_length);
+        INSERT INTO vehicle_name_counts VALUES ({row}.vehicle_type_id, {row}.vehicle_name, 1)
+            ON CONFLICT (vehicle_type_id, vehicle_name) DO UPDATE SET customers = customers + 1;"""
+
+_SUMMARY_REMOVE = """
+        UPDATE vehicle_type_summary SET customers = customers - 1, total_length = total_length - {row}.vehicle_length
+            WHERE vehicle_type_id = {row}.vehicle_type_id;
+        UPDATE vehicle_type_summary SET
+            min_length = (SELECT min(vehicle_length) FROM customers WHERE vehicle_type_id = {row}.vehicle_type_id),
+            max_length = (SELECT max(vehicle_length) FROM customers WHERE vehicle_type_id = {row}.vehicle_type_id)
+            WHERE vehicle_type_id = {row}.vehicle_type_id AND {row}.vehicle_length IN (min_length, max_length);
+        DELETE FROM vehicle_type_summary WHERE vehicle_type_id = {row}.vehicle_type_id AND customers <= 0;
+        UPDATE vehicle_name_counts SET customers = customers - 1
+            WHERE vehicle_type_id = {row}.vehicle_type_id AND vehicle_name = {row}.vehicle_name;
+        DELETE FROM vehicle_name_counts
+            WHERE vehicle_type_id = {row}.vehicle_type_id AND vehicle_name = {row}.vehicle_name AND customers <= 0;"""
+
+# Triggers keeping the summary tables in sync with every insert, update and delete of the customers table.
+SUMMARY_TRIGGERS = {
+    'customers_summary_insert': f"AFTER INSERT ON customers BEGIN{_SUMMARY_ADD.format(row='new')}\n    END",
+    'customers_summary_delete': f"AFTER DELETE ON customers BEGIN{_SUMMARY_REMOVE.format(row='old')}\n    END",
+    'customers_summary_update': f"AFTER UPDATE OF vehicle_type_id, vehicle_name, vehicle_length ON customers BEGIN"
+                                f"{_SUMMARY_REMOVE.format(row='old')}{_SUMMARY_ADD.format(row='new')}\n    END",
+}
+
+# Number of vehicle names shown for every vehicle type by get_summary.
+TOP_VEHICLE_NAMES = 3
+
+# Customers are read joined to vehicle_types, which holds the text of their vehicle type.
+SELECT_COLUMNS = "first_name, last_name, email, vehicle_types.name AS vehicle_type, vehicle_name, vehicle_length"
+
+CUSTOMERS_FROM = "customers JOIN vehicle_types ON vehicle_types.id = customers.vehicle_type_id"
+
+SELECT_SQL = f"SELECT {SELECT_COLUMNS} FROM {CUSTOMERS_FROM}"
+
+_connections = {}
+
+# Database paths the schema has already been created for by this process.
+_initialized = set()
+
+
+def get_connection(db_path="customers.db"):
+    key = _connection_key(db_path)
+    connection = _connections.get(key)
+    if connection is None:
+        # Connections can be handed to worker threads, but each one is only ever used by one thread at a time.
+        connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        for pragma, value in CONNECTION_PRAGMAS.items():
+            connection.execute(f"PRAGMA {pragma} = {value};")
+        _connections[key] = connection
+
+    return connection
+
+
+def close_connection(db_path="customers.db"):
+    key = _connection_key(db_path)
+    _initialized.discard(key)
+    connection = _connections.pop(key, None)
+    if connection is not None:
+        connection.close()
+
+
+def close_connections():
+    for db_path in list(_connections):
+        close_connection(db_path)
+
+
+atexit.register(close_connections)
+
+
+def _connection_key(db_path):
+    return db_path if db_path == ":memory:" else os.path.abspath(db_path)
+
 
 def create_table(db_path="customers.db"):
-    connection = sqlite3.connect(db_path)
-    connection.row_factory = sqlite3.Row
+    """Creates the database, or upgrades it to the current schema with the migrations in MIGRATIONS, then creates
+        any missing index, the full-text table and the summary tables."""
+    key = _connection_key(db_path)
+    if key in _initialized:
+        return
+
+    connection = get_connection(db_path)
+    migrate(connection, MIGRATIONS)
     with connection:
-        connection.execute(
-            '''
+        has_email_key = _index_exists(connection, EMAIL_KEY_INDEX)
+        for index_name, columns in INDEXES.items():
+            # The unique email index created for --upsert replaces the plain email index.
+            if index_name == 'idx_customers_email' and has_email_key:
+                continue
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "customers" {columns};')
+        _create_search_table(connection)
+        _create_summary_tables(connection)
+    _initialized.add(key)
+
+
+"""
+
+The migrations upgrading a database to the current schema, applied in order by migrate (see migrations.py). Only 
+the tables holding data are created by migrations. Indexes, the full-text table and the summary tables are derived 
+from the customers table, so create_table creates them from their current definitions whenever they are missing.
+
+1. The original schema, a flat customers table with the vehicle type as text, and the ingest manifest, checkpoint and
+   change counter tables. Every statement uses IF NOT EXISTS, so databases created before schema_version existed 
+   are recorded as version 1 without being changed.
+2. The vehicle_types table holding every vehicle type once, keyed by its lower case name. The customers table is 
+   rebuilt with a vehicle_type_id foreign key instead of the vehicle_type text, keeping every rowid so the full-text 
+   index stays valid. Vehicle types differing only in case (RV and rv) become one type, shown with the spelling it was
+   first uploaded with.
+3. The ingest_range_checkpoints table, holding the progress of every byte range of a file uploaded in parallel by
+   ingest_files, so an upload of several files that stopped part way through can be resumed as well.
+
+"""
+
+
+def _create_original_tables(connection):
+    connection.execute(
+        '''
             CREATE TABLE IF NOT EXISTS "customers" (
 	"first_name" TEXT,
 	"last_name"	TEXT,
@@ -24,16 +260,428 @@ def create_table(db_path="customers.db"):
 	"vehicle_name" TEXT,
 	"vehicle_length" INTEGER
 ); '''
-        )
+    )
+    connection.execute(
+        '''
+            CREATE TABLE IF NOT EXISTS "ingest_manifest" (
+	"sha256" TEXT PRIMARY KEY,
+	"path" TEXT,
+	"size" INTEGER,
+	"mtime" REAL,
+	"rows" INTEGER,
+	"loaded_at" TEXT DEFAULT CURRENT_TIMESTAMP
+); '''
+    )
+    connection.execute(
+        '''
+            CREATE TABLE IF NOT EXISTS "ingest_checkpoints" (
+	"sha256" TEXT PRIMARY KEY,
+	"path" TEXT,
+	"byte_offset" INTEGER,
+	"row_number" INTEGER,
+	"updated_at" TEXT DEFAULT CURRENT_TIMESTAMP
+); '''
+    )
+    connection.execute(
+        '''
+            CREATE TABLE IF NOT EXISTS "change_counter" (
+	"id" INTEGER PRIMARY KEY CHECK ("id" = 0),
+	"changes" INTEGER NOT NULL
+); '''
+    )
+    connection.execute("INSERT OR IGNORE INTO change_counter (id, changes) VALUES (0, 0);")
+
+
+def _create_vehicle_types(connection):
+    connection.execute(
+        '''
+            CREATE TABLE "vehicle_types" (
+	"id" INTEGER PRIMARY KEY,
+	"key" TEXT NOT NULL UNIQUE,
+	"name" TEXT NOT NULL
+); '''
+    )
+    # The types are added in order of their key, using the spelling of the first customer uploaded with each one.
+    connection.execute(
+        "INSERT INTO vehicle_types (key, name) SELECT lower(coalesce(vehicle_type, '')), coalesce(vehicle_type, '') "
+        "FROM customers WHERE rowid IN (SELECT min(rowid) FROM customers GROUP BY lower(coalesce(vehicle_type, ''))) "
+        "ORDER BY 1;")
+    connection.execute(
+        '''
+            CREATE TABLE "customers_migrated" (
+	"first_name" TEXT,
+	"last_name"	TEXT,
+	"email"	TEXT,
+	"vehicle_type_id" INTEGER NOT NULL REFERENCES "vehicle_types" ("id"),
+	"vehicle_name" TEXT,
+	"vehicle_length" INTEGER
+); '''
+    )
+    connection.execute(
+        "INSERT INTO customers_migrated (rowid, first_name, last_name, email, vehicle_type_id, vehicle_name, "
+        "vehicle_length) SELECT customers.rowid, first_name, last_name, email, vehicle_types.id, vehicle_name, "
+        "vehicle_length FROM customers JOIN vehicle_types ON vehicle_types.key = lower(coalesce(vehicle_type, '')) "
+        "ORDER BY customers.rowid;")
+
+    # Dropping the old table also drops its indexes and triggers. create_table recreates them for the new table,
+    # except the unique email index, which only exists once --upsert has been used.
+    has_email_key = _index_exists(connection, EMAIL_KEY_INDEX)
+    connection.execute('DROP TABLE "customers";')
+    connection.execute('ALTER TABLE "customers_migrated" RENAME TO "customers";')
+    if has_email_key:
+        connection.execute(f'CREATE UNIQUE INDEX "{EMAIL_KEY_INDEX}" ON "customers" (email);')
+    # The summary tables were keyed by the vehicle type text, they are recreated keyed by vehicle_type_id.
+    for table_name in SUMMARY_TABLES:
+        connection.execute(f'DROP TABLE IF EXISTS "{table_name}";')
+    bump_change_counter(connection)
+
+
+def _create_range_checkpoints(connection):
+    connection.execute(
+        '''
+            CREATE TABLE "ingest_range_checkpoints" (
+	"sha256" TEXT NOT NULL,
+	"range_start" INTEGER NOT NULL,
+	"range_end" INTEGER,
+	"path" TEXT,
+	"byte_offset" INTEGER,
+	"row_number" INTEGER,
+	"updated_at" TEXT DEFAULT CURRENT_TIMESTAMP,
+	PRIMARY KEY ("sha256", "range_start")
+); '''
+    )
+
+
+MIGRATIONS = [
+    Migration(1, "customers, ingest manifest, checkpoint and change counter tables", _create_original_tables),
+    Migration(2, "vehicle_types table referenced by customers.vehicle_type_id", _create_vehicle_types),
+    Migration(3, "ingest_range_checkpoints table for parallel uploads", _create_range_checkpoints),
+]
+
+
+def _index_exists(connection, index_name):
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?;"
+    return connection.execute(sql, (index_name,)).fetchone() is not None
+
+
+def _create_search_table(connection):
+    if search_tokenizer(connection) is not None:
+        # The triggers are dropped along with the customers table when a migration rebuilds it.
+        _create_search_triggers(connection)
+        return
+
+    for tokenizer in SEARCH_TOKENIZERS:
+        try:
+            connection.execute(SEARCH_TABLE_SQL.format(tokenizer=tokenizer))
+            break
+        except sqlite3.OperationalError:
+            # The tokenizer, or FTS5 itself, isn't available in this build of SQLite.
+            continue
+    else:
+        return
+
+    _create_search_triggers(connection)
+    # Index the customers already in the table, for databases created before customers_fts existed.
+    connection.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild');")
+
+
+def _create_search_triggers(connection):
+    connection.execute(f'CREATE TABLE IF NOT EXISTS "{SEARCH_DEFERRED_TABLE}" ("id" INTEGER PRIMARY KEY);')
+    for trigger_name, trigger in SEARCH_TRIGGERS.items():
+        # Triggers created by an older outdoorsy are replaced with their current definition.
+        row = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?;",
+                                 (trigger_name,)).fetchone()
+        if row is not None and row[0] != f'CREATE TRIGGER "{trigger_name}" {trigger}':
+            connection.execute(f'DROP TRIGGER "{trigger_name}";')
+        connection.execute(f'CREATE TRIGGER IF NOT EXISTS "{trigger_name}" {trigger};')
+
+
+def search_tokenizer(connection):
+    """Returns the tokenizer used by the customers_fts table, or None if the database doesn't have one."""
+    row = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?;",
+                             (SEARCH_TABLE,)).fetchone()
+    if row is None:
+        return None
+    return next((tokenizer for tokenizer in SEARCH_TOKENIZERS if f"tokenize='{tokenizer}'" in row[0]), None)
+
+
+"""
+
+The summary tables are created by create_table and kept up to date by SUMMARY_TRIGGERS as rows are inserted, updated
+or deleted, so get_summary (used by the --summary option) only reads one row for every vehicle type and vehicle name
+instead of the whole customers table. rebuild_summary (used by --rebuild-summary) recomputes both tables from the
+customers table, and reports whether the maintained tables were correct.
+
+"""
+
+Summary = namedtuple('Summary', ['vehicle_type', 'customers', 'average_length', 'min_length', 'max_length',
+                                 'top_vehicle_names'])
+
+
+def _create_summary_tables(connection):
+    if table_exists(connection, 'vehicle_type_summary'):
+        return
+
+    for table_name, columns in SUMMARY_TABLES.items():
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" {columns};')
+    for trigger_name, trigger in SUMMARY_TRIGGERS.items():
+        connection.execute(f'CREATE TRIGGER IF NOT EXISTS "{trigger_name}" {trigger};')
+    # Summarize the customers already in the table, for databases created before the summary tables existed.
+    _rebuild_summary(connection)
+
+
+def get_summary(db_path="customers.db", top_vehicle_names=TOP_VEHICLE_NAMES):
+    """Reads the summary of every vehicle type from the summary tables.
+
+        Returns:
+            A list of Summary, sorted by vehicle type.
+
+        """
+    connection = get_connection(db_path)
+    with STATS.stage('query'):
+        # Vehicle types are shown with their stored name, the same as in views, and sorted by their lower case key.
+        types = connection.execute(
+            "SELECT vehicle_type_id, name, customers, total_length, min_length, max_length FROM vehicle_type_summary "
+            "JOIN vehicle_types ON vehicle_types.id = vehicle_type_id ORDER BY key;").fetchall()
+        names = connection.execute(
+            """SELECT vehicle_type_id, vehicle_name FROM (
+                SELECT vehicle_type_id, vehicle_name, row_number() OVER (
+                    PARTITION BY vehicle_type_id ORDER BY customers DESC, vehicle_name) AS position
+                FROM vehicle_name_counts)
+            WHERE position <= ? ORDER BY vehicle_type_id, position;""", (top_vehicle_names,)).fetchall()
+
+    top_names = {}
+    for vehicle_type_id, vehicle_name in names:
+        top_names.setdefault(vehicle_type_id, []).append(vehicle_name)
+
+    return [Summary(vehicle_type, customers, total_length / customers, min_length, max_length,
+                    top_names.get(vehicle_type_id, []))
+            for vehicle_type_id, vehicle_type, customers, total_length, min_length, max_length in types]
+
+
+def rebuild_summary(db_path="customers.db"):
+    """Recomputes the summary tables from the customers table.
+
+        Returns:
+            True if the summary tables already matched the customers table.
+
+        """
+    connection = get_connection(db_path)
+    with connection:
+        previous = _summary_rows(connection)
+        _rebuild_summary(connection)
+        return _summary_rows(connection) == previous
+
+
+def _rebuild_summary(connection):
+    connection.execute("DELETE FROM vehicle_type_summary;")
+    connection.execute("DELETE FROM vehicle_name_counts;")
+    connection.execute(
+        "INSERT INTO vehicle_type_summary SELECT vehicle_type_id, count(*), sum(vehicle_length), "
+        "min(vehicle_length), max(vehicle_length) FROM customers GROUP BY vehicle_type_id;")
+    connection.execute(
+        "INSERT INTO vehicle_name_counts SELECT vehicle_type_id, vehicle_name, count(*) FROM customers "
+        "GROUP BY vehicle_type_id, vehicle_name;")
+
+
+def _summary_rows(connection):
+    return [[tuple(row) for row in connection.execute(f"SELECT * FROM {table_name} ORDER BY 1, 2;")]
+            for table_name in SUMMARY_TABLES]
+
+
+"""
+
+ensure_email_key is used before uploading with --upsert. It makes email the key of the customers table with a unique
+index, so a customer delivered again in a later file updates the existing row instead of adding a duplicate. If the 
+table already has duplicate emails from earlier uploads, only the most recently uploaded row for every email is kept.
+
+"""
+
+
+def ensure_email_key(db_path="customers.db"):
+    connection = get_connection(db_path)
+    if _index_exists(connection, EMAIL_KEY_INDEX):
+        return 0
+
+    with connection:
+        removed = connection.execute(
+            "DELETE FROM customers WHERE rowid NOT IN (SELECT max(rowid) FROM customers GROUP BY email);").rowcount
+        connection.execute(f'CREATE UNIQUE INDEX "{EMAIL_KEY_INDEX}" ON "customers" (email);')
+        connection.execute('DROP INDEX IF EXISTS "idx_customers_email";')
+        if removed:
+            bump_change_counter(connection)
+
+    return removed
+
+
+"""
+
+The change counter is a single row counting the transactions that changed the customers table. Every function writing
+to the customers table calls bump_change_counter in the same transaction, so a cached result is still valid as long 
+as the counter read by get_change_counter hasn't changed since it was cached (see render_cache.py).
+
+"""
+
+
+def get_change_counter(db_path="customers.db"):
+    """Returns the change counter, or None for a database without one."""
+    try:
+        row = get_connection(db_path).execute("SELECT changes FROM change_counter WHERE id = 0;").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def bump_change_counter(connection):
+    connection.execute("UPDATE change_counter SET changes = changes + 1 WHERE id = 0;")
+
+
+"""
+
+The ingest manifest records every file that has been uploaded by the hash of its contents, along with its path, size
+and modification time. Before a file is uploaded, file_fingerprint stats and hashes it and is_loaded checks the 
+manifest, so a file that was already uploaded is skipped without being parsed.
+
+"""
+
+Fingerprint = namedtuple('Fingerprint', ['path', 'size', 'mtime', 'sha256'])
+
+
+def file_fingerprint(path, block_size=1024 * 1024):
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while block := file.read(block_size):
+            digest.update(block)
+
+    return Fingerprint(path, stat.st_size, stat.st_mtime, digest.hexdigest())
+
+
+def is_loaded(fingerprint, db_path="customers.db"):
+    sql = "SELECT 1 FROM ingest_manifest WHERE sha256 = ?;"
+    return get_connection(db_path).execute(sql, (fingerprint.sha256,)).fetchone() is not None
+
+
+def record_load(fingerprint, rows, db_path="customers.db"):
+    connection = get_connection(db_path)
+    with connection:
+        add_to_manifest(connection, fingerprint, rows)
+
+
+def add_to_manifest(connection, fingerprint, rows):
+    """Records a file in the ingest manifest and removes its checkpoints, as part of the transaction committing its
+        last rows. record_load does the same in a transaction of its own."""
+    connection.execute(
+        "INSERT OR REPLACE INTO ingest_manifest (sha256, path, size, mtime, rows) VALUES (?, ?, ?, ?, ?);",
+        (fingerprint.sha256, os.path.abspath(fingerprint.path), fingerprint.size, fingerprint.mtime, rows))
+    _delete_checkpoints(connection, fingerprint)
+
+
+def _delete_checkpoints(connection, fingerprint):
+    # The checkpoints left by earlier versions of the file at the same path are removed as well.
+    parameters = (fingerprint.sha256, os.path.abspath(fingerprint.path))
+    connection.execute("DELETE FROM ingest_checkpoints WHERE sha256 = ? OR path = ?;", parameters)
+    connection.execute("DELETE FROM ingest_range_checkpoints WHERE sha256 = ? OR path = ?;", parameters)
+
+
+"""
+
+Checkpoints are written by insert_csv_to_db in the same transaction as every chunk of rows, with the byte offset in 
+the file and the number of rows committed so far. If an upload stops part way through a file, get_checkpoint returns 
+where it stopped and the upload can be resumed from there with --resume. The checkpoint of a file is removed once the
+file has been uploaded completely and recorded in the manifest.
+
+ingest_files commits the byte ranges of a file in parallel, so it keeps a range checkpoint for every range instead:
+all the ranges of a file are saved before its first rows are committed, and every committed batch moves the byte
+offset and row number of its range. Resuming reads every range again from its own byte offset.
+
+Checkpoints are found by the sha256 of the file, so a file changed after its upload stopped (for example to fix the
+row it stopped at) has no checkpoint. get_changed_checkpoint finds the rows committed from the earlier version by the
+path of the file instead, so the upload isn't silently started again from the first row.
+
+"""
+
+Checkpoint = namedtuple('Checkpoint', ['byte_offset', 'row_number'])
+
+RangeCheckpoint = namedtuple('RangeCheckpoint', ['range_start', 'range_end', 'byte_offset', 'row_number'])
+
+
+def get_checkpoint(fingerprint, db_path="customers.db"):
+    sql = "SELECT byte_offset, row_number FROM ingest_checkpoints WHERE sha256 = ?;"
+    row = get_connection(db_path).execute(sql, (fingerprint.sha256,)).fetchone()
+    return Checkpoint(*row) if row else None
+
+
+def get_changed_checkpoint(fingerprint, db_path="customers.db"):
+    """Returns the number of rows committed by an upload of an earlier version of the file at the same path that
+        stopped part way through, or 0 if there wasn't one."""
+    sql = "SELECT coalesce(sum(row_number), 0) FROM (" \
+          "SELECT row_number FROM ingest_checkpoints WHERE path = ?1 AND sha256 != ?2 UNION ALL " \
+          "SELECT row_number FROM ingest_range_checkpoints WHERE path = ?1 AND sha256 != ?2);"
+    parameters = (os.path.abspath(fingerprint.path), fingerprint.sha256)
+    return get_connection(db_path).execute(sql, parameters).fetchone()[0]
+
+
+def _save_checkpoint(connection, fingerprint, byte_offset, row_number):
+    connection.execute(
+        "INSERT OR REPLACE INTO ingest_checkpoints (sha256, path, byte_offset, row_number) VALUES (?, ?, ?, ?);",
+        (fingerprint.sha256, os.path.abspath(fingerprint.path), byte_offset, row_number))
+
+
+def get_range_checkpoints(fingerprint, db_path="customers.db"):
+    """Returns the RangeCheckpoint of every range of a file uploaded by ingest_files, ordered by range_start."""
+    sql = "SELECT range_start, range_end, byte_offset, row_number FROM ingest_range_checkpoints WHERE sha256 = ? " \
+          "ORDER BY range_start;"
+    return [RangeCheckpoint(*row) for row in get_connection(db_path).execute(sql, (fingerprint.sha256,))]
+
+
+def clear_checkpoints(fingerprint, db_path="customers.db"):
+    """Removes the checkpoints of a file, so its next upload starts from the beginning."""
+    connection = get_connection(db_path)
+    with connection:
+        _delete_checkpoints(connection, fingerprint)
+
+
+def save_ranges(connection, fingerprint, ranges):
+    """Saves a range checkpoint, with no rows committed yet, for every (start, end) byte range of a file."""
+    connection.execute("DELETE FROM ingest_range_checkpoints WHERE sha256 = ?;", (fingerprint.sha256,))
+    connection.executemany(
+        "INSERT INTO ingest_range_checkpoints (sha256, range_start, range_end, path, byte_offset, row_number) "
+        "VALUES (?, ?, ?, ?, ?, 0);",
+        [(fingerprint.sha256, start, end, os.path.abspath(fingerprint.path), start) for start, end in ranges])
+
+
+def save_range_checkpoint(connection, fingerprint, range_start, byte_offset, row_number):
+    """Moves the range checkpoint starting at range_start, in the transaction committing the range's rows."""
+    connection.execute(
+        "UPDATE ingest_range_checkpoints SET byte_offset = ?, row_number = ?, updated_at = CURRENT_TIMESTAMP "
+        "WHERE sha256 = ? AND range_start = ?;", (byte_offset, row_number, fingerprint.sha256, range_start))
 
 
 """
 
 The insert_csv_to_db function is referenced when a new comma or pipe delimited file is uploaded when running in 
-command-line or interactive mode. It parses the file into a dictionary and then inserts the data in a SQL Lite database.
+command-line or interactive mode. It parses the file into records and then inserts the data in a SQL Lite database.
 You could easily change the database to Postgres or another Database by editing the connections at the beginning of 
 this file and if needed modifying the SQL statements in this function, create_table, and get_entries (in app.py).
 
+Rows are streamed from the file and inserted in chunks of batch_size rows using executemany. Each chunk is committed
+separately unless single_transaction is set, in which case the whole file is loaded in one transaction. With upsert, 
+rows are inserted with UPSERT_SQL, which needs ensure_email_key to have been run on the database first.
+
+The file is read with reader.iter_records. If no delimiter is given, it is detected from the start of the file.
+Files compressed with gzip, bz2 or xz are decompressed while they are read.
+
+With concurrent (--concurrent), every chunk is written holding the database's WriteLock so that several uploads can
+write to the same database, see locking.py.
+
+With rejects (a RejectFile from rejects.py), records that can't be converted to rows are added to rejects instead of
+stopping the upload, see rejects.py.
+
+Every committed chunk records a checkpoint, so with resume an upload that stopped part way through continues from 
+the last committed chunk instead of the start of the file. The file is recorded in the ingest manifest once it has 
+been uploaded completely.
+
 To add support for files with other delimiters, such as tsv, do the following:
 - The additional delimiter would need to be added to parse_delimiter and create_parser in app.py
 - Any messages in app.py would need to be updated to reflect the additional option 
@@ -42,49 +690,222 @@ To add support for files with other delimiters, such as tsv, do the following:
 """
 
 
-def insert_csv_to_db(path, delimiter, db_path="customers.db"):
-    connection = sqlite3.connect(db_path)
-    connection.row_factory = sqlite3.Row
-    field_names = ['first_name', 'last_name', 'email', 'vehicle_type', 'vehicle_name', 'vehicle_length']
-    with open(path, 'r', encoding='utf-8') as csv_file:
-        reader = csv.DictReader(csv_file, fieldnames=field_names, delimiter=delimiter)
+def insert_csv_to_db(path, delimiter, db_path="customers.db", batch_size=DEFAULT_BATCH_SIZE,
+                     single_transaction=False, upsert=False, fingerprint=None, resume=False, rejects=None,
+                     concurrent=False):
+    sql = UPSERT_SQL if upsert else INSERT_SQL
+    with STATS.stage('open'):
+        fingerprint = fingerprint or file_fingerprint(path)
+        delimiter = delimiter or sniff_delimiter(path)
+    checkpoint = get_checkpoint(fingerprint, db_path) if resume else None
+    start_offset, row_number = checkpoint or (0, 0)
+    inserted = 0
+    lock = write_lock(db_path, concurrent)
 
-        for row in reader:
-            first_name = row['first_name']
-            last_name = row['last_name']
-            email = row['email']
-            vehicle_type = row['vehicle_type']
-            vehicle_name = row['vehicle_name']
-            row['vehicle_length'] = re.sub("\D+", "", row['vehicle_length'])
-            row['vehicle_length'] = int(row['vehicle_length'])
-            vehicle_length = row['vehicle_length']
+    with bulk_load(db_path) as connection:
+        chunks = timed_chunks(iter_records(path, delimiter, start_offset), batch_size)
 
-            with connection:
-                connection.execute(
-                    "INSERT INTO 'customers' VALUES (?, ?, ?, ?, ?, ?);",
-                    (first_name, last_name, email, vehicle_type, vehicle_name, vehicle_length)
-                )
+        # Rows are inserted a chunk at a time with executemany. By default every chunk is committed on its own
+        # together with a checkpoint, with single_transaction the whole file is committed once at the end (and
+        # rolled back on any error) so no checkpoint is needed.
+        if single_transaction:
+            with transaction(connection, lock):
+                for chunk in chunks:
+                    rows = timed_normalize(chunk, rejects, path)
+                    with STATS.stage('insert'):
+                        insert_rows(connection, sql, rows)
+                    inserted += len(rows)
+                bump_change_counter(connection)
+                add_to_manifest(connection, fingerprint, row_number + inserted)
+        else:
+            for chunk in chunks:
+                rows = timed_normalize(chunk, rejects, path)
+                with transaction(connection, lock):
+                    with STATS.stage('insert'):
+                        insert_rows(connection, sql, rows)
+                    inserted += len(rows)
+                    bump_change_counter(connection)
+                    _save_checkpoint(connection, fingerprint, chunk[-1][0], row_number + inserted)
+            with transaction(connection, lock):
+                add_to_manifest(connection, fingerprint, row_number + inserted)
 
+    if rejects is not None:
+        rejects.flush(path)
+    STATS.count('rows_inserted', inserted)
+    return inserted
 
-def get_entries(sort_order, db_path="customers.db"):
-    connection = sqlite3.connect(db_path)
-    connection.row_factory = sqlite3.Row
-    cur = connection.cursor()
 
-    # since SQL parameters can't be used for anything other than values, this will be sorted in Python using the
-    # if/else statement below instead. This is to avoid SQL injection.
+def insert_rows(connection, sql, rows):
+    """Inserts rows with INSERT_SQL or UPSERT_SQL, adding any new vehicle type to vehicle_types first. The new rows
+        are added to customers_fts once the whole batch is inserted, see SEARCH_DEFERRED_TABLE."""
+    # dict.fromkeys keeps the order of the rows, so a new vehicle type gets the spelling of its first row.
+    connection.executemany(VEHICLE_TYPE_SQL, dict.fromkeys((row[3],) for row in rows))
+    if search_tokenizer(connection) is None:
+        connection.executemany(sql, rows)
+        return
 
-    sql = "SELECT first_name, last_name, email, vehicle_type, vehicle_name, vehicle_length" \
-          " FROM customers ORDER BY first_name, last_name asc;"
+    # New rows get a rowid after the largest one, rows updated by UPSERT_SQL are still indexed by the update trigger.
+    last_rowid = connection.execute("SELECT max(rowid) FROM customers;").fetchone()[0] or 0
+    connection.execute(f"INSERT INTO {SEARCH_DEFERRED_TABLE} (id) VALUES (0);")
     try:
-        cur.execute(sql)
-        rows = cur.fetchall()
+        connection.executemany(sql, rows)
+        connection.execute(f"INSERT INTO {SEARCH_TABLE} (rowid, first_name, last_name, vehicle_name) "
+                           f"SELECT rowid, first_name, last_name, vehicle_name FROM customers WHERE rowid > ?;",
+                           (last_rowid,))
+    finally:
+        connection.execute(f"DELETE FROM {SEARCH_DEFERRED_TABLE};")
+
+
+def timed_chunks(records, batch_size):
+    """Splits records into lists of batch_size records, timing the reading of the file as the parse stage."""
+    chunks = _chunks(records, batch_size)
+    while True:
+        with STATS.stage('parse'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def timed_normalize(chunk, rejects=None, path=None):
+    """Converts a chunk from timed_chunks to rows with normalize_rows, adding the records it rejects to rejects."""
+    with STATS.stage('normalize'):
+        if rejects is None:
+            return normalize_rows([fields for _, fields in chunk])
+        rejected = []
+        rows = normalize_rows([fields for _, fields in chunk], rejected)
+    rejects.add_chunk(path, chunk, rejected)
+    return rows
+
+
+@contextmanager
+def transaction(connection, lock=None):
+    """The same as using the connection as a context manager, but with the commit timed separately. With a WriteLock
+        (--concurrent), the lock and the database write lock are held for the whole transaction, see locking.py."""
+    if lock is not None:
+        with STATS.stage('lock'):
+            lock.acquire()
+            try:
+                begin_immediate(connection)
+            except BaseException:
+                lock.release()
+                raise
+    try:
+        try:
+            yield connection
+        except BaseException:
+            connection.rollback()
+            raise
+        with STATS.stage('commit'):
+            connection.commit()
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+def write_lock(db_path, concurrent):
+    """Returns the WriteLock of the database when uploading with --concurrent, otherwise None."""
+    return WriteLock(db_path) if concurrent else None
+
+
+def normalize_rows(records, rejected=None):
+    """Converts a chunk of records read from a file to rows for INSERT_SQL, normalizing the vehicle_length column.
+
+        Raises TypeError if a record doesn't have one value for every column, which is usually caused by the wrong
+        delimiter being used, and InvalidLength if its vehicle length can't be read. When rejected (a list) is given,
+        those records are left out of the rows instead and added to rejected as (position in records, reason) pairs.
+
+        """
+    if rejected is not None:
+        return _normalize_valid_rows(records, rejected)
 
-        # check if the user selected the option to sort by vehicle type or full name.
-        if sort_order == "vehicle_type":
-            sorted_list = sorted(rows, key=lambda row: row[3].lower())
+    for fields in records:
+        if len(fields) != len(FIELD_NAMES):
+            raise TypeError(f"expected {len(FIELD_NAMES)} fields but found {len(fields)}")
+
+    lengths = normalize_lengths([fields[5] for fields in records])
+    return [(*fields[:5], length) for fields, length in zip(records, lengths)]
+
+
+def _normalize_valid_rows(records, rejected):
+    valid = []
+    for position, fields in enumerate(records):
+        if len(fields) == len(FIELD_NAMES):
+            valid.append(position)
         else:
-            sorted_list = rows
+            rejected.append((position, f"expected {len(FIELD_NAMES)} fields but found {len(fields)}"))
+
+    # Every distinct length is parsed once, the same as normalize_lengths, keeping the error of the invalid ones.
+    lengths = {}
+    for value in {records[position][5] for position in valid}:
+        try:
+            lengths[value] = parse_length(value)
+        except InvalidLength as error:
+            lengths[value] = error
+
+    rows = []
+    for position in valid:
+        fields = records[position]
+        length = lengths[fields[5]]
+        if isinstance(length, InvalidLength):
+            rejected.append((position, str(length)))
+        else:
+            rows.append((*fields[:5], length))
+    rejected.sort()
+    return rows
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+@contextmanager
+def bulk_load(db_path="customers.db"):
+    """Applies LOAD_PRAGMAS to the shared connection for the duration of a load and restores them afterwards.
+
+        Returns:
+            The connection to insert rows with.
+
+        """
+    connection = get_connection(db_path)
+    previous = {pragma: connection.execute(f"PRAGMA {pragma};").fetchone()[0] for pragma in LOAD_PRAGMAS}
+    for pragma, value in LOAD_PRAGMAS.items():
+        connection.execute(f"PRAGMA {pragma} = {value};")
+    try:
+        yield connection
+    finally:
+        for pragma, value in previous.items():
+            connection.execute(f"PRAGMA {pragma} = {value};")
+
+
+"""
+
+get_entries reads every selected row into a ResultSet, a column-oriented container using a fraction of the memory of 
+a list of sqlite3.Row objects, see results.py. Its rows can be indexed by position or column name like sqlite3.Row.
+
+"""
+
+
+def get_entries(sort_order, db_path="customers.db", limit=None, offset=None, after=None, filters=None,
+                fetch_size=1000):
+    cur = get_connection(db_path).cursor()
+    # Plain tuples are fetched, since they are only copied into the ResultSet.
+    cur.row_factory = None
+
+    try:
+        sql, parameters = _select_sql(cur.connection, sort_order, limit, offset, after, filters)
+        with STATS.stage('query'):
+            cur.execute(sql, parameters)
+        sorted_list = ResultSet()
+        while True:
+            with STATS.stage('fetch'):
+                rows = cur.fetchmany(fetch_size)
+                sorted_list.extend(rows)
+            if not rows:
+                break
+        STATS.count('rows_read', len(sorted_list))
 
     except sqlite3.OperationalError:
         print(Fore.RED + f"Table does not exist. Upload a new file first!")
@@ -94,5 +915,67 @@ def get_entries(sort_order, db_path="customers.db"):
     return sorted_list
 
 
+"""
+
+iter_entries is the streaming version of get_entries used by the -v option. Rows are fetched from the cursor in batches 
+of fetch_size as they are consumed, so memory use doesn't grow with the size of the table. Every row has the sort key 
+columns of the selected sort order appended after the six customer columns, which next_cursor uses to build the 
+cursor for the next page. The query runs when iter_entries is called, so like get_entries it returns None instead of
+rows when the database has no customers table, and callers can skip printing an empty table.
+
+"""
+
+
+def iter_entries(sort_order, db_path="customers.db", limit=None, offset=None, after=None, filters=None,
+                 fetch_size=1000):
+    connection = get_connection(db_path)
+    try:
+        sql, parameters = _select_sql(connection, sort_order, limit, offset, after, filters, with_cursor=True)
+        with STATS.stage('query'):
+            cur = connection.execute(sql, parameters)
+    except sqlite3.OperationalError:
+        print(Fore.RED + f"Table does not exist. Upload a new file first!")
+        print(Style.RESET_ALL)
+        return None
+
+    return _fetch_rows(cur, fetch_size)
+
+
+def _fetch_rows(cur, fetch_size):
+    while True:
+        with STATS.stage('fetch'):
+            rows = cur.fetchmany(fetch_size)
+        if not rows:
+            return
+        STATS.count('rows_read', len(rows))
+        yield from rows
+
+
+def next_cursor(sort_order, row):
+    return encode_cursor(sort_order, tuple(row)[len(FIELD_NAMES):])
+
+
+def _select_sql(connection, sort_order, limit=None, offset=None, after=None, filters=None, with_cursor=False):
+    # The ORDER BY and WHERE clauses are built from the whitelisted sort orders in sorting.py and filters in
+    # filters.py, never from user input directly. This is to avoid SQL injection. Values from the user (filter values,
+    # limit, offset and cursor values) are always bound.
+    columns = f"{SELECT_COLUMNS}, {cursor_columns(sort_order)}" if with_cursor else SELECT_COLUMNS
+    sql = f"SELECT {columns} FROM {CUSTOMERS_FROM}"
+    tokenizer = search_tokenizer(connection) if filters is not None and filters.search is not None else None
+    conditions, parameters = where_conditions(filters, tokenizer)
+    if after is not None:
+        # The cursor only depends on the sort order, so it pages through filtered views the same way.
+        conditions.append(keyset_condition(sort_order))
+        parameters.extend(decode_cursor(sort_order, after))
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order_by_clause(sort_order)}"
+    if limit is not None or offset:
+        sql += " LIMIT ? OFFSET ?"
+        parameters.extend([-1 if limit is None else limit, offset or 0])
+
+    return sql + ";", parameters
+
+
 if __name__ == '__main__':
     print("The database module should be imported, not ran directly.")
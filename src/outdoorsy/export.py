@@ -0,0 +1,263 @@
+"""
+
+export.py contains the writers used by the --output option to export the customers table for other tools, and a
+reader for the columnar format.
+
+Every writer takes the rows to export as an iterable, such as the rows of iter_entries, and writes them in batches of
+EXPORT_BATCH_SIZE as they are read, so memory use stays the same no matter how many rows are exported.
+
+- csv: a comma delimited file with a header row of the column names
+- jsonl: one JSON object per line, with the column names as keys
+- columnar: a binary file where every column is stored contiguously, described below
+
+The columnar file starts with MAGIC, followed by row groups of up to ROW_GROUP_SIZE rows. Inside a row group every
+column is one contiguous chunk:
+
+- text columns are an array of len(rows) + 1 uint32 offsets followed by the UTF-8 bytes of every value, value i
+  being the bytes between offsets i and i + 1
+- vehicle_type is dictionary encoded, an array of one uint32 code for every row indexing the dictionary in the footer
+- vehicle_length is an array of one int32 for every row
+
+All numbers are little endian. The file ends with a JSON footer holding the columns, the vehicle_type dictionary and
+the position of every column chunk in every row group, then the length of the footer as a uint64 and MAGIC again.
+read_columnar reads the footer first, so it can load only the columns it's asked for.
+
+cli.py imports EXPORT_FORMATS from here, so the csv module is only imported by write_csv to keep outdoorsy -h fast.
+
+"""
+
+import json
+import struct
+import sys
+from array import array
+from itertools import islice
+from .stats import STATS
+
+EXPORT_FORMATS = ['csv', 'jsonl', 'columnar']
+
+COLUMNS = ['first_name', 'last_name', 'email', 'vehicle_type', 'vehicle_name', 'vehicle_length']
+
+# Number of rows read from the database and written at a time.
+EXPORT_BATCH_SIZE = 1000
+
+MAGIC = b'OUTDCOL1'
+ROW_GROUP_SIZE = 65536
+FOOTER_LENGTH = struct.Struct('<Q')
+
+# How every column of the columnar format is encoded, and the array type codes of the encodings.
+COLUMN_ENCODINGS = {
+    'first_name': 'text',
+    'last_name': 'text',
+    'email': 'text',
+    'vehicle_type': 'dictionary',
+    'vehicle_name': 'text',
+    'vehicle_length': 'int32',
+}
+OFFSET_TYPE = 'I'
+CODE_TYPE = 'I'
+INT32_TYPE = 'i'
+
+
+class InvalidColumnarFile(Exception):
+    pass
+
+
+def export_rows(rows, output_format, file):
+    """Writes rows in output_format to file, which must be opened in binary mode for the columnar format and in text
+        mode with newline='' otherwise.
+
+        Returns:
+            The number of rows written.
+
+        """
+    writers = {'csv': write_csv, 'jsonl': write_jsonl, 'columnar': write_columnar}
+    count = writers[output_format](rows, file)
+    STATS.count('rows_exported', count)
+    return count
+
+
+def write_csv(rows, file):
+    import csv
+
+    writer = csv.writer(file)
+    writer.writerow(COLUMNS)
+    count = 0
+    for batch in _batches(rows):
+        with STATS.stage('export'):
+            writer.writerows(batch)
+        count += len(batch)
+    return count
+
+
+def write_jsonl(rows, file):
+    count = 0
+    for batch in _batches(rows):
+        with STATS.stage('export'):
+            file.write("".join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in batch))
+        count += len(batch)
+    return count
+
+
+def write_columnar(rows, file, row_group_size=ROW_GROUP_SIZE):
+    writer = ColumnarWriter(file, row_group_size)
+    for batch in _batches(rows):
+        with STATS.stage('export'):
+            writer.write_rows(batch)
+    with STATS.stage('export'):
+        writer.close()
+    return writer.count
+
+
+def _batches(rows):
+    # Rows from iter_entries have the sort key columns after the customer columns, which aren't exported.
+    rows = iter(rows)
+    while batch := [tuple(row[:len(COLUMNS)]) for row in islice(rows, EXPORT_BATCH_SIZE)]:
+        yield batch
+
+
+class ColumnarWriter:
+    """Writes rows to a file in the columnar format, a row group at a time. close must be called to write the
+        footer, but doesn't close the file."""
+
+    def __init__(self, file, row_group_size=ROW_GROUP_SIZE):
+        self.file = file
+        self.row_group_size = row_group_size
+        self.position = 0
+        self.count = 0
+        self.dictionary = {}
+        self.row_groups = []
+        self.pending = []
+        self._write(MAGIC)
+
+    def write_rows(self, rows):
+        self.pending.extend(rows)
+        while len(self.pending) >= self.row_group_size:
+            self._write_row_group(self.pending[:self.row_group_size])
+            del self.pending[:self.row_group_size]
+
+    def close(self):
+        if self.pending:
+            self._write_row_group(self.pending)
+            self.pending = []
+        footer = json.dumps({
+            'columns': [{'name': name, 'encoding': COLUMN_ENCODINGS[name]} for name in COLUMNS],
+            'dictionaries': {'vehicle_type': list(self.dictionary)},
+            'row_groups': self.row_groups,
+        }).encode('utf-8')
+        self._write(footer)
+        self._write(FOOTER_LENGTH.pack(len(footer)))
+        self._write(MAGIC)
+
+    def _write_row_group(self, rows):
+        chunks = []
+        for index, name in enumerate(COLUMNS):
+            values = [row[index] for row in rows]
+            start = self.position
+            encoding = COLUMN_ENCODINGS[name]
+            if encoding == 'text':
+                self._write_text(values)
+            elif encoding == 'dictionary':
+                codes = array(CODE_TYPE, [self.dictionary.setdefault(value, len(self.dictionary)) for value in values])
+                self._write_array(codes)
+            else:
+                self._write_array(array(INT32_TYPE, values))
+            chunks.append([start, self.position - start])
+
+        self.row_groups.append({'rows': len(rows), 'columns': chunks})
+        self.count += len(rows)
+
+    def _write_text(self, values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = array(OFFSET_TYPE, [0])
+        total = 0
+        for value in encoded:
+            total += len(value)
+            offsets.append(total)
+        self._write_array(offsets)
+        self._write(b''.join(encoded))
+
+    def _write_array(self, values):
+        if sys.byteorder == 'big':
+            values.byteswap()
+        self._write(values.tobytes())
+
+    def _write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+
+def read_columnar(path, columns=None):
+    """Reads the columns of a file written by write_columnar. Only the chunks of the requested columns are read.
+
+        Returns:
+            A dictionary of every column name to the list of its values, or an array for vehicle_length.
+
+        """
+    result = {name: array(INT32_TYPE) if COLUMN_ENCODINGS.get(name) == 'int32' else [] for name in columns or COLUMNS}
+    for row_group in iter_row_groups(path, list(result)):
+        for name, values in row_group.items():
+            result[name].extend(values)
+    return result
+
+
+def iter_row_groups(path, columns=None):
+    """Reads a file written by write_columnar one row group at a time.
+
+        Yields:
+            A dictionary of every requested column name to the values of the row group.
+
+        """
+    columns = columns or COLUMNS
+    with open(path, 'rb') as file:
+        footer = _read_footer(file)
+        dictionary = footer['dictionaries']['vehicle_type']
+        positions = {column['name']: index for index, column in enumerate(footer['columns'])}
+        unknown = [name for name in columns if name not in positions]
+        if unknown:
+            raise InvalidColumnarFile(f"unknown columns: {', '.join(unknown)}")
+
+        for row_group in footer['row_groups']:
+            values = {}
+            for name in columns:
+                start, length = row_group['columns'][positions[name]]
+                file.seek(start)
+                values[name] = _decode_chunk(file.read(length), COLUMN_ENCODINGS[name], row_group['rows'],
+                                             dictionary)
+            yield values
+
+
+def _read_footer(file):
+    file.seek(0, 2)
+    size = file.tell()
+    trailer_size = FOOTER_LENGTH.size + len(MAGIC)
+    if size < len(MAGIC) + trailer_size:
+        raise InvalidColumnarFile("file is too small")
+    file.seek(size - trailer_size)
+    trailer = file.read(trailer_size)
+    file.seek(0)
+    if file.read(len(MAGIC)) != MAGIC or trailer[FOOTER_LENGTH.size:] != MAGIC:
+        raise InvalidColumnarFile("not an outdoorsy columnar file")
+
+    footer_length, = FOOTER_LENGTH.unpack(trailer[:FOOTER_LENGTH.size])
+    file.seek(size - trailer_size - footer_length)
+    return json.loads(file.read(footer_length))
+
+
+def _decode_chunk(data, encoding, rows, dictionary):
+    if encoding == 'int32':
+        return _read_array(INT32_TYPE, data)
+    if encoding == 'dictionary':
+        return [dictionary[code] for code in _read_array(CODE_TYPE, data)]
+
+    offsets_size = (rows + 1) * array(OFFSET_TYPE).itemsize
+    offsets = _read_array(OFFSET_TYPE, data[:offsets_size])
+    text = data[offsets_size:]
+    return [text[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+def _read_array(type_code, data):
+    values = array(type_code)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
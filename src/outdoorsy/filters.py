@@ -0,0 +1,106 @@
+"""
+
+filters.py contains the filters that can be used when viewing the customers table, for example with
+--vehicle-type campervan or --search "airstream".
+
+Like the sort orders in sorting.py, user input is never placed into the SQL directly. Every filter adds a fixed
+condition to the WHERE clause and its value is bound as a parameter. Each condition is written so it can be answered
+by one of the indexes created by create_table in database.py, so finding one customer is an index lookup no matter
+how large the table is:
+
+- vehicle_type looks up the lower case key of vehicle_types, so it is matched case insensitively, then uses
+  idx_customers_vehicle_type
+- email uses the email index
+- name uses idx_customers_name for the first name and idx_customers_last_name for the last name
+- min_length and max_length use idx_customers_vehicle_length
+
+search looks for every word in the first name, last name and vehicle name columns using the customers_fts full-text
+table. With the trigram tokenizer any part of a word is found (for example "stream" finds Airstream). When SQLite
+doesn't have the trigram tokenizer, the unicode61 tokenizer is used instead and words are matched by prefix. Words
+too short to be found by the full-text table, and databases without FTS5, fall back to a LIKE condition.
+
+To add a new filter, add a field to Filters, its condition to where_conditions and an index answering it to INDEXES
+in database.py.
+
+"""
+
+from collections import namedtuple
+
+Filters = namedtuple('Filters', ['vehicle_type', 'email', 'name', 'min_length', 'max_length', 'search'],
+                     defaults=[None] * 6)
+
+# The columns searched by the search filter, which are the columns of the customers_fts table.
+SEARCH_COLUMNS = ('first_name', 'last_name', 'vehicle_name')
+
+# Words shorter than this can't be found with the trigram tokenizer.
+TRIGRAM_LENGTH = 3
+
+
+def where_conditions(filters, search_tokenizer=None):
+    """Builds the WHERE conditions of the filters that are set. search_tokenizer is the tokenizer of the
+        customers_fts table, or None if the database doesn't have one.
+
+        Returns:
+            A tuple of the list of conditions, to be joined with AND, and the list of parameters to bind to them.
+
+        """
+    conditions = []
+    parameters = []
+    if filters is None:
+        return conditions, parameters
+
+    if filters.vehicle_type is not None:
+        conditions.append("vehicle_types.key = lower(?)")
+        parameters.append(filters.vehicle_type)
+    if filters.email is not None:
+        conditions.append("email = ?")
+        parameters.append(filters.email)
+    if filters.name is not None:
+        first_name, _, last_name = filters.name.strip().partition(" ")
+        if last_name:
+            conditions.append("first_name = ? AND last_name = ?")
+            parameters.extend([first_name, last_name.strip()])
+        else:
+            conditions.append("(first_name = ? OR last_name = ?)")
+            parameters.extend([first_name, first_name])
+    if filters.min_length is not None:
+        conditions.append("vehicle_length >= ?")
+        parameters.append(filters.min_length)
+    if filters.max_length is not None:
+        conditions.append("vehicle_length <= ?")
+        parameters.append(filters.max_length)
+    if filters.search is not None:
+        search_conditions, search_parameters = _search_conditions(filters.search, search_tokenizer)
+        conditions.extend(search_conditions)
+        parameters.extend(search_parameters)
+
+    return conditions, parameters
+
+
+def _search_conditions(text, tokenizer):
+    conditions = []
+    parameters = []
+    match_terms = []
+    for word in text.split():
+        if tokenizer == 'trigram' and len(word) >= TRIGRAM_LENGTH:
+            match_terms.append(_quote(word))
+        elif tokenizer is not None and tokenizer != 'trigram':
+            match_terms.append(_quote(word) + "*")
+        else:
+            conditions.append("(" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in SEARCH_COLUMNS) + ")")
+            parameters.extend([f"%{_escape_like(word)}%"] * len(SEARCH_COLUMNS))
+
+    if match_terms:
+        conditions.insert(0, "customers.rowid IN (SELECT rowid FROM customers_fts WHERE customers_fts MATCH ?)")
+        parameters.insert(0, " ".join(match_terms))
+
+    return conditions, parameters
+
+
+def _quote(word):
+    # A word in double quotes is a string in an FTS5 query, so operators and punctuation in it have no meaning.
+    return '"' + word.replace('"', '""') + '"'
+
+
+def _escape_like(word):
+    return word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -0,0 +1,239 @@
+"""
+
+ingest.py contains the logic to upload many comma or pipe delimited files at once. It is used by app.py when -f is
+given more than one file, a directory or a glob pattern.
+
+Files are split into ranges of roughly CHUNK_BYTES, and every range is parsed (including the vehicle_length
+normalization) by a worker process from a ProcessPoolExecutor so that all cores are used. The workers put the parsed
+rows on a bounded queue in batches. The queue is read by a single writer in the main process, which is the only one
+inserting into SQL Lite, so writes never compete for the database lock. When the writer falls behind, the queue fills
+up and the workers wait instead of holding every parsed row in memory.
+
+Files compressed with gzip, bz2 or xz can't be split into ranges, so every compressed file is one task, decompressed and
+parsed by one worker. Several compressed files are decompressed in parallel, one per worker. Files with line breaks in
+quoted values are read by one worker as well.
+
+Given the fingerprints of the files, the writer saves a range checkpoint for every range in the same transaction as
+each batch of its rows (see get_range_checkpoints in database.py). With resume, a file with range checkpoints is read
+again from the checkpoint of every range, using the ranges saved by the upload that stopped.
+
+"""
+
+import csv
+import glob
+import multiprocessing
+import os
+import queue
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from .reader import iter_records, sniff_delimiter, detect_compression, has_multiline_records
+from .stats import STATS
+from .database import bulk_load, bump_change_counter, insert_rows, normalize_rows, write_lock, get_range_checkpoints, \
+    transaction, save_ranges, save_range_checkpoint, INSERT_SQL, UPSERT_SQL, DEFAULT_BATCH_SIZE
+
+# Size of the file ranges handed to the worker processes.
+CHUNK_BYTES = 16 * 1024 * 1024
+
+# Maximum number of parsed batches waiting for the writer.
+QUEUE_SIZE = 16
+
+GLOB_CHARACTERS = re.compile(r"[*?\[]")
+
+FileResult = namedtuple('FileResult', ['path', 'rows', 'seconds', 'error'])
+
+_Task = namedtuple('_Task', ['task_id', 'path', 'delimiter', 'start', 'end', 'batch_size', 'reject', 'range_start'])
+
+# The queue shared with the worker processes, set by _init_worker when each worker starts.
+_batches = None
+
+
+def expand_paths(patterns):
+    """Expands the paths given to -f. Directories are expanded to the files they contain and glob patterns such as
+        /exports/*.csv to the files they match.
+
+        Returns:
+            A tuple of the list of files found and the list of paths or patterns that didn't match any file.
+
+        """
+    paths = []
+    missing = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        elif GLOB_CHARACTERS.search(pattern):
+            matches = sorted(glob.glob(pattern))
+        else:
+            matches = [pattern]
+
+        matches = [match for match in matches if os.path.isfile(match)]
+        if not matches:
+            missing.append(pattern)
+        paths.extend(match for match in matches if match not in paths)
+
+    return paths, missing
+
+
+def ingest_files(paths, delimiter, db_path="customers.db", batch_size=DEFAULT_BATCH_SIZE, workers=None,
+                 chunk_bytes=CHUNK_BYTES, upsert=False, rejects=None, concurrent=False, fingerprints=None,
+                 resume=False):
+    """Parses the files in worker processes and inserts the rows into the database from a single writer. With rejects
+        (a RejectFile), the workers send back the records they can't convert instead of stopping at the first one.
+        With concurrent, every batch is written holding the database's WriteLock, see locking.py. With fingerprints
+        (a dict of the fingerprint of every path), range checkpoints are saved, and with resume too, the files with
+        range checkpoints continue from them.
+
+        Returns:
+            A list of FileResult, one for every path, and the total time taken in seconds. The rows of a resumed file
+            include the rows committed before it stopped.
+
+        """
+    started = time.perf_counter()
+    sql = UPSERT_SQL if upsert else INSERT_SQL
+    lock = write_lock(db_path, concurrent)
+    resumed = {}
+    if fingerprints and resume:
+        resumed = {path: checkpoints for path in paths
+                   if (checkpoints := get_range_checkpoints(fingerprints[path], db_path))}
+    tasks = list(_plan_tasks(paths, delimiter, batch_size, chunk_bytes, rejects is not None, resumed))
+    rows = {path: sum(checkpoint.row_number for checkpoint in resumed.get(path, ())) for path in paths}
+    task_rows = {task.task_id: _resumed_rows(resumed.get(task.path, ()), task.range_start) for task in tasks}
+    seconds = dict.fromkeys(paths, 0.0)
+    errors = {}
+    write_error = None
+
+    batches = multiprocessing.Queue(maxsize=QUEUE_SIZE)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(batches,)) as pool:
+        futures = {pool.submit(_parse_range, task): task for task in tasks}
+        pending = {task.task_id: task for task in tasks}
+
+        with bulk_load(db_path) as connection:
+            if fingerprints:
+                # Every range of a file is saved before any of its rows are committed, so a resumed upload knows
+                # about the ranges that hadn't committed anything yet.
+                with transaction(connection, lock):
+                    for path in paths:
+                        if path not in resumed:
+                            save_ranges(connection, fingerprints[path],
+                                         [(task.start, task.end) for task in tasks if task.path == path])
+            while pending:
+                try:
+                    with STATS.stage('wait'):
+                        kind, task_id, payload = batches.get(timeout=1)
+                except queue.Empty:
+                    # A worker that died without reporting back would otherwise leave the writer waiting forever.
+                    for future, task in futures.items():
+                        if task.task_id in pending and future.done() and future.exception() is not None:
+                            del pending[task.task_id]
+                            errors.setdefault(task.path, str(future.exception()))
+                    continue
+
+                task = pending.get(task_id)
+                if task is None:
+                    continue
+                if kind == 'rows' and write_error is None:
+                    # After a failed write the writer keeps reading until every worker has finished, so no worker
+                    # is left waiting on a full queue, and the error is raised after that.
+                    batch, byte_offset = payload
+                    try:
+                        with transaction(connection, lock):
+                            with STATS.stage('insert'):
+                                insert_rows(connection, sql, batch)
+                            bump_change_counter(connection)
+                            if fingerprints:
+                                save_range_checkpoint(connection, fingerprints[task.path], task.range_start,
+                                                       byte_offset, task_rows[task_id] + len(batch))
+                        task_rows[task_id] += len(batch)
+                        rows[task.path] += len(batch)
+                        STATS.count('rows_inserted', len(batch))
+                    except Exception as exception:
+                        write_error = exception
+                elif kind == 'rejects':
+                    for byte_offset, reason, fields in payload:
+                        rejects.add(task.path, byte_offset, reason, fields)
+                elif kind == 'done':
+                    elapsed, error = payload
+                    del pending[task_id]
+                    seconds[task.path] += elapsed
+                    # Parsing happens in the worker processes, so only the time they report back is known here.
+                    STATS.record('parse', elapsed)
+                    if error is not None:
+                        errors.setdefault(task.path, error)
+
+    if write_error is not None:
+        raise write_error
+    if rejects is not None:
+        for path in paths:
+            rejects.flush(path)
+
+    results = [FileResult(path, rows[path], seconds[path], errors.get(path)) for path in paths]
+    return results, time.perf_counter() - started
+
+
+def _plan_tasks(paths, delimiter, batch_size, chunk_bytes, reject=False, resumed=None):
+    task_id = 0
+    for path in paths:
+        # Empty files have nothing to parse and no delimiter to detect.
+        size = os.path.getsize(path)
+        if not size:
+            continue
+        file_delimiter = delimiter or sniff_delimiter(path)
+        if path in (resumed or {}):
+            # Every range continues after the last batch it committed, ranges that were finished are left out.
+            ranges = [(checkpoint.range_start, checkpoint.byte_offset, checkpoint.range_end)
+                      for checkpoint in resumed[path]
+                      if checkpoint.range_end is None or checkpoint.byte_offset < checkpoint.range_end]
+        elif detect_compression(path) or has_multiline_records(path, file_delimiter):
+            # A compressed file can't be read from the middle, so it is decompressed and parsed by one worker. So is
+            # a file with line breaks in quoted values, where a range could start in the middle of a record.
+            ranges = [(0, 0, None)]
+        else:
+            ranges = [(start, start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)]
+        for range_start, start, end in ranges:
+            yield _Task(task_id, path, file_delimiter, start, end, batch_size, reject, range_start)
+            task_id += 1
+
+
+def _resumed_rows(checkpoints, range_start):
+    return next((checkpoint.row_number for checkpoint in checkpoints if checkpoint.range_start == range_start), 0)
+
+
+def _init_worker(batches):
+    global _batches
+    _batches = batches
+
+
+def _parse_range(task):
+    """Runs in a worker process. Parses the records starting in the task's byte range and puts them on the queue."""
+    started = time.perf_counter()
+    error = None
+    try:
+        batch = []
+        for record in iter_records(task.path, task.delimiter, task.start, task.end):
+            batch.append(record)
+            if len(batch) >= task.batch_size:
+                _put_batch(task, batch)
+                batch = []
+        if batch:
+            _put_batch(task, batch)
+    except (ValueError, TypeError, csv.Error) as exception:
+        error = f"{type(exception).__name__}: {exception}"
+
+    _batches.put(('done', task.task_id, (time.perf_counter() - started, error)))
+
+
+def _put_batch(task, batch):
+    # The byte offset after the last record of the batch is where the range continues if the upload is resumed.
+    byte_offset = batch[-1][0]
+    if not task.reject:
+        _batches.put(('rows', task.task_id, (normalize_rows([fields for _, fields in batch]), byte_offset)))
+        return
+
+    rejected = []
+    rows = normalize_rows([fields for _, fields in batch], rejected)
+    if rejected:
+        _batches.put(('rejects', task.task_id, [(batch[position][0], reason, batch[position][1])
+                                               for position, reason in rejected]))
+    if rows:
+        _batches.put(('rows', task.task_id, (rows, byte_offset)))
@@ -0,0 +1,100 @@
+"""
+
+lengths.py contains the logic to convert the vehicle_length column of an uploaded file to a whole number of feet.
+
+Lengths are written in many different ways in the files we receive, for example 28 feet, 32’, 40 ft, 7.5 m or 32' 6".
+parse_length reads every number and unit pair in the value, converts each one to feet using UNITS and rounds the
+total to the nearest foot. A value without a unit is taken to be in feet.
+
+The same few hundred length values are repeated over and over in partner files, so parse_length keeps the results
+in a bounded LRU cache and most rows only cost a cache lookup. normalize_lengths converts a whole column of a chunk at
+once and only parses each distinct value in the chunk one time.
+
+To support a new unit, add its spellings to UNITS with the number of feet in one of that unit.
+
+"""
+
+import re
+from functools import lru_cache
+
+# Number of feet in one of every supported unit. Units are matched case insensitively.
+FEET = 1.0
+INCHES = 1 / 12
+METERS = 3.28084
+
+UNITS = {
+    '': FEET,
+    'ft': FEET,
+    'foot': FEET,
+    'feet': FEET,
+    "'": FEET,
+    '’': FEET,
+    '′': FEET,
+    'in': INCHES,
+    'inch': INCHES,
+    'inches': INCHES,
+    '"': INCHES,
+    '”': INCHES,
+    '″': INCHES,
+    'm': METERS,
+    'meter': METERS,
+    'meters': METERS,
+    'metre': METERS,
+    'metres': METERS,
+}
+
+# Maximum number of distinct length values kept by the parse_length cache.
+LENGTH_CACHE_SIZE = 4096
+
+# A length is one or more number and unit pairs, for example 32' 6". Decimal commas are accepted as well.
+PART_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*([^\d\s.,]*)")
+
+
+class InvalidLength(ValueError):
+    pass
+
+
+@lru_cache(maxsize=LENGTH_CACHE_SIZE)
+def parse_length(value):
+    """Converts a vehicle length such as 28 feet or 7.5 m to a whole number of feet.
+
+        Returns:
+            The length in feet, rounded to the nearest foot.
+
+        """
+    if not _is_length(value):
+        raise InvalidLength(f"invalid vehicle length: {value!r}")
+
+    feet = 0.0
+    for number, unit in PART_PATTERN.findall(value):
+        multiplier = UNITS.get(unit.lower())
+        if multiplier is None:
+            raise InvalidLength(f"unknown unit {unit!r} in vehicle length: {value!r}")
+        feet += float(number.replace(',', '.')) * multiplier
+
+    return int(feet + 0.5)
+
+
+def _is_length(value):
+    # The pairs are matched one at a time, so a malformed value takes linear time instead of making a single pattern
+    # for the whole value backtrack through every way of splitting its digits. Only whitespace may come between the
+    # pairs, and a unit may end with a '.', as in 40 ft.
+    position = 0
+    for part in PART_PATTERN.finditer(value):
+        if value[position:part.start()].strip():
+            return False
+        position = part.end()
+        if value.startswith('.', position):
+            position += 1
+    return position > 0 and not value[position:].strip()
+
+
+def normalize_lengths(values):
+    """Converts a column of vehicle lengths, parsing every distinct value only once.
+
+        Returns:
+            A list with the length in feet of every value.
+
+        """
+    lengths = {value: parse_length(value) for value in set(values)}
+    return [lengths[value] for value in values]
@@ -0,0 +1,125 @@
+"""
+
+locking.py contains the logic that lets several outdoorsy processes upload to the same database at once, used by
+--concurrent.
+
+SQL Lite allows one writer at a time. A connection that finds the database locked waits for up to BUSY_TIMEOUT seconds
+(the busy timeout set by get_connection in database.py) and then fails with "database is locked", so two large uploads
+to the same database used to fail whenever one of them waited too long. With --concurrent:
+
+- every batch is written while holding WriteLock, an advisory lock on a file next to the database (customers.db.lock
+  for customers.db). Writers waiting for the lock are queued by the operating system and wait for as long as needed
+  instead of failing, and only the writing of a batch is serialized: every process reads, parses and normalizes its
+  next batch while the others are writing, so several uploads together run close to the combined speed of the
+  parsers until the disk becomes the limit
+- the database write lock is taken with BEGIN IMMEDIATE at the start of the batch, retried with exponential backoff
+  (see begin_immediate) when a writer that isn't using the lock file, such as an upload without --concurrent, holds
+  it for longer than the busy timeout. Taking it at the start means a batch never fails half way through because of
+  another writer
+
+The database is in WAL mode, so readers such as outdoorsy -v and outdoorsy serve never wait for a writer and always
+see the last committed batch.
+
+The lock file uses fcntl.flock, or msvcrt.locking on Windows. Where neither is available, the lock file isn't used and
+writers rely on the busy timeout and retries alone.
+
+"""
+
+import os
+import random
+import sqlite3
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+LOCK_SUFFIX = '.lock'
+
+# Number of times BEGIN IMMEDIATE is retried after the busy timeout ran out, and the first and longest waits between
+# the retries in seconds. The wait doubles after every retry, with some jitter so waiting writers don't retry together.
+BEGIN_RETRIES = 8
+BACKOFF_SECONDS = 0.1
+MAX_BACKOFF_SECONDS = 5.0
+
+
+def lock_path(db_path):
+    return os.path.abspath(db_path) + LOCK_SUFFIX
+
+
+class WriteLock:
+    """A cross-process lock on the lock file of a database, held while a batch is written. The lock is reentrant within
+        one WriteLock, so a transaction started while the lock is held doesn't wait for itself."""
+
+    def __init__(self, db_path="customers.db"):
+        self.path = lock_path(db_path)
+        self._file = None
+        self._depth = 0
+
+    def acquire(self):
+        self._depth += 1
+        if self._depth > 1:
+            return
+
+        self._file = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                while True:
+                    try:
+                        # LK_LOCK gives up after trying for 10 seconds, in which case it is tried again.
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+        except BaseException:
+            self._depth -= 1
+            self._file.close()
+            self._file = None
+            raise
+
+    def release(self):
+        self._depth -= 1
+        if self._depth > 0:
+            return
+
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        elif msvcrt is not None:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def begin_immediate(connection, retries=BEGIN_RETRIES, backoff=BACKOFF_SECONDS):
+    """Starts a transaction holding the database write lock, retrying with exponential backoff while the database is
+        locked by another writer."""
+    for attempt in range(retries + 1):
+        try:
+            connection.execute("BEGIN IMMEDIATE;")
+            return
+        except sqlite3.OperationalError as error:
+            if not is_busy(error) or attempt == retries:
+                raise
+        time.sleep(min(backoff * 2 ** attempt, MAX_BACKOFF_SECONDS) * random.uniform(0.5, 1.0))
+
+
+def is_busy(error):
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
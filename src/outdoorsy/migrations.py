@@ -0,0 +1,83 @@
+"""
+
+migrations.py contains the runner that upgrades the schema of a customers database in place. It is used by
+create_table in database.py, which defines the migrations themselves (see MIGRATIONS there).
+
+Every migration has a version number and is applied once, in order. The schema_version table records the version and
+time of every migration applied to a database, so opening a database created by an older version of outdoorsy
+applies only the migrations it is missing, and opening an up to date database only reads schema_version.
+
+Each migration runs in its own BEGIN IMMEDIATE transaction together with its schema_version row, so a migration that
+fails leaves the database at the previous version, and two processes opening the same database at once don't apply
+a migration twice: the second one waits for the write lock and then finds the migration already recorded.
+
+To add a migration, add a function making the change to database.py and a Migration with the next version to
+MIGRATIONS. Migrations already released must never be changed, since databases that applied them won't run them
+again.
+
+"""
+
+from collections import namedtuple
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply'])
+
+SCHEMA_VERSION_SQL = '''
+            CREATE TABLE IF NOT EXISTS "schema_version" (
+	"version" INTEGER PRIMARY KEY,
+	"description" TEXT,
+	"applied_at" TEXT DEFAULT CURRENT_TIMESTAMP
+); '''
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+def schema_version(connection):
+    """Returns the version of the last migration applied to the database, or 0 if none have been."""
+    if not table_exists(connection, 'schema_version'):
+        return 0
+    return connection.execute("SELECT max(version) FROM schema_version;").fetchone()[0] or 0
+
+
+def migrate(connection, migrations):
+    """Applies the migrations newer than the database's schema version, in order.
+
+        Raises UnsupportedSchema if the database was upgraded by a newer version of outdoorsy.
+
+        Returns:
+            The list of the versions applied.
+
+        """
+    latest = max(migration.version for migration in migrations)
+    current = schema_version(connection)
+    if current > latest:
+        raise UnsupportedSchema(f"the database has schema version {current}, this version of outdoorsy supports up "
+                                f"to version {latest}. Please upgrade outdoorsy.")
+    if current == latest:
+        return []
+
+    connection.execute(SCHEMA_VERSION_SQL)
+    applied = []
+    for migration in sorted(migrations, key=lambda migration: migration.version):
+        if migration.version <= current:
+            continue
+        connection.execute("BEGIN IMMEDIATE;")
+        try:
+            # Another process may have applied the migration while this one waited for the write lock.
+            if schema_version(connection) < migration.version:
+                migration.apply(connection)
+                connection.execute("INSERT INTO schema_version (version, description) VALUES (?, ?);",
+                                   (migration.version, migration.description))
+                applied.append(migration.version)
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    return applied
+
+
+def table_exists(connection, table_name):
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;"
+    return connection.execute(sql, (table_name,)).fetchone() is not None
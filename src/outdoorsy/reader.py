@@ -0,0 +1,265 @@
+"""
+
+reader.py contains the logic to read the records of an uploaded file and to detect the file's delimiter.
+
+iter_records memory maps the file instead of reading it through a text file object and csv.reader. Every line is
+found with a single search of the mapped file, decoded once and split on the delimiter, which avoids most of the
+copies and per-row objects of the csv module. Lines containing a double quote may have quoted values, so only those
+lines are parsed with csv.reader. A quoted value can contain line breaks, in which case csv.reader is handed the
+following lines until the record is complete. has_multiline_records tells whether a file has such values, since a
+record spanning several lines can't be found from the middle of the file (see _plan_tasks in ingest.py).
+
+sniff_delimiter reads the start of a file and picks the delimiter from DELIMITERS that splits every line into the
+same number of fields, so -d doesn't need to be given when uploading a file. detect_delimiter does the same for lines
+that have already been read, such as the first lines read from stdin.
+
+parse_line splits one line the same way iter_records does, for records read a line at a time from a stream.
+
+Files compressed with gzip, bz2 or xz are detected from their first bytes (see COMPRESSION_MAGIC) and decompressed
+while they are read with the gzip, bz2 and lzma modules, without writing a decompressed copy. A compressed file can't
+be memory mapped or read from the middle, so iter_records reads it line by line from the decompressed stream, and the
+byte offsets it yields (used by checkpoints) are offsets in the decompressed data.
+
+The csv, mmap and decompression modules are imported inside the functions using them, so that cli.py can import
+DELIMITERS without slowing down outdoorsy --version and outdoorsy -h.
+
+"""
+
+import os
+import re
+from itertools import chain
+
+DELIMITERS = {
+    'comma': ',',
+    'pipe': '|',
+    'tab': '\t',
+    'semicolon': ';',
+}
+
+# Number of bytes read from the start of a file by sniff_delimiter.
+SNIFF_BYTES = 64 * 1024
+
+# Number of fields in every record of an uploaded file.
+FIELD_COUNT = 6
+
+# Number of rows handed to executemany (and committed together) when loading a file.
+DEFAULT_BATCH_SIZE = 5000
+
+# Number of seconds after which the rows read from stdin or a followed file are committed, even if there are fewer
+# than the batch size.
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+# The first bytes of files compressed by gzip, bz2 and xz, and the module decompressing them.
+COMPRESSION_MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'BZh': 'bz2',
+    b'\xfd7zXZ\x00': 'lzma',
+}
+
+
+class DelimiterNotDetected(Exception):
+    pass
+
+
+def detect_compression(path):
+    """Returns the name of the module decompressing the file (gzip, bz2 or lzma), or None if it isn't compressed."""
+    with open(path, 'rb') as file:
+        start = file.read(max(len(magic) for magic in COMPRESSION_MAGIC))
+    for magic, module in COMPRESSION_MAGIC.items():
+        if start.startswith(magic):
+            return module
+    return None
+
+
+def open_records(path, compression=None):
+    """Opens a file for reading in binary mode, decompressing it while it is read if compression is given."""
+    if compression is None:
+        return open(path, 'rb')
+    import importlib
+    return importlib.import_module(compression).open(path, 'rb')
+
+
+def sniff_delimiter(path, sample_bytes=SNIFF_BYTES):
+    """Detects the delimiter of a file from the lines in its first sample_bytes.
+
+        Returns:
+            The delimiter character.
+
+        """
+    with open_records(path, detect_compression(path)) as file:
+        sample = file.read(sample_bytes)
+    lines = sample.decode('utf-8', errors='ignore').splitlines()
+    if len(sample) == sample_bytes:
+        # The last line may have been cut off part way through.
+        lines = lines[:-1]
+    return detect_delimiter(lines, path)
+
+
+def detect_delimiter(lines, name):
+    """Detects the delimiter of lines already read, name being given to DelimiterNotDetected if it can't be."""
+    import csv
+
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        raise DelimiterNotDetected(name)
+
+    # A delimiter that splits every line into the expected number of fields wins, then the one splitting most lines
+    # into the expected number (the other lines being rows that will be rejected), otherwise the one that splits every
+    # line into the same number of fields.
+    candidates = []
+    for delimiter in DELIMITERS.values():
+        counts = [len(next(csv.reader([line], delimiter=delimiter))) for line in lines]
+        expected = counts.count(FIELD_COUNT)
+        if expected == len(counts):
+            candidates.append((0, -expected, delimiter))
+        elif expected > len(counts) / 2:
+            candidates.append((1, -expected, delimiter))
+        elif len(set(counts)) == 1 and counts[0] != 1:
+            candidates.append((2, 0, delimiter))
+    if not candidates:
+        raise DelimiterNotDetected(name)
+
+    return min(candidates)[2]
+
+
+def iter_records(path, delimiter, start=0, end=None):
+    """Reads the records starting between the byte offsets start and end of a file.
+
+        A record belongs to the range it starts in, so when start isn't at the beginning of a line the partial line is
+        skipped (it is read by the range before it) and the record crossing end is read completely.
+
+        Yields:
+            A tuple of the byte offset just after the record and the list of the record's fields.
+
+        """
+    compression = detect_compression(path)
+    if compression is not None:
+        yield from _iter_compressed_records(path, delimiter, compression, start, end)
+        return
+
+    import csv
+    import mmap
+
+    size = os.path.getsize(path)
+    end = size if end is None else min(end, size)
+    if start >= end:
+        return
+
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        position = start
+        if start:
+            newline = mapped.find(b'\n', start - 1)
+            position = size if newline == -1 else newline + 1
+
+        find = mapped.find
+
+        def following_lines():
+            # The lines after position, read by csv.reader while a quoted value continues on the next line.
+            nonlocal position
+            while position < size:
+                newline = find(b'\n', position)
+                next_position = size if newline == -1 else newline + 1
+                line = mapped[position:next_position]
+                position = next_position
+                yield line.decode('utf-8')
+
+        while position < end:
+            newline = find(b'\n', position)
+            next_position = size if newline == -1 else newline + 1
+            line = mapped[position:next_position]
+            record = line.rstrip(b'\r\n')
+            position = next_position
+            if not record:
+                # Blank lines are skipped, the same as csv.DictReader does.
+                continue
+
+            if b'"' in record:
+                # Reading the fields moves position past the last line of the record, so it is read after them.
+                fields = next(csv.reader(chain([line.decode('utf-8')], following_lines()), delimiter=delimiter))
+                yield position, fields
+            else:
+                yield position, record.decode('utf-8').split(delimiter)
+
+
+def _iter_compressed_records(path, delimiter, compression, start, end):
+    with open_records(path, compression) as file:
+        position = 0
+        if start:
+            # Seeking a compressed file decompresses everything before the offset.
+            file.seek(start - 1)
+            position = start - 1 + len(file.readline())
+
+        def following_lines():
+            nonlocal position
+            for line in file:
+                position += len(line)
+                yield line.decode('utf-8')
+
+        for line in file:
+            if end is not None and position >= end:
+                return
+            position += len(line)
+            text = line.decode('utf-8')
+            if '"' in text:
+                import csv
+                fields = next(csv.reader(chain([text], following_lines()), delimiter=delimiter))
+                yield position, fields
+                continue
+            fields = parse_line(text, delimiter)
+            if fields is not None:
+                yield position, fields
+
+
+def has_multiline_records(path, delimiter):
+    """Returns True if a quoted value of the file contains a line break. Only values starting with a quote are quoted,
+        so a quote inside a value, as in 32' 6", doesn't count."""
+    import mmap
+
+    if not os.path.getsize(path):
+        return False
+    pattern = re.compile(rb'(?:^|' + re.escape(delimiter.encode('utf-8')) + rb')"[^"]*\n', re.MULTILINE)
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return pattern.search(mapped) is not None
+
+
+def line_numbers(path, offsets, block_size=1024 * 1024):
+    """Finds the line numbers of the records ending at the byte offsets yielded by iter_records, counting the lines of
+        the file once however many offsets there are.
+
+        Returns:
+            A dict of the line number of every offset.
+
+        """
+    targets = sorted(set(offsets))
+    numbers = {}
+    index = 0
+    with open_records(path, detect_compression(path)) as file:
+        position = 0
+        newlines = 0
+        while index < len(targets) and (block := file.read(block_size)):
+            block_end = position + len(block)
+            # A record's line number is one more than the number of newlines before its last byte.
+            while index < len(targets) and targets[index] - 1 < block_end:
+                numbers[targets[index]] = newlines + block.count(b'\n', 0, targets[index] - 1 - position) + 1
+                index += 1
+            newlines += block.count(b'\n')
+            position = block_end
+
+    return numbers
+
+
+def parse_line(text, delimiter):
+    """Splits a line read from a stream into its fields, the same way iter_records does.
+
+        Returns:
+            The list of the line's fields, or None for a blank line.
+
+        """
+    text = text.rstrip('\r\n')
+    if not text:
+        return None
+    if '"' in text:
+        import csv
+        return next(csv.reader([text], delimiter=delimiter))
+    return text.split(delimiter)
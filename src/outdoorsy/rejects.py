@@ -0,0 +1,125 @@
+"""
+
+rejects.py contains the per row validation used by --reject-file and --validate-only.
+
+Without --reject-file, a record with the wrong number of fields or a vehicle length that can't be read stops an upload.
+With it, normalize_rows leaves those records out and they are written to the reject file, a csv file with the file
+and line number of every rejected record, the reason it was rejected and its fields, while the other rows keep
+loading. The records are read in chunks and in parallel, so only their byte offsets are known while they are read;
+RejectFile keeps the rejected records of a file until the file has been read and then finds all their line numbers
+with a single pass over the file (see line_numbers in reader.py). Records read from stdin or a followed file are
+written with their line number straight away.
+
+validate_file reads and checks a file the same way an upload does, but without opening the database, so a large file
+can be checked at the speed of the parser before it is uploaded.
+
+"""
+
+import csv
+import time
+from collections import namedtuple
+from itertools import islice
+from .database import normalize_rows
+from .reader import iter_records, sniff_delimiter, line_numbers, DEFAULT_BATCH_SIZE
+from .stats import STATS
+
+REJECT_COLUMNS = ['file', 'line', 'reason', 'fields']
+
+# Number of rejected records kept to be displayed after an upload or validation.
+SAMPLE_SIZE = 10
+
+Reject = namedtuple('Reject', ['path', 'line', 'reason', 'fields'])
+
+ValidationResult = namedtuple('ValidationResult', ['path', 'rows', 'rejected', 'seconds'])
+
+
+class RejectFile:
+    """Collects the rejected records of an upload and writes them to a csv file at path. Without a path, only the number
+        of rejected records and the first SAMPLE_SIZE of them are kept."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.count = 0
+        self.samples = []
+        self._pending = {}
+        self._file = None
+        self._writer = None
+        if path:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(REJECT_COLUMNS)
+
+    def add(self, path, byte_offset, reason, fields):
+        """Adds a record read by iter_records, its line number being found when the file is flushed."""
+        self.count += 1
+        STATS.count('rows_rejected')
+        if self._writer is not None or self.count <= SAMPLE_SIZE:
+            self._pending.setdefault(path, []).append((byte_offset, reason, fields))
+
+    def add_chunk(self, path, chunk, rejected):
+        """Adds the records of a chunk of iter_records that normalize_rows rejected."""
+        for position, reason in rejected:
+            byte_offset, fields = chunk[position]
+            self.add(path, byte_offset, reason, fields)
+
+    def add_line(self, path, line, reason, fields):
+        """Adds a record whose line number is already known."""
+        self.count += 1
+        STATS.count('rows_rejected')
+        self._write(Reject(path, line, reason, fields))
+        if self._file is not None:
+            # Streams can run for a long time, so their rejected records are written out straight away.
+            self._file.flush()
+
+    def flush(self, path):
+        """Writes the rejected records of a file that has been read completely."""
+        pending = self._pending.pop(path, None)
+        if not pending:
+            return
+        numbers = line_numbers(path, [byte_offset for byte_offset, _, _ in pending])
+        for byte_offset, reason, fields in sorted(pending, key=lambda reject: reject[0]):
+            self._write(Reject(path, numbers.get(byte_offset), reason, fields))
+
+    def _write(self, reject):
+        if len(self.samples) < SAMPLE_SIZE:
+            self.samples.append(reject)
+        if self._writer is not None:
+            self._writer.writerow([reject.path, reject.line, reject.reason, *reject.fields])
+
+    def close(self):
+        for path in list(self._pending):
+            self.flush(path)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def validate_file(path, delimiter=None, rejects=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Reads and checks every record of a file without uploading it, adding the invalid records to rejects.
+
+        Returns:
+            A ValidationResult with the number of records read and rejected.
+
+        """
+    started = time.perf_counter()
+    rejects = rejects if rejects is not None else RejectFile()
+    delimiter = delimiter or sniff_delimiter(path)
+    rows = 0
+    rejected_count = 0
+    records = iter_records(path, delimiter)
+    while chunk := list(islice(records, batch_size)):
+        rejected = []
+        with STATS.stage('normalize'):
+            normalize_rows([fields for _, fields in chunk], rejected)
+        rejects.add_chunk(path, chunk, rejected)
+        rows += len(chunk)
+        rejected_count += len(rejected)
+    rejects.flush(path)
+
+    return ValidationResult(path, rows, rejected_count, time.perf_counter() - started)
@@ -0,0 +1,167 @@
+"""
+
+render_cache.py contains the on-disk cache of rendered views used by the -v option. Viewing the same sort order, filters
+and page again when nothing has been uploaded in between prints the table saved the first time instead of reading
+and rendering the rows again.
+
+The cache is a directory next to the database (customers.cache for customers.db) with one file for every cached view.
+Every file starts with a header line holding the view's key and the database's change counter when it was rendered
+(see get_change_counter in database.py), followed by the rendered output. A cached view is only used when the change
+counter still matches, so any upload invalidates every cached view.
+
+Views are written to the cache while they are printed, through a CachingWriter, and copied from the cache in blocks,
+so caching doesn't hold a large table in memory. The cache is kept under max_bytes by removing the least recently used
+files, a file's modification time being updated every time it is used. Views larger than half of max_bytes aren't
+cached. If the cache directory can't be written to, views are displayed without caching.
+
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+# Maximum total size of the cached views of a database.
+CACHE_BYTES = 256 * 1024 * 1024
+
+
+def cache_directory(db_path):
+    return os.path.splitext(os.path.abspath(db_path))[0] + ".cache"
+
+
+def cache_key(*values):
+    return json.dumps(values, separators=(',', ':'))
+
+
+class RenderCache:
+    def __init__(self, db_path="customers.db", max_bytes=CACHE_BYTES):
+        self.directory = cache_directory(db_path)
+        self.max_bytes = max_bytes
+
+    def get(self, key, version):
+        """Returns the rendered view saved for key, or None if there isn't one for this version of the database."""
+        file = self.open(key, version)
+        if file is None:
+            return None
+        with file:
+            return file.read()
+
+    def copy(self, key, version, output):
+        """Writes the rendered view saved for key to output.
+
+            Returns:
+                True if there was one for this version of the database.
+
+            """
+        file = self.open(key, version)
+        if file is None:
+            return False
+        with file:
+            shutil.copyfileobj(file, output)
+        return True
+
+    def open(self, key, version):
+        path = self._path(key)
+        try:
+            file = open(path, encoding='utf-8', newline='')
+        except OSError:
+            return None
+        try:
+            header = json.loads(file.readline())
+            if header['key'] != key or header['version'] != version:
+                file.close()
+                return None
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            file.close()
+            return None
+
+        return file
+
+    def put(self, key, version, text):
+        writer = self.writer(key, version)
+        writer.write(text)
+        writer.commit()
+
+    def writer(self, key, version, output=None):
+        """Returns a CachingWriter saving everything written to it as the view for key, and writing it to output."""
+        return CachingWriter(self, key, version, output)
+
+    def evict(self):
+        """Removes the least recently used views until the cache is no larger than max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.view'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.view')
+
+
+class CachingWriter:
+    """Writes to output (if given) and to a temporary file in the cache, which commit turns into the cached view.
+        Caching is given up if the view gets larger than half of the cache or the file can't be written."""
+
+    def __init__(self, cache, key, version, output=None):
+        self.cache = cache
+        self.output = output
+        self.path = cache._path(key)
+        self.temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        self.max_bytes = cache.max_bytes // 2
+        self.size = 0
+        try:
+            os.makedirs(cache.directory, exist_ok=True)
+            self.file = open(self.temporary_path, 'w', encoding='utf-8', newline='')
+            self.file.write(json.dumps({'key': key, 'version': version}) + "\n")
+        except OSError:
+            self.file = None
+
+    def write(self, text):
+        if self.output is not None:
+            self.output.write(text)
+        if self.file is None:
+            return
+        self.size += len(text)
+        try:
+            if self.size > self.max_bytes:
+                raise OSError("the view is too large to cache")
+            self.file.write(text)
+        except OSError:
+            self.discard()
+
+    def flush(self):
+        if self.output is not None:
+            self.output.flush()
+
+    def commit(self):
+        if self.file is None:
+            return
+        try:
+            self.file.close()
+            # Replacing the file in one step means another process never reads a partly written view.
+            os.replace(self.temporary_path, self.path)
+            self.file = None
+            self.cache.evict()
+        except OSError:
+            self.discard()
+
+    def discard(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        try:
+            os.remove(self.temporary_path)
+        except OSError:
+            pass
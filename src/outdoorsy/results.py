@@ -0,0 +1,178 @@
+"""
+
+results.py contains ResultSet, the compact container of customer rows returned by get_entries.
+
+A list of sqlite3.Row objects costs a Row, a tuple and a new string or integer object for every value of every row,
+which is most of the memory used by a large result. ResultSet stores the rows by column instead:
+
+- first_name, last_name and vehicle_name are lists of interned strings, so repeated names are stored once
+- email is a list of strings, since every customer has their own
+- vehicle_type is dictionary encoded, an array of one uint32 code for every row indexing vehicle_types
+- vehicle_length is an array of int32
+
+Rows are only built when they are used, as ResultRow tuples which can be indexed by position or by column name like
+sqlite3.Row. Slicing returns a ResultSet sharing nothing with the original, and sort reorders the columns in place
+without building the rows.
+
+"""
+
+import sys
+from array import array
+from itertools import islice
+
+COLUMNS = ('first_name', 'last_name', 'email', 'vehicle_type', 'vehicle_name', 'vehicle_length')
+COLUMN_POSITIONS = {name: position for position, name in enumerate(COLUMNS)}
+
+CODE_TYPE = 'I'
+LENGTH_TYPE = 'i'
+
+# Number of rows added to the columns at a time by ResultSet.extend.
+EXTEND_BATCH_SIZE = 1000
+
+
+class ResultRow(tuple):
+    """A customer row, indexed by position or by column name."""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = COLUMN_POSITIONS[key]
+            except KeyError:
+                raise IndexError(f"No item with that key: {key}") from None
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(COLUMNS)
+
+
+class ResultSet:
+    """A column-oriented list of customer rows."""
+    __slots__ = ('_first_names', '_last_names', '_emails', '_type_codes', '_vehicle_types', '_type_positions',
+                 '_vehicle_names', '_lengths')
+
+    def __init__(self, rows=()):
+        self._first_names = []
+        self._last_names = []
+        self._emails = []
+        self._type_codes = array(CODE_TYPE)
+        self._vehicle_types = []
+        self._type_positions = {}
+        self._vehicle_names = []
+        self._lengths = array(LENGTH_TYPE)
+        self.extend(rows)
+
+    def append(self, row):
+        self.extend([row])
+
+    def extend(self, rows):
+        """Adds rows, read a batch at a time and added a column at a time."""
+        rows = iter(rows)
+        while batch := list(islice(rows, EXTEND_BATCH_SIZE)):
+            self._extend_columns(list(zip(*batch))[:len(COLUMNS)])
+
+    def _extend_columns(self, columns):
+        first_names, last_names, emails, vehicle_types, vehicle_names, lengths = columns
+        self._first_names.extend(map(_intern, first_names))
+        self._last_names.extend(map(_intern, last_names))
+        self._emails.extend(emails)
+        self._type_codes.extend(map(self._type_code, vehicle_types))
+        self._vehicle_names.extend(map(_intern, vehicle_names))
+        count = len(self._lengths)
+        try:
+            self._lengths.extend(lengths)
+        except (TypeError, OverflowError):
+            # Lengths that aren't 32 bit integers (from a database written before lengths were normalized) are kept
+            # in a list instead.
+            self._lengths = list(self._lengths[:count])
+            self._lengths.extend(lengths)
+
+    def _type_code(self, vehicle_type):
+        code = self._type_positions.get(vehicle_type)
+        if code is None:
+            code = self._type_positions[vehicle_type] = len(self._vehicle_types)
+            self._vehicle_types.append(vehicle_type)
+        return code
+
+    def column(self, name):
+        """Returns the values of one column, without building the rows. The list or array returned must not be
+            modified."""
+        if name == 'vehicle_type':
+            return [self._vehicle_types[code] for code in self._type_codes]
+        return self._columns()[COLUMN_POSITIONS[name]]
+
+    @property
+    def vehicle_types(self):
+        """The distinct vehicle types, in the order they were first seen."""
+        return list(self._vehicle_types)
+
+    def sort(self, *columns, reverse=False):
+        """Sorts the rows in place by the values of the given columns, like list.sort. The sort is stable."""
+        if not columns:
+            columns = COLUMNS
+        keys = [self.column(name) for name in columns]
+        if len(keys) == 1:
+            key = keys[0].__getitem__
+        else:
+            def key(position):
+                return tuple(values[position] for values in keys)
+        order = sorted(range(len(self)), key=key, reverse=reverse)
+        self._reorder(order)
+
+    def _reorder(self, order):
+        self._first_names = [self._first_names[position] for position in order]
+        self._last_names = [self._last_names[position] for position in order]
+        self._emails = [self._emails[position] for position in order]
+        self._type_codes = array(CODE_TYPE, [self._type_codes[position] for position in order])
+        self._vehicle_names = [self._vehicle_names[position] for position in order]
+        lengths = [self._lengths[position] for position in order]
+        self._lengths = array(LENGTH_TYPE, lengths) if isinstance(self._lengths, array) else lengths
+
+    def _columns(self):
+        return (self._first_names, self._last_names, self._emails, self._type_codes, self._vehicle_names,
+                self._lengths)
+
+    def _row(self, position):
+        return ResultRow((self._first_names[position], self._last_names[position], self._emails[position],
+                          self._vehicle_types[self._type_codes[position]], self._vehicle_names[position],
+                          self._lengths[position]))
+
+    def __len__(self):
+        return len(self._emails)
+
+    def __iter__(self):
+        vehicle_types = self._vehicle_types
+        for first_name, last_name, email, code, vehicle_name, vehicle_length in zip(*self._columns()):
+            yield ResultRow((first_name, last_name, email, vehicle_types[code], vehicle_name, vehicle_length))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            result = ResultSet()
+            result._first_names = self._first_names[index]
+            result._last_names = self._last_names[index]
+            result._emails = self._emails[index]
+            result._type_codes = self._type_codes[index]
+            result._vehicle_types = list(self._vehicle_types)
+            result._type_positions = dict(self._type_positions)
+            result._vehicle_names = self._vehicle_names[index]
+            result._lengths = self._lengths[index]
+            return result
+
+        position = range(len(self))[index]
+        return self._row(position)
+
+    def __eq__(self, other):
+        if not isinstance(other, (ResultSet, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(row == tuple(other_row) for row, other_row in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        rows = ", ".join(repr(tuple(row)) for row in islice(self, 3))
+        more = ", ..." if len(self) > 3 else ""
+        return f"ResultSet([{rows}{more}], rows={len(self)})"
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
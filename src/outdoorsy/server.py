@@ -0,0 +1,353 @@
+"""
+
+server.py contains the outdoorsy serve mode, a long running process answering requests from the outdoorsy command
+line tool (run with --server) so that repeated views don't pay for starting Python, importing outdoorsy, opening the
+database and reading the rows every time.
+
+The server listens on a Unix socket or a localhost TCP port. Every request and response is one line of JSON, and a
+client can send any number of requests on one connection:
+
+- {"command": "view", "sort": "name", "limit": 100, "page": null, "after": null, "filters": {...}} returns the rows
+  and the cursor of the next page, see Filters in filters.py for the filter names. Views return at most MAX_PAGE_SIZE
+  rows, and DEFAULT_PAGE_SIZE rows when no limit is given, so no request makes the server hold a whole large table
+- {"command": "summary"} returns the vehicle type summary
+- {"command": "ingest", "paths": [...], "delimiter": ",", ...} queues an upload and returns its job id
+- {"command": "job", "id": 1} returns the state and output of an upload
+- {"command": "status"} returns the server's uptime, cache and job counters
+
+Every response has "ok": true, or "ok": false and an "error" message.
+
+All database work runs on one thread (Server.executor), which owns the server's connection, so the event loop is
+never blocked by SQLite and the connection is never used by two threads at once. View and summary responses are kept
+in an LRU cache of encoded responses, so a repeated request is answered without touching the database. The cache is
+cleared whenever PRAGMA data_version shows another connection committed a change, which includes the uploads run by
+the server.
+
+Uploads are run one at a time from a queue, each in its own outdoorsy process. SQL Lite in WAL mode lets the server
+keep answering views from its connection while an upload is being written.
+
+The protocol has no authentication and an upload reads any file the server can, so the server only listens on a
+loopback address unless it is started with --allow-remote.
+
+"""
+
+import asyncio
+import ipaddress
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .database import create_table, get_connection, iter_entries, next_cursor, get_summary, FIELD_NAMES
+from .filters import Filters
+from .sorting import InvalidSortOrder, InvalidCursor
+
+DEFAULT_HOST = '127.0.0.1'
+
+# Number of rows returned by a view without a limit, and the largest limit accepted.
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# The filters given as whole numbers of feet, every other filter is a string.
+LENGTH_FILTERS = ('min_length', 'max_length')
+
+# Maximum number of responses, and of rows in those responses, kept in the view cache.
+CACHE_SIZE = 256
+CACHE_ROWS = 1000000
+
+# Maximum length of a request line.
+REQUEST_LIMIT = 1024 * 1024
+
+# Number of finished upload jobs kept for the job command.
+JOB_HISTORY = 100
+
+
+class RequestError(Exception):
+    pass
+
+
+class ResponseCache:
+    """An LRU cache of encoded responses, bounded by the number of responses and the number of rows in them."""
+
+    def __init__(self, max_entries=CACHE_SIZE, max_rows=CACHE_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, response, rows):
+        if rows > self.max_rows:
+            return
+        self._entries[key] = (response, rows)
+        self.rows += rows
+        while len(self._entries) > self.max_entries or self.rows > self.max_rows:
+            _, (_, evicted_rows) = self._entries.popitem(last=False)
+            self.rows -= evicted_rows
+
+    def clear(self):
+        self._entries.clear()
+        self.rows = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Server:
+    def __init__(self, db_path="customers.db", cache=None):
+        self.db_path = db_path
+        self.cache = cache or ResponseCache()
+        self.started = time.time()
+        self.requests = 0
+        self.data_version = None
+        self.jobs = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outdoorsy-database')
+        self._job_queue = None
+        self._next_job_id = 1
+
+    async def start(self, socket_path=None, host=DEFAULT_HOST, port=None):
+        self._job_queue = asyncio.Queue()
+        await self._run_in_database(create_table, self.db_path)
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle, socket_path, limit=REQUEST_LIMIT)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, limit=REQUEST_LIMIT)
+        asyncio.get_running_loop().create_task(self._run_jobs())
+        return server
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                writer.write(await self.respond(line))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # ValueError is raised by readline for a line longer than REQUEST_LIMIT.
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, line):
+        """Answers one request line.
+
+            Returns:
+                The encoded response line.
+
+            """
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("requests must be JSON objects")
+            command = request.get('command')
+            if command in ('view', 'summary'):
+                return await self._cached(request)
+            elif command == 'ingest':
+                response = self._queue_job(request)
+            elif command == 'job':
+                response = self._job(request)
+            elif command == 'status':
+                response = self._status()
+            else:
+                raise RequestError(f"unknown command: {command}")
+        except (RequestError, InvalidSortOrder, InvalidCursor, ValueError, TypeError) as error:
+            response = {'ok': False, 'error': f"{type(error).__name__}: {error}"}
+
+        return _encode(response)
+
+    async def _cached(self, request):
+        await self._run_in_database(self._check_data_version)
+        key = json.dumps(request, sort_keys=True)
+        response = self.cache.get(key)
+        if response is None:
+            if request['command'] == 'view':
+                result = await self._run_in_database(self._view, request)
+            else:
+                result = await self._run_in_database(self._summary)
+            response = _encode({'ok': True, **result})
+            self.cache.put(key, response, len(result['rows']))
+
+        return response
+
+    def _check_data_version(self):
+        # data_version changes when any other connection commits to the database.
+        version = get_connection(self.db_path).execute("PRAGMA data_version;").fetchone()[0]
+        if version != self.data_version:
+            self.data_version = version
+            self.cache.clear()
+
+    def _view(self, request):
+        sort_order = request.get('sort') or 'name'
+        limit = _positive_int(request, 'limit', DEFAULT_PAGE_SIZE)
+        if limit > MAX_PAGE_SIZE:
+            raise RequestError(f"limit can't be more than {MAX_PAGE_SIZE} rows, use the cursor to read the next page")
+        page = _positive_int(request, 'page', None)
+        offset = (page - 1) * limit if page else None
+        for name in ('sort', 'after'):
+            if request.get(name) is not None and not isinstance(request[name], str):
+                raise RequestError(f"{name} must be a string")
+        filters = _filters(request)
+
+        rows = iter_entries(sort_order, self.db_path, limit=limit, offset=offset, after=request.get('after'),
+                            filters=filters)
+        if rows is None:
+            raise RequestError("the database has no customers table, upload a file first")
+        rows = [tuple(row) for row in rows]
+        cursor = next_cursor(sort_order, rows[-1]) if len(rows) == limit else None
+        return {'rows': [row[:len(FIELD_NAMES)] for row in rows], 'cursor': cursor}
+
+    def _summary(self):
+        return {'rows': [list(item) for item in get_summary(self.db_path)]}
+
+    def _queue_job(self, request):
+        paths = request.get('paths')
+        if not paths or not all(isinstance(path, str) for path in paths):
+            raise RequestError("ingest needs a list of paths")
+
+        job = {'id': self._next_job_id, 'state': 'queued', 'paths': paths, 'output': '', 'returncode': None,
+               'options': {name: request.get(name) for name in ('delimiter', 'batch_size', 'upsert', 'force')}}
+        self._next_job_id += 1
+        self.jobs[job['id']] = job
+        while len(self.jobs) > JOB_HISTORY and next(iter(self.jobs.values()))['state'] in ('done', 'failed'):
+            self.jobs.popitem(last=False)
+        self._job_queue.put_nowait(job)
+        return {'ok': True, 'job': job['id']}
+
+    def _job(self, request):
+        job = self.jobs.get(request.get('id'))
+        if job is None:
+            raise RequestError(f"unknown job: {request.get('id')}")
+        return {'ok': True, 'job': job}
+
+    def _status(self):
+        states = [job['state'] for job in self.jobs.values()]
+        return {'ok': True, 'db_path': os.path.abspath(self.db_path), 'pid': os.getpid(),
+                'uptime_seconds': time.time() - self.started, 'requests': self.requests,
+                'cache': {'entries': len(self.cache), 'rows': self.cache.rows, 'hits': self.cache.hits,
+                          'misses': self.cache.misses},
+                'jobs': {state: states.count(state) for state in ('queued', 'running', 'done', 'failed')}}
+
+    async def _run_jobs(self):
+        while True:
+            job = await self._job_queue.get()
+            job['state'] = 'running'
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *_upload_command(job['paths'], self.db_path, **job['options']),
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+                output, _ = await process.communicate()
+            except Exception as error:
+                # A job that can't be started fails on its own, the jobs queued after it still run.
+                job['output'] = f"{type(error).__name__}: {error}"
+                job['state'] = 'failed'
+                continue
+            job['output'] = output.decode('utf-8', errors='replace')
+            job['returncode'] = process.returncode
+            job['state'] = 'done' if process.returncode == 0 else 'failed'
+
+    async def _run_in_database(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+
+def _upload_command(paths, db_path, delimiter=None, batch_size=None, upsert=False, force=False):
+    # The upload runs the same way as outdoorsy -f, with the database directory given to -db. --concurrent lets it
+    # share the database with uploads started from the command line.
+    command = [sys.executable, '-c', 'import outdoorsy; outdoorsy.main()', '-f', *paths,
+               '-db', os.path.dirname(os.path.abspath(db_path)), '--concurrent']
+    if delimiter:
+        command += ['-d', delimiter]
+    if batch_size:
+        command += ['--batch-size', str(batch_size)]
+    if upsert:
+        command.append('--upsert')
+    if force:
+        command.append('--force')
+    return command
+
+
+def _positive_int(request, name, default):
+    value = request.get(name)
+    if value is None:
+        return default
+    # bool is a subclass of int, but true isn't a page size.
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise RequestError(f"{name} must be a positive whole number")
+    return value
+
+
+def _filters(request):
+    filters = request.get('filters')
+    if filters is None:
+        return None
+    if not isinstance(filters, dict):
+        raise RequestError("filters must be an object")
+    unknown = sorted(set(filters) - set(Filters._fields))
+    if unknown:
+        raise RequestError(f"unknown filters: {', '.join(unknown)}, the filters are {', '.join(Filters._fields)}")
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name in LENGTH_FILTERS and (not isinstance(value, int) or isinstance(value, bool)):
+            raise RequestError(f"{name} must be a whole number")
+        if name not in LENGTH_FILTERS and not isinstance(value, str):
+            raise RequestError(f"{name} must be a string")
+    return Filters(**filters) if filters else None
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _encode(response):
+    return json.dumps(response, separators=(',', ':')).encode('utf-8') + b"\n"
+
+
+def serve(db_path="customers.db", socket_path=None, host=DEFAULT_HOST, port=None):
+    """Runs the server until it is interrupted."""
+
+    async def main():
+        server = await Server(db_path).start(socket_path, host, port)
+        address = socket_path or "{}:{}".format(*server.sockets[0].getsockname()[:2])
+        print(f"outdoorsy is serving {os.path.abspath(db_path)} on {address}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def run_server(args):
+    """Runs the server with the arguments parsed by cli.parse_serve_args."""
+    if args.dbpath and not os.path.isdir(args.dbpath):
+        print(f"The path specified for the database path does not exist. Please try again. path: {args.dbpath}")
+        return
+    if not args.socket and not is_loopback(args.host):
+        if not args.allow_remote:
+            print(f"Refusing to listen on {args.host}, which can be reached from other machines. Requests aren't "
+                  f"authenticated and uploads read any file the server can, so add --allow-remote only on a trusted "
+                  f"network.")
+            return
+        print(f"Warning: listening on {args.host} without authentication. Anyone who can reach this address can "
+              f"read the customers and upload any file the server can read.", flush=True)
+    db_path = os.path.join(args.dbpath, "customers.db") if args.dbpath else "customers.db"
+    serve(db_path, args.socket, args.host, args.port)
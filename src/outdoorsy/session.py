@@ -0,0 +1,109 @@
+"""
+
+session.py contains Session, the state an interactive session (run_interactively in app.py) keeps between menu
+choices, so that switching between views doesn't read and render the same rows again.
+
+A Session keeps:
+
+- the selected database and its open connection, so the database path is only asked for once
+- the rows read for every sort order, as the ResultSet returned by get_entries
+- the rendered pages of every sort order, the most recently used PAGE_CACHE_SIZE of them
+
+Views are shown PAGE_SIZE rows at a time. Showing a page that has been shown before only prints the saved table, and
+showing another page of rows that have already been read only renders those rows. Uploads made from the session clear
+everything saved, and the database's change counter (see get_change_counter in database.py) is checked before every
+view, so rows uploaded by another outdoorsy process are shown as well.
+
+"""
+
+import math
+from collections import OrderedDict
+from .database import create_table, get_connection, get_entries, get_change_counter
+
+# Number of rows shown on every page of an interactive view.
+PAGE_SIZE = 50
+
+# Maximum number of rendered pages kept by a session.
+PAGE_CACHE_SIZE = 64
+
+
+class Session:
+    """The state of an interactive session. render is the function rendering rows as a table, format_results in
+        app.py, and upload the function uploading files, upload_files in app.py."""
+
+    def __init__(self, render, upload, page_size=PAGE_SIZE, max_pages=PAGE_CACHE_SIZE):
+        self.render = render
+        self._upload = upload
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.db_path = None
+        self.connection = None
+        self._version = None
+        self._results = {}
+        self._pages = OrderedDict()
+
+    @property
+    def selected(self):
+        return self.db_path is not None
+
+    def select_database(self, db_path="customers.db"):
+        if db_path != self.db_path:
+            self.invalidate()
+        create_table(db_path)
+        self.db_path = db_path
+        self.connection = get_connection(db_path)
+
+    def upload(self, path, delimiter):
+        """Uploads a file to the selected database the same way as outdoorsy -f, so a file already uploaded is
+            skipped instead of being added a second time.
+
+            Returns:
+                The number of rows uploaded, 0 if the file was skipped.
+
+            """
+        before = self._count()
+        try:
+            self._upload([path], delimiter, self.db_path)
+        finally:
+            # Part of the file may have been committed even if the upload failed.
+            self.invalidate()
+        return self._count() - before
+
+    def results(self, sort_order):
+        """Returns every row of the database in sort order, reading them only the first time."""
+        self._check_version()
+        results = self._results.get(sort_order)
+        if results is None:
+            results = self._results[sort_order] = get_entries(sort_order, self.db_path)
+        return results
+
+    def page_count(self, sort_order):
+        return max(1, math.ceil(len(self.results(sort_order)) / self.page_size))
+
+    def render_page(self, sort_order, page):
+        """Returns the rendered table of a page of rows, pages being numbered from 1."""
+        results = self.results(sort_order)
+        key = (sort_order, page)
+        table = self._pages.get(key)
+        if table is None:
+            start = (page - 1) * self.page_size
+            table = self._pages[key] = self.render(results[start:start + self.page_size])
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(key)
+        return table
+
+    def _count(self):
+        return self.connection.execute("SELECT count(*) FROM customers;").fetchone()[0]
+
+    def invalidate(self):
+        self._version = None
+        self._results.clear()
+        self._pages.clear()
+
+    def _check_version(self):
+        version = get_change_counter(self.db_path)
+        if version != self._version or version is None:
+            self.invalidate()
+            self._version = version
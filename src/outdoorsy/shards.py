@@ -0,0 +1,193 @@
+"""
+
+shards.py contains the logic to view and upload to several databases at once, used when -db is given more than one
+path or with --shards.
+
+Viewing several databases (for example one per region) runs the same query on every database concurrently, each with
+its own connection, on a ThreadPoolExecutor. Every database already returns its rows sorted by SQLite using the index
+of the sort order, so the rows are combined with a k-way merge (heapq.merge) on the sort key columns selected by
+iter_entries, without sorting or holding all the rows in memory. Each database is read fetch_size rows at a time,
+with the next batch fetched in the background while the merge consumes the current one.
+
+Rows with the same sort keys in two databases are ordered by the position of the database, so a page cursor holds
+the sort keys and the position of the database of the last row shown (see next_merged_cursor). --limit and --page
+are applied to the merged rows, every database being asked for at most offset + limit rows.
+
+Uploading to several databases partitions the rows by a hash of the email (see shard_of), so a customer always ends
+up in the same database and --upsert keeps working. --shards N creates the databases in N shard-XX directories of the
+-db directory. The rows of every batch are inserted into the databases concurrently. Every database records the file
+in its own ingest manifest, and uploading the file again only inserts the rows of the databases that haven't recorded
+it. Uploads to several databases commit every batch but don't save checkpoints, so --resume isn't available for them.
+
+"""
+
+import heapq
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import islice, repeat
+from .database import bulk_load, bump_change_counter, insert_rows, iter_entries, file_fingerprint, write_lock, \
+    timed_chunks, timed_normalize, transaction, add_to_manifest, FIELD_NAMES, INSERT_SQL, UPSERT_SQL
+from .reader import iter_records, sniff_delimiter, DEFAULT_BATCH_SIZE
+from .sorting import parse_sort_order, encode_cursor, decode_cursor, cursor_shard
+from .stats import STATS
+
+SHARD_DIRECTORY = 'shard-{:02d}'
+
+
+def shard_directories(directory, shards):
+    """Returns the directories of the databases created by --shards in directory."""
+    return [os.path.join(directory, SHARD_DIRECTORY.format(shard)) for shard in range(shards)]
+
+
+def shard_of(email, shards):
+    # crc32 is used instead of hash() because it is the same in every process, so a customer uploaded again is
+    # always sent to the same database.
+    return zlib.crc32(email.strip().lower().encode('utf-8')) % shards
+
+
+def iter_merged_entries(sort_order, db_paths, limit=None, offset=None, after=None, filters=None, fetch_size=1000):
+    """Reads the rows of several databases in sort order, like iter_entries does for one database.
+
+        Returns:
+            An iterator of the rows of iter_entries with the position of their database in db_paths added as the last
+            column, or None if one of the databases has no customers table.
+
+        """
+    _, descending = parse_sort_order(sort_order)
+    shard_limit = (offset or 0) + limit if limit is not None else None
+    executor = ThreadPoolExecutor(max_workers=len(db_paths), thread_name_prefix='outdoorsy-shard')
+    try:
+        # Every database runs its query concurrently.
+        shards = list(executor.map(_shard_rows, repeat(sort_order), db_paths, range(len(db_paths)),
+                                   repeat(shard_limit), repeat(after), repeat(filters), repeat(fetch_size)))
+    except BaseException:
+        executor.shutdown(wait=True)
+        raise
+    if any(rows is None for rows in shards):
+        executor.shutdown(wait=True)
+        return None
+    return _merge(shards, descending, offset, shard_limit, executor, fetch_size)
+
+
+def _merge(shards, descending, offset, shard_limit, executor, fetch_size):
+    futures = []
+    try:
+        shards = [_prefetch(rows, executor, fetch_size, futures) for rows in shards]
+        # heapq.merge keeps the order of its inputs for rows with the same sort keys, so they come out in the order of
+        # their databases, as next_merged_cursor expects.
+        rows = heapq.merge(*shards, key=_sort_keys, reverse=descending)
+        yield from islice(rows, offset or 0, shard_limit)
+    finally:
+        # Batches that haven't started yet aren't needed once the merge stops. executor.shutdown only cancels them
+        # itself from Python 3.9.
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def next_merged_cursor(sort_order, row):
+    row = tuple(row)
+    return encode_cursor(sort_order, row[len(FIELD_NAMES):-1], shard=row[-1])
+
+
+def _sort_keys(row):
+    return tuple(row)[len(FIELD_NAMES):-1]
+
+
+def _shard_rows(sort_order, db_path, shard, limit, after, filters, fetch_size):
+    if after is not None:
+        after = _shard_cursor(sort_order, after, shard)
+    rows = iter_entries(sort_order, db_path, limit=limit, after=after, filters=filters, fetch_size=fetch_size)
+    return None if rows is None else ((*row, shard) for row in rows)
+
+
+def _shard_cursor(sort_order, cursor, shard):
+    # The rows after a cursor are the rows with greater sort keys, plus the rows with the same sort keys in the
+    # databases after the cursor's database. Since the rowid is always the last sort key, including a row with
+    # the same sort keys is done by moving the cursor's rowid one step back.
+    values = decode_cursor(sort_order, cursor)
+    cursor_database = cursor_shard(cursor)
+    if cursor_database is None or shard <= cursor_database:
+        return cursor
+
+    _, descending = parse_sort_order(sort_order)
+    *keys, rowid = values
+    return encode_cursor(sort_order, [*keys, rowid + 1 if descending else rowid - 1])
+
+
+def _prefetch(rows, executor, batch_size, futures):
+    # The first batch is requested right away, so every database starts running its query before the merge asks
+    # for the first row. The batch being fetched is kept in futures, so the caller can cancel it.
+    future = executor.submit(_next_batch, rows, batch_size)
+    position = len(futures)
+    futures.append(future)
+
+    def prefetched(future):
+        while batch := future.result():
+            future = futures[position] = executor.submit(_next_batch, rows, batch_size)
+            yield from batch
+
+    return prefetched(future)
+
+
+def _next_batch(rows, batch_size):
+    return list(islice(rows, batch_size))
+
+
+"""
+
+insert_partitioned is the version of insert_csv_to_db used to upload a file to several databases. Every batch is read
+and normalized once, split by shard_of and inserted into every database concurrently.
+
+"""
+
+
+def insert_partitioned(path, delimiter, db_paths, batch_size=DEFAULT_BATCH_SIZE, upsert=False, fingerprint=None,
+                       rejects=None, concurrent=False, shards=None):
+    """Uploads a file to several databases, partitioned by email. With shards (a list of positions in db_paths), only
+        the rows of those databases are inserted, for example to finish a file that some databases already have.
+
+        Returns:
+            The list of the number of rows inserted into every database.
+
+        """
+    sql = UPSERT_SQL if upsert else INSERT_SQL
+    with STATS.stage('open'):
+        fingerprint = fingerprint or file_fingerprint(path)
+        delimiter = delimiter or sniff_delimiter(path)
+    shards = list(range(len(db_paths))) if shards is None else list(shards)
+    counts = [0] * len(db_paths)
+    locks = [write_lock(db_paths[shard], concurrent) for shard in shards]
+
+    with ExitStack() as stack:
+        connections = [stack.enter_context(bulk_load(db_paths[shard])) for shard in shards]
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=len(shards) or 1,
+                                                          thread_name_prefix='outdoorsy-shard'))
+        for chunk in timed_chunks(iter_records(path, delimiter), batch_size):
+            partitions = [[] for _ in db_paths]
+            for row in timed_normalize(chunk, rejects, path):
+                partitions[shard_of(row[2], len(db_paths))].append(row)
+            partitions = [partitions[shard] for shard in shards]
+            with STATS.stage('insert'):
+                list(executor.map(_insert_rows, connections, repeat(sql), partitions, locks))
+            for shard, rows in zip(shards, partitions):
+                counts[shard] += len(rows)
+
+        for shard, connection, lock in zip(shards, connections, locks):
+            with transaction(connection, lock):
+                add_to_manifest(connection, fingerprint, counts[shard])
+
+    if rejects is not None:
+        rejects.flush(path)
+    STATS.count('rows_inserted', sum(counts))
+    return counts
+
+
+def _insert_rows(connection, sql, rows, lock):
+    if not rows:
+        return
+    with transaction(connection, lock):
+        insert_rows(connection, sql, rows)
+        bump_change_counter(connection)
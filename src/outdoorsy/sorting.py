@@ -0,0 +1,119 @@
+"""
+
+sorting.py contains the whitelisted sort orders that can be used when viewing the customers table.
+
+Since SQL parameters can't be used for anything other than values, user input is never placed into an ORDER BY clause
+directly. Instead, the sort order selected by the user (for example with -s vehicle_type) is looked up in SORT_KEYS
+and only the fixed expressions defined there are used to build the ORDER BY clause. Every entry in SORT_KEYS has a
+matching index created by create_table in database.py, so sorting is done by SQLite with an index scan. The
+vehicle_type sort order scans the vehicle types by their lower case key and, for each one, its customers with
+idx_customers_vehicle_type.
+
+To add a new sort order, add its key expressions to SORT_KEYS and a matching index to INDEXES in database.py.
+A descending version of every sort order is available by adding the "_desc" suffix, for example email_desc.
+
+The rowid is always added as the last sort key so that every row has a unique position. This allows keyset
+pagination: a page cursor holds the sort key values of the last row shown, and the next page starts right after it
+using a row value comparison on the same index, no matter how deep into the table the page is.
+
+"""
+
+import base64
+import json
+
+# The sort key expressions for every sort order. These must match the columns of the supporting index.
+SORT_KEYS = {
+    'name': ('first_name', 'last_name'),
+    'vehicle_type': ('vehicle_types.key', 'first_name', 'last_name'),
+    'email': ('email',),
+    'vehicle_length': ('vehicle_length', 'first_name', 'last_name'),
+}
+
+DESCENDING_SUFFIX = '_desc'
+
+SORT_ORDERS = [order for name in SORT_KEYS for order in (name, name + DESCENDING_SUFFIX)]
+
+
+class InvalidSortOrder(Exception):
+    pass
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def parse_sort_order(sort_order):
+    """Looks up a sort order in the whitelist.
+
+        Returns:
+            A tuple of the sort key expressions and True if the sort order is descending.
+
+        """
+    descending = sort_order.endswith(DESCENDING_SUFFIX)
+    name = sort_order[:-len(DESCENDING_SUFFIX)] if descending else sort_order
+    if name not in SORT_KEYS:
+        raise InvalidSortOrder(sort_order)
+
+    return SORT_KEYS[name] + ('customers.rowid',), descending
+
+
+def order_by_clause(sort_order):
+    keys, descending = parse_sort_order(sort_order)
+    direction = "DESC" if descending else "ASC"
+    return ", ".join(f"{key} {direction}" for key in keys)
+
+
+def cursor_columns(sort_order):
+    """Returns the sort key expressions aliased so they can be selected alongside a row and used for a cursor."""
+    keys, _ = parse_sort_order(sort_order)
+    return ", ".join(f"{key} AS sort_key_{position}" for position, key in enumerate(keys))
+
+
+def keyset_condition(sort_order):
+    """Returns a WHERE condition selecting the rows after a cursor. The cursor values are bound as parameters."""
+    keys, descending = parse_sort_order(sort_order)
+    operator = "<" if descending else ">"
+    placeholders = ", ".join("?" for _ in keys)
+    return f"({', '.join(keys)}) {operator} ({placeholders})"
+
+
+def encode_cursor(sort_order, values, shard=None):
+    """Encodes the sort key values of the last row of a page. shard is the position of the database the row came from
+        when several databases are viewed together, see shards.py."""
+    cursor = {'sort': sort_order, 'keys': list(values)}
+    if shard is not None:
+        cursor['shard'] = shard
+    payload = json.dumps(cursor, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(sort_order, cursor):
+    """Decodes a cursor created by encode_cursor and checks it belongs to the sort order being paged through.
+
+        Returns:
+            The list of sort key values to bind to keyset_condition.
+
+        """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        values = payload['keys']
+        cursor_sort_order = payload['sort']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+
+    keys, _ = parse_sort_order(sort_order)
+    if cursor_sort_order != sort_order or len(values) != len(keys):
+        raise InvalidCursor(cursor)
+
+    return values
+
+
+def cursor_shard(cursor):
+    """Returns the shard saved in a cursor by encode_cursor, or None if it doesn't have one."""
+    try:
+        shard = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii'))).get('shard')
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor(cursor)
+    if shard is not None and not isinstance(shard, int):
+        raise InvalidCursor(cursor)
+    return shard
@@ -0,0 +1,152 @@
+"""
+
+stats.py contains the instrumentation used by the --stats, --stats-json and --profile options.
+
+The functions doing the work (insert_csv_to_db, ingest_files, get_entries, iter_entries, format_results and
+stream_results) wrap each of their stages in STATS.stage, for example STATS.stage('parse'), and add to counters such
+as rows_inserted with STATS.count. Stage times are exclusive, so when stages are nested (rows being fetched from the
+database while the table is rendered) the time of the inner stage isn't counted again in the outer one.
+
+Instrumentation is disabled unless STATS.enable is called, in which case stage only costs a flag check, so the stages
+are measured per batch of rows rather than per row.
+
+A hook can be passed to STATS.enable to run a profiler or tracer around the outermost stages. It is called with the
+stage name and must return a context manager, see profile_hook for an example using cProfile.
+
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # The resource module isn't available on Windows, where peak memory is not reported.
+    resource = None
+
+# The order stages are listed in the summary. Stages not listed here are shown after these.
+STAGE_ORDER = ['open', 'parse', 'normalize', 'insert', 'commit', 'wait', 'query', 'fetch', 'render', 'export']
+
+
+class Stats:
+    def __init__(self):
+        self.enabled = False
+        self.hook = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        # Stages can be timed from several threads (see shards.py), each one nesting its own stages.
+        self._local = threading.local()
+
+    @property
+    def _children(self):
+        if not hasattr(self._local, 'children'):
+            self._local.children = []
+        return self._local.children
+
+    def enable(self, hook=None):
+        self.reset()
+        self.enabled = True
+        self.hook = hook
+
+    def disable(self):
+        self.enabled = False
+        self.hook = None
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        # The hook (a profiler for --profile) only runs around the main thread's stages.
+        main_thread = threading.current_thread() is threading.main_thread()
+        hook = self.hook(name) if self.hook and main_thread and not self._children else nullcontext()
+        self._children.append(0.0)
+        started = time.perf_counter()
+        try:
+            with hook:
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.record(name, elapsed - self._children.pop())
+            if self._children:
+                self._children[-1] += elapsed
+
+    def record(self, name, seconds, calls=1):
+        if self.enabled:
+            with self._lock:
+                self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+                self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        wall_seconds = time.perf_counter() - self.started
+        stages = {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self._stage_names()}
+        rates = {f"{name}_per_sec": value / wall_seconds for name, value in self.counters.items()
+                 if name.startswith('rows_') and wall_seconds}
+        return {'wall_seconds': wall_seconds, 'stages': stages, 'counters': dict(self.counters), 'rates': rates,
+                'peak_rss_kb': peak_rss_kb()}
+
+    def summary(self):
+        data = self.to_dict()
+        lines = [f"Total time: {data['wall_seconds']:.3f}s"]
+        for name, stage in data['stages'].items():
+            share = stage['seconds'] / data['wall_seconds'] if data['wall_seconds'] else 0
+            lines.append(f"  {name:<10} {stage['seconds']:>10.3f}s {share:>6.1%}  ({stage['calls']} calls)")
+        for name, value in data['counters'].items():
+            rate = data['rates'].get(f"{name}_per_sec")
+            lines.append(f"{name}: {value}" + (f" ({rate:,.0f}/sec)" if rate is not None else ""))
+        if data['peak_rss_kb'] is not None:
+            lines.append(f"Peak memory: {data['peak_rss_kb'] / 1024:.1f} MB")
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        output = json.dumps(self.to_dict(), indent=2)
+        if path == '-':
+            print(output)
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(output + "\n")
+
+    def _stage_names(self):
+        known = [name for name in STAGE_ORDER if name in self.seconds]
+        return known + sorted(name for name in self.seconds if name not in STAGE_ORDER)
+
+
+STATS = Stats()
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def profile_hook(profiler):
+    """Returns a hook for Stats.enable that runs a cProfile.Profile (or anything with enable and disable) during
+        every outermost stage."""
+
+    @contextmanager
+    def hook(name):
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+
+    return hook
@@ -0,0 +1,197 @@
+"""
+
+stream.py contains the logic to upload records as they arrive instead of from a finished file, used by -f - to read
+from stdin and by --follow to tail a file that is still being written.
+
+Both sources yield the lines they read, and None whenever poll_interval passes without a new line, so insert_stream
+can commit the rows it holds even while no more rows are arriving:
+
+- read_lines reads a stream such as stdin on a background thread, since reading stdin blocks until a line arrives
+- follow_file reads a file to its end and then waits for more lines the way tail -F does. When the file is rotated
+  (renamed or removed and created again) the rest of the old file is read and the new file is followed from its
+  start, and when it is truncated in place (copytruncate) it is read again from its start. A file that doesn't exist
+  yet is waited for.
+
+insert_stream commits the rows in micro-batches, when batch_size rows have been read or flush_interval seconds have
+passed since the first row of the batch was read, whichever comes first. Every micro-batch is one transaction, so a
+view or a server sees new customers within about flush_interval seconds. Streams aren't recorded in the ingest manifest
+and don't save checkpoints, so --force and --resume don't apply to them; use --upsert to follow a file again without
+adding its customers twice.
+
+"""
+
+import os
+import threading
+import time
+from queue import Queue, Empty
+from .database import bulk_load, bump_change_counter, insert_rows, normalize_rows, write_lock, transaction, \
+    INSERT_SQL, UPSERT_SQL
+from .reader import detect_delimiter, parse_line, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+from .stats import STATS
+
+# The -f path that reads from stdin.
+STDIN = '-'
+
+# Number of seconds between checks for new lines.
+POLL_INTERVAL = 0.1
+
+# Number of bytes read from a followed file at a time.
+READ_BYTES = 1024 * 1024
+
+# Maximum number of lines read ahead from a stream by read_lines.
+QUEUE_LINES = 10000
+
+_END = object()
+
+
+def read_lines(stream, poll_interval=POLL_INTERVAL):
+    """Reads the lines of a text stream, such as stdin, until it ends.
+
+        Yields:
+            Every line, or None when poll_interval passes without a line.
+
+        """
+    lines = Queue(maxsize=QUEUE_LINES)
+
+    def read():
+        try:
+            for line in stream:
+                lines.put(line)
+        except Exception as error:
+            lines.put(error)
+        finally:
+            lines.put(_END)
+
+    threading.Thread(target=read, name='outdoorsy-stdin', daemon=True).start()
+    while True:
+        try:
+            line = lines.get(timeout=poll_interval)
+        except Empty:
+            yield None
+            continue
+        if line is _END:
+            return
+        if isinstance(line, Exception):
+            raise line
+        yield line
+
+
+def follow_file(path, poll_interval=POLL_INTERVAL, stop=None):
+    """Reads the lines of a file and then the lines added to it, following it across rotations like tail -F, until
+        stop (a threading.Event) is set. An incomplete last line is only read once it is completed, or once the file
+        has been rotated.
+
+        Yields:
+            Every line, or None when poll_interval passes without a line.
+
+        """
+    file = None
+    identity = None
+    pending = b''
+    try:
+        while stop is None or not stop.is_set():
+            if file is None:
+                try:
+                    file = open(path, 'rb')
+                except FileNotFoundError:
+                    yield None
+                    time.sleep(poll_interval)
+                    continue
+                identity = _identity(os.fstat(file.fileno()))
+
+            data = file.read(READ_BYTES)
+            if data:
+                pending += data
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    yield line.decode('utf-8')
+                continue
+
+            # At the end of the file, check whether it has been replaced or truncated since it was opened.
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            if stat is None or _identity(stat) != identity:
+                # Lines written to the old file just before it was rotated are read before following the new one.
+                pending += file.read()
+                file.close()
+                file = None
+                for line in pending.split(b'\n'):
+                    if line:
+                        yield line.decode('utf-8')
+                pending = b''
+                continue
+            if stat.st_size < file.tell():
+                file.seek(0)
+                pending = b''
+                continue
+
+            yield None
+            time.sleep(poll_interval)
+    finally:
+        if file is not None:
+            file.close()
+
+
+def _identity(stat):
+    return stat.st_dev, stat.st_ino
+
+
+def insert_stream(lines, delimiter, db_path="customers.db", batch_size=DEFAULT_BATCH_SIZE,
+                  flush_interval=DEFAULT_FLUSH_INTERVAL, upsert=False, name=STDIN, rejects=None, concurrent=False):
+    """Inserts the records of lines read by read_lines or follow_file, committing them in micro-batches. If no
+        delimiter is given, it is detected from the first line. Interrupting the stream with Ctrl-C commits the rows
+        already read and stops. With rejects (a RejectFile), invalid records are added to it with their line number.
+        With concurrent, every micro-batch is written holding the database's WriteLock, see locking.py.
+
+        Returns:
+            The number of rows inserted.
+
+        """
+    sql = UPSERT_SQL if upsert else INSERT_SQL
+    lock = write_lock(db_path, concurrent)
+    inserted = 0
+    records = []
+    record_lines = []
+    line_number = 0
+    batch_started = None
+
+    with bulk_load(db_path) as connection:
+        def commit():
+            nonlocal inserted, records, record_lines, batch_started
+            rejected = [] if rejects is not None else None
+            with STATS.stage('normalize'):
+                rows = normalize_rows(records, rejected)
+            for position, reason in rejected or ():
+                rejects.add_line(name, record_lines[position], reason, records[position])
+            with transaction(connection, lock):
+                with STATS.stage('insert'):
+                    insert_rows(connection, sql, rows)
+                bump_change_counter(connection)
+            inserted += len(rows)
+            records = []
+            record_lines = []
+            batch_started = None
+
+        try:
+            for line in lines:
+                if line is not None:
+                    line_number += 1
+                    if delimiter is None and line.strip():
+                        delimiter = detect_delimiter([line], name)
+                    fields = parse_line(line, delimiter) if delimiter else None
+                    if fields is not None:
+                        records.append(fields)
+                        record_lines.append(line_number)
+                        batch_started = batch_started or time.monotonic()
+
+                if len(records) >= batch_size or (records and time.monotonic() - batch_started >= flush_interval):
+                    commit()
+        except KeyboardInterrupt:
+            pass
+        if records:
+            commit()
+
+    STATS.count('rows_inserted', inserted)
+    return inserted
@@ -1,5 +1,47 @@
+import asyncio
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
 import pytest
-from outdoorsy import parse_delimiter, InvalidDelimiter, parse_args
+from outdoorsy import parse_delimiter, InvalidDelimiter, parse_args, create_table, insert_csv_to_db, get_entries, \
+    InvalidSortOrder, iter_entries, InvalidCursor, format_results, stream_results, upload_files
+from outdoorsy.database import next_cursor, get_connection, close_connection, close_connections, ensure_email_key, \
+    file_fingerprint, is_loaded, get_checkpoint, get_changed_checkpoint, get_summary, rebuild_summary, \
+    get_change_counter, insert_rows, INSERT_SQL, SELECT_SQL
+from outdoorsy.export import export_rows, write_columnar, read_columnar, iter_row_groups, InvalidColumnarFile
+from outdoorsy.filters import Filters
+from outdoorsy.client import Client, parse_address
+from outdoorsy.server import Server, ResponseCache
+from outdoorsy.render_cache import RenderCache
+from outdoorsy.shards import iter_merged_entries, next_merged_cursor, shard_of, shard_directories
+from outdoorsy.ingest import expand_paths, ingest_files
+from outdoorsy.lengths import parse_length, normalize_lengths, InvalidLength
+from outdoorsy.results import ResultSet
+from outdoorsy.reader import sniff_delimiter, iter_records, detect_compression, has_multiline_records, \
+    DelimiterNotDetected
+from outdoorsy.stats import Stats, STATS
+from outdoorsy.stream import read_lines, follow_file, insert_stream
+from outdoorsy.rejects import RejectFile, validate_file
+from outdoorsy.locking import WriteLock, begin_immediate
+from outdoorsy.session import Session
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+COMMAS_FILE = os.path.join(TESTS_DIR, 'commas.txt')
+PIPES_FILE = os.path.join(TESTS_DIR, 'pipes.txt')
+
+# Modules that outdoorsy --version and outdoorsy -h must not import, and the time they may spend importing outdoorsy.
+HEAVY_MODULES = {'sqlite3', 'tabulate', 'colorama', 'csv', 'mmap', 'multiprocessing'}
+STARTUP_BUDGET_MS = 100
 
 """
 
@@ -34,6 +76,10 @@ def test_parse_delimiter_pipe():
     assert test_comma == '|'
 
 
+def test_parse_delimiter_tab():
+    assert parse_delimiter('tab') == '\t'
+
+
 def test_parse_delimiter_invalid():
     with pytest.raises(InvalidDelimiter):
         parse_delimiter('invalid')
@@ -47,7 +93,7 @@ def test_parse_args_with_file_and_delimiter():
     parsed_args = parse_args(mock_args)
 
     # Assert
-    assert parsed_args.file == '/path/to/my/dummy/file.csv'
+    assert parsed_args.file == ['/path/to/my/dummy/file.csv']
     assert parsed_args.delimiter == 'comma'
 
 
@@ -59,7 +105,7 @@ def test_parse_args_with_file_and_no_delimiter():
     parsed_args = parse_args(mock_args)
 
     # Assert
-    assert parsed_args.file == '/path/to/my/dummy/file.csv'
+    assert parsed_args.file == ['/path/to/my/dummy/file.csv']
 
 
 def test_parse_args_with_delimiter_and_no_file():
@@ -106,3 +152,1766 @@ def test_parse_args_with_view_and_no_sort():
 
     # Assert
     assert parsed_args.view
+
+
+def test_parse_args_with_batch_size():
+    # Arrange
+    mock_args = ['-f', '/path/to/my/dummy/file.csv', '-d', 'comma', '--batch-size', '250', '--single-transaction']
+
+    # Act
+    parsed_args = parse_args(mock_args)
+
+    # Assert
+    assert parsed_args.batch_size == 250
+    assert parsed_args.single_transaction
+
+
+def test_parse_args_with_invalid_batch_size():
+    with pytest.raises(SystemExit):
+        parse_args(['-f', 'file.csv', '-d', 'comma', '--batch-size', '0'])
+
+
+@pytest.mark.parametrize('single_transaction', [False, True])
+def test_insert_csv_to_db_in_batches(tmp_path, single_transaction):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+
+    # Act
+    inserted = insert_csv_to_db(COMMAS_FILE, ',', db_path, batch_size=3, single_transaction=single_transaction)
+
+    # Assert
+    connection = sqlite3.connect(db_path)
+    rows = connection.execute("SELECT email, vehicle_length FROM customers ORDER BY email;").fetchall()
+    connection.close()
+    assert inserted == 4
+    assert ('greta@future.com', 32) in rows
+    assert ('martinez@earthguardian.org', 28) in rows
+    assert len(rows) == 4
+
+
+@pytest.fixture
+def loaded_db(tmp_path):
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    insert_csv_to_db(COMMAS_FILE, ',', db_path)
+    insert_csv_to_db(PIPES_FILE, '|', db_path)
+    return db_path
+
+
+def test_parse_args_with_view_and_sort_descending():
+    parsed_args = parse_args(['-v', '-s', 'vehicle_length_desc'])
+    assert parsed_args.sort == 'vehicle_length_desc'
+
+
+def test_get_entries_sorted_by_vehicle_type_ignores_case(loaded_db):
+    # Act
+    results = get_entries('vehicle_type', loaded_db)
+
+    # Assert
+    vehicle_types = [row['vehicle_type'] for row in results]
+    assert vehicle_types == sorted(vehicle_types, key=str.lower)
+    assert vehicle_types.index('RV') > vehicle_types.index('motorboat')
+
+
+def test_get_entries_sorted_by_vehicle_length_descending(loaded_db):
+    results = get_entries('vehicle_length_desc', loaded_db)
+    lengths = [row['vehicle_length'] for row in results]
+    assert lengths == sorted(lengths, reverse=True)
+
+
+def test_get_entries_invalid_sort_order(loaded_db):
+    with pytest.raises(InvalidSortOrder):
+        get_entries('vehicle_type; DROP TABLE customers', loaded_db)
+
+
+@pytest.mark.parametrize('sort_order', ['name', 'vehicle_type_desc', 'email', 'vehicle_length'])
+def test_sort_orders_use_an_index(loaded_db, sort_order):
+    # Arrange
+    from outdoorsy.database import SELECT_SQL
+    from outdoorsy.sorting import order_by_clause
+    connection = sqlite3.connect(loaded_db)
+
+    # Act
+    plan = connection.execute(f"EXPLAIN QUERY PLAN {SELECT_SQL} ORDER BY {order_by_clause(sort_order)};").fetchall()
+    connection.close()
+
+    # Assert
+    details = " ".join(row[-1] for row in plan)
+    assert "USING INDEX" in details
+    assert "TEMP B-TREE" not in details
+
+
+def test_parse_args_with_limit_and_page():
+    parsed_args = parse_args(['-v', '--limit', '10', '--page', '3'])
+    assert parsed_args.limit == 10
+    assert parsed_args.page == 3
+
+
+def test_parse_args_with_page_and_after():
+    with pytest.raises(SystemExit):
+        parse_args(['-v', '--limit', '10', '--page', '3', '--after', 'cursor'])
+
+
+@pytest.mark.parametrize('databases', [['-db', 'shards', '--shards', '2'], ['-db', 'first', 'second']])
+@pytest.mark.parametrize('option', [['--resume'], ['--single-transaction'], ['--workers', '2']])
+def test_parse_args_refuses_options_ignored_by_several_databases(databases, option, capsys):
+    # Act
+    with pytest.raises(SystemExit):
+        parse_args(['-f', 'file.csv', *databases, *option])
+
+    # Assert
+    assert f"{option[0]} can't be used with --shards or several -db directories" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('sort_order', ['name', 'vehicle_type', 'vehicle_length_desc'])
+def test_iter_entries_keyset_pagination(loaded_db, sort_order):
+    # Arrange
+    expected = [tuple(row) for row in get_entries(sort_order, loaded_db)]
+
+    # Act
+    pages = []
+    after = None
+    while True:
+        page = list(iter_entries(sort_order, loaded_db, limit=3, after=after))
+        if not page:
+            break
+        pages.extend(tuple(row)[:6] for row in page)
+        after = next_cursor(sort_order, page[-1])
+
+    # Assert
+    assert pages == expected
+
+
+def test_iter_entries_page_offset(loaded_db):
+    expected = [tuple(row) for row in get_entries('email', loaded_db)]
+    page = [tuple(row)[:6] for row in iter_entries('email', loaded_db, limit=3, offset=3)]
+    assert page == expected[3:6]
+
+
+def test_iter_entries_cursor_from_other_sort_order(loaded_db):
+    row = next(iter_entries('name', loaded_db))
+    with pytest.raises(InvalidCursor):
+        list(iter_entries('email', loaded_db, after=next_cursor('name', row)))
+
+
+@pytest.mark.parametrize('filters, expected_emails', [
+    (Filters(vehicle_type='SAILBOAT'), ['greta@future.com', 'jb@sailor.com']),
+    (Filters(email='steve@crocodiles.com'), ['steve@crocodiles.com']),
+    (Filters(name='Irwin'), ['steve@crocodiles.com']),
+    (Filters(name='Jimmy Buffet'), ['jb@sailor.com']),
+    (Filters(min_length=24, max_length=32), ['a@adams.com', 'greta@future.com', 'mandip@ecotourism.net',
+                                             'martinez@earthguardian.org', 'steve@crocodiles.com']),
+    (Filters(vehicle_type='motorboat', max_length=30), ['a@adams.com']),
+    (Filters(search='uard'), ['martinez@earthguardian.org']),
+    (Filters(search='glacier naomi'), ['n.uemura@gmail.com']),
+    (Filters(search='G’'), ['steve@crocodiles.com']),
+])
+def test_get_entries_with_filters(loaded_db, filters, expected_emails):
+    rows = get_entries('email', loaded_db, filters=filters)
+    assert [row['email'] for row in rows] == expected_emails
+
+
+def test_filters_use_indexes(loaded_db):
+    # Arrange
+    from outdoorsy.database import _select_sql
+    connection = get_connection(loaded_db)
+
+    # Act
+    plans = {}
+    for name, filters in [('email', Filters(email='a@adams.com')), ('vehicle_type', Filters(vehicle_type='RV')),
+                          ('name', Filters(name='Ansel Adams')), ('length', Filters(min_length=30))]:
+        sql, parameters = _select_sql(connection, 'name', filters=filters)
+        plans[name] = " ".join(row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, parameters))
+
+    # Assert
+    assert all('USING INDEX' in plan for plan in plans.values()), plans
+
+
+def test_iter_entries_keyset_pagination_with_filters(loaded_db):
+    # Arrange
+    filters = Filters(min_length=20)
+    expected = [tuple(row) for row in get_entries('vehicle_length_desc', loaded_db, filters=filters)]
+
+    # Act
+    pages = []
+    after = None
+    while page := list(iter_entries('vehicle_length_desc', loaded_db, limit=2, after=after, filters=filters)):
+        pages.extend(tuple(row)[:6] for row in page)
+        after = next_cursor('vehicle_length_desc', page[-1])
+
+    # Assert
+    assert len(expected) == 7
+    assert pages == expected
+
+
+def test_search_index_follows_upserts(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    insert_csv_to_db(COMMAS_FILE, ',', db_path)
+    changed_file = tmp_path / 'changed.csv'
+    changed_file.write_text("Greta,Thunberg,greta@future.com,catamaran,Skolstrejk,45 ft\n", encoding='utf-8')
+
+    # Act
+    ensure_email_key(db_path)
+    insert_csv_to_db(str(changed_file), ',', db_path, upsert=True)
+
+    # Assert
+    assert get_entries('name', db_path, filters=Filters(search='Fridays')) == []
+    assert [row['email'] for row in get_entries('name', db_path, filters=Filters(search='strejk'))] == \
+        ['greta@future.com']
+
+
+def test_search_index_follows_batches_and_other_inserts(tmp_path):
+    # Arrange
+    from outdoorsy.database import SEARCH_DEFERRED_TABLE
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    connection = get_connection(db_path)
+    # The insert trigger of an older outdoorsy, which indexed every row on its own, is replaced by create_table.
+    connection.executescript("""
+        DROP TRIGGER customers_fts_insert;
+        CREATE TRIGGER customers_fts_insert AFTER INSERT ON customers BEGIN
+            INSERT INTO customers_fts (rowid, first_name, last_name, vehicle_name)
+                VALUES (new.rowid, new.first_name, new.last_name, new.vehicle_name);
+        END;
+    """)
+    close_connection(db_path)
+
+    # Act
+    create_table(db_path)
+    insert_csv_to_db(COMMAS_FILE, ',', db_path, batch_size=2)
+    connection = get_connection(db_path)
+    with connection:
+        connection.execute("INSERT INTO customers VALUES ('Jane', 'Goodall', 'jane@gombe.org', 1, 'Gombe', 20);")
+
+    # Assert
+    trigger = connection.execute("SELECT sql FROM sqlite_master WHERE name = 'customers_fts_insert';").fetchone()[0]
+    assert SEARCH_DEFERRED_TABLE in trigger
+    assert connection.execute(f"SELECT count(*) FROM {SEARCH_DEFERRED_TABLE};").fetchone()[0] == 0
+    connection.execute("INSERT INTO customers_fts (customers_fts) VALUES ('integrity-check');")
+    assert [row['email'] for row in get_entries('name', db_path, filters=Filters(search='uard'))] == \
+        ['martinez@earthguardian.org']
+    assert [row['email'] for row in get_entries('name', db_path, filters=Filters(search='gombe'))] == \
+        ['jane@gombe.org']
+
+
+def test_stream_results_matches_format_results(loaded_db):
+    # Arrange
+    output = io.StringIO()
+
+    # Act
+    count, _ = stream_results(iter_entries('vehicle_type', loaded_db), file=output)
+
+    # Assert
+    assert count == 8
+    assert output.getvalue() == format_results(get_entries('vehicle_type', loaded_db)) + "\n"
+
+
+def test_get_connection_is_shared_and_tuned(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+
+    # Act
+    connection = get_connection(db_path)
+
+    # Assert
+    assert get_connection(os.path.join(str(tmp_path), '.', 'customers.db')) is connection
+    assert connection.execute("PRAGMA journal_mode;").fetchone()[0] == 'wal'
+    assert connection.execute("PRAGMA temp_store;").fetchone()[0] == 2
+    close_connection(db_path)
+    assert get_connection(db_path) is not connection
+
+
+def test_close_connections(tmp_path):
+    # Arrange
+    connection = get_connection(str(tmp_path / 'customers.db'))
+
+    # Act
+    close_connections()
+
+    # Assert
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT 1;")
+
+
+def test_parse_args_with_several_files():
+    parsed_args = parse_args(['-f', 'one.csv', 'exports/*.csv', '-d', 'comma', '--workers', '4'])
+    assert parsed_args.file == ['one.csv', 'exports/*.csv']
+    assert parsed_args.workers == 4
+
+
+def test_expand_paths():
+    # Act
+    paths, missing = expand_paths([TESTS_DIR, os.path.join(TESTS_DIR, '*.txt'), 'missing.csv'])
+
+    # Assert
+    assert COMMAS_FILE in paths
+    assert PIPES_FILE in paths
+    assert len(paths) == len(set(paths))
+    assert missing == ['missing.csv']
+
+
+def test_ingest_files_in_parallel(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    with open(COMMAS_FILE, encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    big_file = tmp_path / 'big.csv'
+    big_file.write_text("\n".join(lines * 50) + "\n", encoding='utf-8')
+
+    # Act
+    results, _ = ingest_files([str(big_file), COMMAS_FILE], ',', db_path, batch_size=7, workers=2, chunk_bytes=500)
+
+    # Assert
+    assert [(result.rows, result.error) for result in results] == [(200, None), (4, None)]
+    count = get_connection(db_path).execute("SELECT count(*) FROM customers;").fetchone()[0]
+    assert count == 204
+
+
+def test_ingest_files_reports_wrong_delimiter(tmp_path):
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    results, _ = ingest_files([COMMAS_FILE], '|', db_path, workers=1)
+    assert results[0].rows == 0
+    assert results[0].error.startswith('TypeError')
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('28 feet', 28),
+    ('32’', 32),
+    ('40 ft', 40),
+    ('40 FT.', 40),
+    ('24', 24),
+    ('7.5 m', 25),
+    ('240 inches', 20),
+    ('32\' 6"', 33),
+])
+def test_parse_length(value, expected):
+    assert parse_length(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', 'long', '12 parsecs', '12 ft,', '12..', 'ft 12', '1' * 30 + '..'])
+def test_parse_length_invalid(value):
+    with pytest.raises(InvalidLength):
+        parse_length(value)
+
+
+def test_parse_length_invalid_takes_linear_time():
+    # Arrange
+    value = '1' * 5000 + '..'
+
+    # Act
+    started = time.perf_counter()
+    with pytest.raises(InvalidLength):
+        parse_length(value)
+    seconds = time.perf_counter() - started
+
+    # Assert
+    assert seconds < 0.5
+
+
+def test_normalize_lengths_uses_cache():
+    # Arrange
+    parse_length.cache_clear()
+
+    # Act
+    lengths = normalize_lengths(['28 feet', '32’', '28 feet', '32’', '28 feet'])
+
+    # Assert
+    assert lengths == [28, 32, 28, 32, 28]
+    assert parse_length.cache_info().misses == 2
+
+
+def _count_customers(db_path):
+    return get_connection(db_path).execute("SELECT count(*) FROM customers;").fetchone()[0]
+
+
+def test_upload_files_skips_files_already_uploaded(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+
+    # Act
+    upload_files([COMMAS_FILE], ',', db_path)
+    upload_files([COMMAS_FILE], ',', db_path)
+
+    # Assert
+    assert _count_customers(db_path) == 4
+    assert is_loaded(file_fingerprint(COMMAS_FILE), db_path)
+    upload_files([COMMAS_FILE], ',', db_path, force=True)
+    assert _count_customers(db_path) == 8
+
+
+def test_upload_files_upsert_by_email(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    insert_csv_to_db(COMMAS_FILE, ',', db_path)
+    insert_csv_to_db(COMMAS_FILE, ',', db_path)
+    changed_file = tmp_path / 'changed.csv'
+    changed_file.write_text("Greta,Thunberg,greta@future.com,catamaran,Fridays For Future,45 ft\n", encoding='utf-8')
+
+    # Act
+    removed = ensure_email_key(db_path)
+    upload_files([COMMAS_FILE], ',', db_path, upsert=True, force=True)
+    upload_files([str(changed_file)], ',', db_path, upsert=True)
+
+    # Assert
+    assert removed == 4
+    assert _count_customers(db_path) == 4
+    row = get_connection(db_path).execute(
+        "SELECT name, vehicle_length FROM customers JOIN vehicle_types ON vehicle_types.id = vehicle_type_id "
+        "WHERE email = 'greta@future.com';").fetchone()
+    assert tuple(row) == ('catamaran', 45)
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'jsonl'])
+def test_export_rows_text_formats(loaded_db, output_format):
+    # Arrange
+    import csv
+    import json
+    output = io.StringIO(newline='')
+    expected = [tuple(row) for row in get_entries('email', loaded_db)]
+
+    # Act
+    count = export_rows(iter_entries('email', loaded_db, fetch_size=3), output_format, output)
+
+    # Assert
+    lines = output.getvalue().splitlines()
+    if output_format == 'csv':
+        header, *records = list(csv.reader(lines))
+        exported = [(*record[:5], int(record[5])) for record in records]
+    else:
+        header = list(json.loads(lines[0]))
+        exported = [tuple(json.loads(line).values()) for line in lines]
+    assert count == 8
+    assert header == ['first_name', 'last_name', 'email', 'vehicle_type', 'vehicle_name', 'vehicle_length']
+    assert exported == expected
+
+
+def test_columnar_round_trip(loaded_db, tmp_path):
+    # Arrange
+    path = tmp_path / 'customers.col'
+    expected = [tuple(row) for row in get_entries('vehicle_type', loaded_db)]
+
+    # Act
+    with open(path, 'wb') as file:
+        count = write_columnar(iter_entries('vehicle_type', loaded_db), file, row_group_size=3)
+    columns = read_columnar(path)
+
+    # Assert
+    assert count == 8
+    assert len(list(iter_row_groups(path))) == 3
+    assert list(zip(*columns.values())) == expected
+    assert read_columnar(path, ['vehicle_length'])['vehicle_length'].tolist() == [row[5] for row in expected]
+
+
+def test_read_columnar_rejects_other_files(tmp_path):
+    with pytest.raises(InvalidColumnarFile):
+        read_columnar(COMMAS_FILE)
+
+
+def test_run_with_args_exports_filtered_rows(loaded_db, tmp_path):
+    # Arrange
+    from outdoorsy import run_with_args
+    output_path = tmp_path / 'sailboats.jsonl'
+    args = parse_args(['-v', '-db', str(tmp_path), '--vehicle-type', 'sailboat', '-s', 'vehicle_length_desc',
+                       '--output', 'jsonl', '--output-path', str(output_path)])
+
+    # Act
+    run_with_args(args)
+
+    # Assert
+    lines = output_path.read_text(encoding='utf-8').splitlines()
+    assert [line.split('"email": ')[1].split(',')[0] for line in lines] == ['"jb@sailor.com"', '"greta@future.com"']
+
+
+@pytest.fixture
+def duplicated_dbs(tmp_path):
+    # Two databases with the same rows, so every row has a twin with the same sort keys and rowid.
+    db_paths = []
+    for name in ('east', 'west'):
+        db_path = str(tmp_path / f'{name}.db')
+        create_table(db_path)
+        insert_csv_to_db(COMMAS_FILE, ',', db_path)
+        insert_csv_to_db(PIPES_FILE, '|', db_path)
+        db_paths.append(db_path)
+    return db_paths
+
+
+@pytest.mark.parametrize('sort_order', ['name', 'email_desc', 'vehicle_type', 'vehicle_length_desc'])
+def test_iter_merged_entries_matches_one_database(loaded_db, duplicated_dbs, sort_order):
+    # Act
+    merged = [tuple(row) for row in iter_merged_entries(sort_order, duplicated_dbs)]
+
+    # Assert
+    expected = [tuple(row) for row in get_entries(sort_order, loaded_db)]
+    assert [row[:6] for row in merged] == [row for row in expected for _ in range(2)]
+    assert [row[-1] for row in merged] == [0, 1] * len(expected)
+
+
+@pytest.mark.parametrize('sort_order', ['name', 'vehicle_length_desc'])
+def test_iter_merged_entries_pages_with_cursor(duplicated_dbs, sort_order):
+    # Arrange
+    everything = [tuple(row) for row in iter_merged_entries(sort_order, duplicated_dbs)]
+    pages = []
+    after = None
+
+    # Act
+    while True:
+        page = [tuple(row) for row in iter_merged_entries(sort_order, duplicated_dbs, limit=3, after=after)]
+        pages.extend(page)
+        if len(page) < 3:
+            break
+        after = next_merged_cursor(sort_order, page[-1])
+
+    # Assert
+    assert pages == everything
+    assert [tuple(row) for row in iter_merged_entries(sort_order, duplicated_dbs, limit=3, offset=3)] == everything[3:6]
+
+
+def test_run_with_args_uploads_and_views_shards(tmp_path, capsys):
+    # Arrange
+    from outdoorsy import run_with_args
+    upload = parse_args(['-f', COMMAS_FILE, PIPES_FILE, '-db', str(tmp_path), '--shards', '3'])
+    view = parse_args(['-v', '-s', 'email', '-db', str(tmp_path), '--shards', '3'])
+
+    # Act
+    run_with_args(upload)
+    run_with_args(upload)
+    capsys.readouterr()
+    run_with_args(view)
+
+    # Assert
+    db_paths = [os.path.join(directory, 'customers.db') for directory in shard_directories(str(tmp_path), 3)]
+    for shard, db_path in enumerate(db_paths):
+        emails = [row[0] for row in get_connection(db_path).execute("SELECT email FROM customers;")]
+        assert all(shard_of(email, 3) == shard for email in emails)
+    assert sum(_count_customers(db_path) for db_path in db_paths) == 8
+    output = capsys.readouterr().out
+    emails = [line.split('|')[3].strip() for line in output.splitlines() if '@' in line]
+    assert emails == sorted(emails) and len(emails) == 8
+
+
+def test_upload_partitioned_only_finishes_missing_shards(tmp_path):
+    # Arrange
+    from outdoorsy.app import upload_partitioned
+    db_paths = [str(tmp_path / f'shard-{shard}.db') for shard in range(3)]
+    upload_partitioned([COMMAS_FILE, PIPES_FILE], None, db_paths)
+    expected = [_count_customers(db_path) for db_path in db_paths]
+    # An earlier upload that stopped before the second database recorded the file.
+    connection = get_connection(db_paths[1])
+    with connection:
+        connection.execute("DELETE FROM customers;")
+        connection.execute("DELETE FROM ingest_manifest;")
+
+    # Act
+    upload_partitioned([COMMAS_FILE, PIPES_FILE], None, db_paths)
+
+    # Assert
+    assert [_count_customers(db_path) for db_path in db_paths] == expected == [3, 3, 2]
+
+
+def _serve_requests(db_path, requests, between=None):
+    """Sends every request to a Server and returns the decoded responses. between is called with the Server after
+        the first request."""
+    async def send():
+        server = Server(db_path)
+        responses = []
+        for position, request in enumerate(requests):
+            if position == 1 and between:
+                between(server)
+            responses.append(json.loads(await server.respond(json.dumps(request).encode('utf-8'))))
+        server.executor.shutdown()
+        return server, responses
+
+    return asyncio.run(send())
+
+
+def test_server_view_is_cached(loaded_db):
+    # Arrange
+    request = {'command': 'view', 'sort': 'email', 'limit': 3, 'filters': {'min_length': 20}}
+    expected = list(iter_entries('email', loaded_db, limit=3, filters=Filters(min_length=20)))
+
+    # Act
+    server, responses = _serve_requests(loaded_db, [request, request])
+
+    # Assert
+    assert responses[0] == responses[1]
+    assert responses[0]['rows'] == [list(row[:6]) for row in expected]
+    assert responses[0]['cursor'] == next_cursor('email', expected[-1])
+    assert (server.cache.hits, server.cache.misses) == (1, 1)
+
+
+def test_server_cache_cleared_by_other_writers(loaded_db):
+    # Arrange
+    def insert_from_other_connection(server):
+        connection = sqlite3.connect(loaded_db)
+        with connection:
+            insert_rows(connection, INSERT_SQL, [('Jane', 'Goodall', 'jane@gombe.org', 'RV', 'Gombe', 30)])
+        connection.close()
+
+    request = {'command': 'summary'}
+
+    # Act
+    _, responses = _serve_requests(loaded_db, [request, request], between=insert_from_other_connection)
+
+    # Assert
+    rv_customers = [[row[1] for row in response['rows'] if row[0] == 'RV'] for response in responses]
+    assert rv_customers == [[1], [2]]
+
+
+def test_server_rejects_invalid_requests(loaded_db):
+    _, responses = _serve_requests(loaded_db, [{'command': 'drop'}, {'command': 'view', 'sort': 'rowid'},
+                                               {'command': 'view', 'filters': {'colour': 'red'}}])
+    assert [response['ok'] for response in responses] == [False, False, False]
+
+
+@pytest.mark.parametrize('filters', [{'colour': 'red'}, {'name': 5}, {'vehicle_type': ['rv']},
+                                     {'min_length': '20'}, {'max_length': True}, ['rv']])
+def test_server_rejects_invalid_filters(loaded_db, filters):
+    # Act
+    _, responses = _serve_requests(loaded_db, [{'command': 'view', 'filters': filters},
+                                               {'command': 'view', 'filters': {'name': 'Greta', 'min_length': 20}}])
+
+    # Assert
+    assert responses[0]['error'].startswith('RequestError')
+    assert [row[2] for row in responses[1]['rows']] == ['greta@future.com']
+
+
+def test_server_view_pages_are_bounded(loaded_db, monkeypatch):
+    # Arrange
+    import outdoorsy.server
+    monkeypatch.setattr(outdoorsy.server, 'DEFAULT_PAGE_SIZE', 2)
+    requests = [{'command': 'view', 'sort': 'email'},
+                {'command': 'view', 'limit': outdoorsy.server.MAX_PAGE_SIZE + 1},
+                {'command': 'view', 'limit': '10'},
+                {'command': 'view', 'limit': 10, 'page': '2'},
+                {'command': 'view', 'limit': True}]
+
+    # Act
+    _, responses = _serve_requests(loaded_db, requests)
+
+    # Assert
+    assert len(responses[0]['rows']) == 2
+    assert responses[0]['cursor'] == next_cursor('email', list(iter_entries('email', loaded_db, limit=2))[-1])
+    assert [response['ok'] for response in responses[1:]] == [False, False, False, False]
+    assert all(response['error'].startswith('RequestError') for response in responses[1:])
+
+
+def test_server_job_that_cannot_start_does_not_stop_the_queue(tmp_path, monkeypatch):
+    # Arrange
+    import outdoorsy.server
+    db_path = str(tmp_path / 'customers.db')
+    upload_command = outdoorsy.server._upload_command
+    commands = iter([[str(tmp_path / 'missing-python')]])
+    monkeypatch.setattr(outdoorsy.server, '_upload_command',
+                        lambda *args, **options: next(commands, None) or upload_command(*args, **options))
+
+    async def run():
+        server = Server(db_path)
+        listener = await server.start(port=0)
+        try:
+            jobs = [server.jobs[server._queue_job({'paths': [COMMAS_FILE], 'delimiter': 'comma'})['job']]
+                    for _ in range(2)]
+            while any(job['state'] in ('queued', 'running') for job in jobs):
+                await asyncio.sleep(0.05)
+            return jobs
+        finally:
+            listener.close()
+            server.executor.shutdown()
+
+    # Act
+    jobs = asyncio.run(run())
+
+    # Assert
+    assert [job['state'] for job in jobs] == ['failed', 'done']
+    assert jobs[0]['output'].startswith('FileNotFoundError')
+
+
+def test_server_jobs_that_cannot_upload_their_files_fail(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    junk = tmp_path / 'junk.txt'
+    junk.write_text("nothing to see here\n", encoding='utf-8')
+    bad_length = tmp_path / 'bad_length.csv'
+    bad_length.write_text("Jane,Goodall,jane@gombe.org,RV,Gombe,long\n", encoding='utf-8')
+    requests = [{'paths': [str(junk)]}, {'paths': [COMMAS_FILE], 'delimiter': 'pipe'},
+                {'paths': [str(bad_length)], 'delimiter': 'comma'}, {'paths': [str(tmp_path / 'missing.csv')]},
+                {'paths': [COMMAS_FILE], 'delimiter': 'comma'}]
+
+    async def run():
+        server = Server(db_path)
+        listener = await server.start(port=0)
+        try:
+            jobs = [server.jobs[server._queue_job(request)['job']] for request in requests]
+            while any(job['state'] in ('queued', 'running') for job in jobs):
+                await asyncio.sleep(0.05)
+            return jobs
+        finally:
+            listener.close()
+            server.executor.shutdown()
+
+    # Act
+    jobs = asyncio.run(run())
+
+    # Assert
+    assert [job['state'] for job in jobs] == ['failed', 'failed', 'failed', 'failed', 'done']
+    assert [job['returncode'] for job in jobs] == [1, 1, 1, 1, 0]
+
+
+@pytest.mark.parametrize('host, served', [('127.0.0.1', True), ('localhost', True), ('0.0.0.0', False)])
+def test_serve_only_listens_remotely_when_allowed(host, served, monkeypatch):
+    # Arrange
+    import outdoorsy.server
+    from outdoorsy.cli import parse_serve_args
+    calls = []
+    monkeypatch.setattr(outdoorsy.server, 'serve', lambda *args: calls.append(args))
+
+    # Act
+    outdoorsy.server.run_server(parse_serve_args(['--host', host]))
+    outdoorsy.server.run_server(parse_serve_args(['--host', host, '--allow-remote']))
+
+    # Assert
+    assert len(calls) == (2 if served else 1)
+
+
+def test_server_ingest_job_over_tcp(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+
+    async def run():
+        server = Server(db_path)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+
+        def use_client():
+            with Client(str(port)) as client:
+                job_id = client.request('ingest', paths=[COMMAS_FILE], delimiter='comma')['job']
+                while client.request('job', id=job_id)['job']['state'] in ('queued', 'running'):
+                    time.sleep(0.05)
+                return client.request('job', id=job_id)['job'], client.request('view', sort='email')['rows']
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, use_client)
+        finally:
+            listener.close()
+            server.executor.shutdown()
+
+    # Act
+    job, rows = asyncio.run(run())
+
+    # Assert
+    assert job['state'] == 'done'
+    assert [row[2] for row in rows] == ['greta@future.com', 'jb@sailor.com', 'mandip@ecotourism.net',
+                                        'martinez@earthguardian.org']
+
+
+def test_response_cache_evicts_least_recently_used():
+    # Arrange
+    cache = ResponseCache(max_entries=10, max_rows=5)
+    cache.put('a', b'a', 2)
+    cache.put('b', b'b', 2)
+
+    # Act
+    cache.get('a')
+    cache.put('c', b'c', 2)
+
+    # Assert
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (b'a', None, b'c')
+    assert cache.rows == 4
+
+
+def test_parse_address():
+    assert parse_address('8765')[1] == ('127.0.0.1', 8765)
+    assert parse_address('example.com:80')[1] == ('example.com', 80)
+    assert parse_address('/tmp/outdoorsy.sock')[1] == '/tmp/outdoorsy.sock'
+
+
+def test_view_entries_uses_render_cache(loaded_db, capsys, monkeypatch):
+    # Arrange
+    import outdoorsy.app
+    from outdoorsy.app import view_entries
+    view_entries('vehicle_type', loaded_db, limit=5, filters=Filters(min_length=10))
+    first = capsys.readouterr().out
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the rows were read again")
+
+    # Act
+    monkeypatch.setattr(outdoorsy.app, 'iter_entries', fail)
+    view_entries('vehicle_type', loaded_db, limit=5, filters=Filters(min_length=10))
+    second = capsys.readouterr().out
+
+    # Assert
+    assert second == first
+    assert 'More rows are available' in first
+
+
+def test_views_of_a_database_without_customers_show_no_table(loaded_db, tmp_path, capsys):
+    # Arrange
+    from outdoorsy.app import view_entries, export_entries
+    db_path = str(tmp_path / 'empty.db')
+    get_connection(db_path)
+    output_path = tmp_path / 'customers.csv'
+
+    # Act
+    view_entries('name', db_path)
+    export_entries('name', 'csv', str(output_path), db_path)
+    merged = iter_merged_entries('name', [loaded_db, db_path])
+    _, responses = _serve_requests(db_path, [{'command': 'view'}])
+
+    # Assert
+    output = capsys.readouterr().out
+    assert output.count("Table does not exist") == 4
+    assert "First Name" not in output
+    assert not output_path.exists()
+    assert merged is None
+    assert responses[0]['error'].startswith('RequestError')
+
+
+def test_render_cache_invalidated_by_uploads(loaded_db, capsys, tmp_path):
+    # Arrange
+    from outdoorsy.app import view_entries
+    new_file = tmp_path / 'new.csv'
+    new_file.write_text("Jane,Goodall,jane@gombe.org,RV,Gombe,30 ft\n", encoding='utf-8')
+    view_entries('email', loaded_db)
+    capsys.readouterr()
+
+    # Act
+    insert_csv_to_db(str(new_file), ',', loaded_db)
+    view_entries('email', loaded_db)
+
+    # Assert
+    assert 'jane@gombe.org' in capsys.readouterr().out
+
+
+def test_render_cache_evicts_least_recently_used(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    cache = RenderCache(db_path, max_bytes=350)
+    cache.put('a', 1, 'a' * 100)
+    cache.put('b', 1, 'b' * 100)
+    os.utime(cache._path('a'), (0, 0))
+    os.utime(cache._path('b'), (1, 1))
+
+    # Act
+    cache.get('a', 1)
+    cache.put('c', 1, 'c' * 100)
+
+    # Assert
+    assert (cache.get('a', 1), cache.get('b', 1), cache.get('c', 1)) == ('a' * 100, None, 'c' * 100)
+    assert cache.get('a', 2) is None
+    assert os.path.isdir(str(tmp_path / 'customers.cache'))
+
+
+def test_get_summary(loaded_db):
+    # Arrange / Act
+    summary = {item.vehicle_type: item for item in get_summary(loaded_db)}
+
+    # Assert
+    assert list(summary) == ['bicycle', 'campervan', 'motorboat', 'RV', 'sailboat']
+    assert summary['sailboat'].customers == 2
+    assert summary['sailboat'].average_length == 36
+    assert (summary['motorboat'].min_length, summary['motorboat'].max_length) == (24, 32)
+    assert summary['campervan'].top_vehicle_names == ['Earth Guardian', 'Plastic To Purses']
+
+
+def test_summary_follows_upserts(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    insert_csv_to_db(COMMAS_FILE, ',', db_path)
+    insert_csv_to_db(COMMAS_FILE, ',', db_path)
+    changed_file = tmp_path / 'changed.csv'
+    changed_file.write_text("Jimmy,Buffet,jb@sailor.com,Catamaran,Margaritaville,45 ft\n", encoding='utf-8')
+
+    # Act
+    ensure_email_key(db_path)
+    insert_csv_to_db(str(changed_file), ',', db_path, upsert=True)
+    summary = {item.vehicle_type: item for item in get_summary(db_path)}
+
+    # Assert
+    assert (summary['sailboat'].customers, summary['sailboat'].max_length) == (1, 32)
+    assert (summary['Catamaran'].customers, summary['Catamaran'].top_vehicle_names) == (1, ['Margaritaville'])
+    assert rebuild_summary(db_path)
+
+
+def test_rebuild_summary_repairs_summary(loaded_db):
+    # Arrange
+    connection = get_connection(loaded_db)
+    with connection:
+        connection.execute("UPDATE vehicle_type_summary SET customers = 100 "
+                           "WHERE vehicle_type_id = (SELECT id FROM vehicle_types WHERE key = 'rv');")
+
+    # Act
+    matched = rebuild_summary(loaded_db)
+
+    # Assert
+    assert not matched
+    assert [item.customers for item in get_summary(loaded_db) if item.vehicle_type == 'RV'] == [1]
+    assert rebuild_summary(loaded_db)
+
+
+def _create_original_database(db_path):
+    # A database as created before schema_version existed, with vehicle types differing only in case.
+    connection = sqlite3.connect(db_path)
+    connection.executescript("""
+        CREATE TABLE customers (first_name TEXT, last_name TEXT, email TEXT, vehicle_type TEXT, vehicle_name TEXT,
+                                vehicle_length INTEGER);
+        INSERT INTO customers VALUES ('Steve', 'Irwin', 'steve@crocodiles.com', 'RV', 'G’Day For Adventure', 32),
+                                     ('Ansel', 'Adams', 'a@adams.com', 'motorboat', 'Rushing Water', 24),
+                                     ('Naomi', 'Uemura', 'n.uemura@gmail.com', 'rv', 'Glacier Glider', 20);
+        DELETE FROM customers WHERE email = 'a@adams.com';
+        CREATE UNIQUE INDEX idx_customers_email_key ON customers (email);
+        CREATE INDEX idx_customers_vehicle_type ON customers (lower(vehicle_type), first_name, last_name);
+        CREATE TABLE vehicle_type_summary (vehicle_type TEXT PRIMARY KEY, customers INTEGER, total_length INTEGER,
+                                           min_length INTEGER, max_length INTEGER);
+        CREATE TABLE change_counter (id INTEGER PRIMARY KEY CHECK (id = 0), changes INTEGER NOT NULL);
+        INSERT INTO change_counter VALUES (0, 7);
+    """)
+    connection.close()
+
+
+def test_create_table_migrates_original_database(tmp_path):
+    # Arrange
+    from outdoorsy.migrations import schema_version
+    db_path = str(tmp_path / 'customers.db')
+    _create_original_database(db_path)
+
+    # Act
+    create_table(db_path)
+
+    # Assert
+    connection = get_connection(db_path)
+    assert schema_version(connection) == 3
+    assert [tuple(row) for row in connection.execute("SELECT key, name FROM vehicle_types;")] == [('rv', 'RV')]
+    assert [tuple(row) for row in connection.execute("SELECT rowid, email FROM customers ORDER BY rowid;")] == \
+        [(1, 'steve@crocodiles.com'), (3, 'n.uemura@gmail.com')]
+    assert [row['vehicle_type'] for row in get_entries('vehicle_type', db_path, filters=Filters(vehicle_type='Rv'))] \
+        == ['RV', 'RV']
+    assert [row['email'] for row in get_entries('name', db_path, filters=Filters(search='glacier'))] == \
+        ['n.uemura@gmail.com']
+    assert [(item.vehicle_type, item.customers) for item in get_summary(db_path)] == [('RV', 2)]
+    assert get_change_counter(db_path) == 8
+    upload_files([PIPES_FILE], '|', db_path, upsert=True)
+    assert _count_customers(db_path) == 4
+
+
+@pytest.mark.parametrize('output', [[], ['--output', 'csv']])
+def test_view_without_db_path_migrates_original_database(tmp_path, monkeypatch, capsys, output):
+    # Arrange
+    from outdoorsy import run_with_args
+    monkeypatch.chdir(tmp_path)
+    _create_original_database('customers.db')
+
+    # Act
+    run_with_args(parse_args(['-v', '-s', 'email', *output]))
+
+    # Assert
+    result = capsys.readouterr().out
+    assert "Table does not exist" not in result
+    assert 'n.uemura@gmail.com' in result and 'steve@crocodiles.com' in result
+
+
+def test_migrate_applies_new_migrations_once(tmp_path):
+    # Arrange
+    from outdoorsy.migrations import Migration, migrate, schema_version, UnsupportedSchema
+    connection = sqlite3.connect(str(tmp_path / 'migrations.db'))
+    calls = []
+    migrations = [Migration(1, "first", lambda connection: calls.append(1)),
+                  Migration(2, "second", lambda connection: connection.execute("CREATE TABLE second (id);"))]
+
+    # Act
+    first = migrate(connection, migrations[:1])
+    second = migrate(connection, migrations)
+    third = migrate(connection, migrations)
+
+    # Assert
+    assert (first, second, third) == ([1], [2], [])
+    assert calls == [1]
+    assert schema_version(connection) == 2
+    with pytest.raises(UnsupportedSchema):
+        migrate(connection, migrations[:1])
+    connection.close()
+
+
+def test_insert_csv_to_db_resumes_from_checkpoint(tmp_path, monkeypatch):
+    # Arrange
+    import outdoorsy.database
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    big_file = tmp_path / 'big.csv'
+    with open(COMMAS_FILE, encoding='utf-8') as file:
+        big_file.write_text((file.read().strip() + "\n") * 5, encoding='utf-8')
+    normalize_rows = outdoorsy.database.normalize_rows
+    calls = []
+
+    def fail_on_fourth_chunk(records):
+        calls.append(records)
+        if len(calls) == 4:
+            raise KeyboardInterrupt
+        return normalize_rows(records)
+
+    monkeypatch.setattr(outdoorsy.database, 'normalize_rows', fail_on_fourth_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        insert_csv_to_db(str(big_file), ',', db_path, batch_size=3)
+    monkeypatch.setattr(outdoorsy.database, 'normalize_rows', normalize_rows)
+    fingerprint = file_fingerprint(str(big_file))
+
+    # Act
+    checkpoint = get_checkpoint(fingerprint, db_path)
+    inserted = insert_csv_to_db(str(big_file), ',', db_path, batch_size=3, resume=True)
+
+    # Assert
+    assert checkpoint.row_number == 9
+    assert inserted == 11
+    assert _count_customers(db_path) == 20
+    assert get_checkpoint(fingerprint, db_path) is None
+    assert is_loaded(fingerprint, db_path)
+    emails = [row[0] for row in get_connection(db_path).execute("SELECT email FROM customers;")]
+    assert all(emails.count(email) == 5 for email in set(emails))
+
+
+def test_upload_files_skips_stopped_upload_without_resume(tmp_path, monkeypatch):
+    # Arrange
+    import outdoorsy.database
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    big_file = tmp_path / 'big.csv'
+    with open(COMMAS_FILE, encoding='utf-8') as file:
+        big_file.write_text((file.read().strip() + "\n") * 3, encoding='utf-8')
+    normalize_rows = outdoorsy.database.normalize_rows
+    calls = []
+
+    def fail_on_second_chunk(records):
+        calls.append(records)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return normalize_rows(records)
+
+    monkeypatch.setattr(outdoorsy.database, 'normalize_rows', fail_on_second_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        upload_files([str(big_file)], ',', db_path, batch_size=6)
+    monkeypatch.setattr(outdoorsy.database, 'normalize_rows', normalize_rows)
+
+    # Act
+    skipped = upload_files([str(big_file)], ',', db_path, batch_size=6)
+    skipped_count = _count_customers(db_path)
+    forced = upload_files([str(big_file)], ',', db_path, batch_size=6, force=True)
+
+    # Assert
+    assert not skipped
+    assert skipped_count == 6
+    assert forced
+    assert _count_customers(db_path) == 18
+    assert get_checkpoint(file_fingerprint(str(big_file)), db_path) is None
+
+
+def test_upload_files_does_not_restart_a_file_changed_after_it_stopped(tmp_path, capsys):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    path = tmp_path / 'customers.csv'
+    lines = [f"Jane,Doe{number},jane{number}@example.com,RV,Airstream,{20 + number} ft" for number in range(6)]
+    path.write_text("\n".join(lines[:4] + ["Jane,Doe4,jane4@example.com,RV,Airstream,long"] + lines[5:]) + "\n",
+                    encoding='utf-8')
+    with pytest.raises(InvalidLength):
+        upload_files([str(path)], ',', db_path, batch_size=3)
+    # The row the upload stopped at is fixed, which changes the sha256 of the file.
+    path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+
+    # Act
+    resumed = upload_files([str(path)], ',', db_path, batch_size=3, resume=True)
+    resumed_count = _count_customers(db_path)
+    forced = upload_files([str(path)], ',', db_path, batch_size=3, force=True, upsert=True)
+
+    # Assert
+    assert not resumed
+    assert resumed_count == 3
+    assert "stopped after 3 rows and the file has changed since" in capsys.readouterr().out
+    assert forced
+    assert _count_customers(db_path) == 6
+    assert get_changed_checkpoint(file_fingerprint(str(path)), db_path) == 0
+
+
+def test_ingest_files_resumes_from_range_checkpoints(tmp_path, monkeypatch):
+    # Arrange
+    import outdoorsy.ingest
+    from outdoorsy.database import get_range_checkpoints
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    paths = []
+    for number in range(2):
+        path = tmp_path / f'customers-{number}.csv'
+        path.write_text("".join(f"First,Last,{number}-{row}@example.com,rv,Van,{row} ft\n" for row in range(40)),
+                        encoding='utf-8')
+        paths.append(str(path))
+    fingerprints = {path: file_fingerprint(path) for path in paths}
+    insert_rows = outdoorsy.ingest.insert_rows
+    calls = []
+
+    def fail_on_fourth_batch(connection, sql, rows):
+        calls.append(rows)
+        if len(calls) == 4:
+            raise RuntimeError("interrupted")
+        insert_rows(connection, sql, rows)
+
+    monkeypatch.setattr(outdoorsy.ingest, 'insert_rows', fail_on_fourth_batch)
+    with pytest.raises(RuntimeError):
+        ingest_files(paths, ',', db_path, batch_size=5, workers=2, chunk_bytes=400, fingerprints=fingerprints)
+    monkeypatch.setattr(outdoorsy.ingest, 'insert_rows', insert_rows)
+    stopped = {path: get_range_checkpoints(fingerprints[path], db_path) for path in paths}
+    committed = _count_customers(db_path)
+
+    # Act
+    resumed = upload_files(paths, ',', db_path, batch_size=5, workers=2, resume=True)
+
+    # Assert
+    assert all(len(checkpoints) > 1 for checkpoints in stopped.values())
+    assert 0 < committed < 80
+    assert sum(checkpoint.row_number for checkpoints in stopped.values() for checkpoint in checkpoints) == committed
+    assert resumed
+    emails = [row[0] for row in get_connection(db_path).execute("SELECT email FROM customers;")]
+    assert len(emails) == len(set(emails)) == 80
+    assert all(is_loaded(fingerprint, db_path) for fingerprint in fingerprints.values())
+    assert not any(get_range_checkpoints(fingerprint, db_path) for fingerprint in fingerprints.values())
+
+
+@pytest.mark.parametrize('path, expected', [(COMMAS_FILE, ','), (PIPES_FILE, '|')])
+def test_sniff_delimiter(path, expected):
+    assert sniff_delimiter(path) == expected
+
+
+def test_sniff_delimiter_not_detected(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text("just some text\n", encoding='utf-8')
+    with pytest.raises(DelimiterNotDetected):
+        sniff_delimiter(str(path))
+
+
+def test_iter_records(tmp_path):
+    # Arrange
+    path = tmp_path / 'records.csv'
+    path.write_bytes('a,b,c\r\n\n"d,e",f,g\nh,i,’\n'.encode('utf-8'))
+
+    # Act
+    records = list(iter_records(str(path), ','))
+
+    # Assert
+    assert [fields for _, fields in records] == [['a', 'b', 'c'], ['d,e', 'f', 'g'], ['h', 'i', '’']]
+    assert records[-1][0] == path.stat().st_size
+
+
+def test_iter_records_reads_quoted_line_breaks(tmp_path):
+    # Arrange
+    text = 'Jane,Goodall,jane@gombe.org,RV,"Gombe\r\nStream",32\' 6"\r\nGreta,Thunberg,greta@future.com,Sailboat,' \
+           '"Malizia ""II""\n\nSeaexplorer",59 ft\n'
+    path = tmp_path / 'records.csv'
+    path.write_text(text, encoding='utf-8', newline='')
+    compressed = tmp_path / 'records.csv.gz'
+    compressed.write_bytes(gzip.compress(text.encode('utf-8')))
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+
+    # Act
+    records = list(iter_records(str(path), ','))
+    compressed_records = list(iter_records(str(compressed), ','))
+    results, _ = ingest_files([str(path), str(compressed)], ',', db_path, workers=2, chunk_bytes=16)
+
+    # Assert
+    assert [fields[4] for _, fields in records] == ['Gombe\r\nStream', 'Malizia "II"\n\nSeaexplorer']
+    assert records[0][1][5] == '32\' 6"'
+    assert [offset for offset, _ in records] == [text.index('Greta'), len(text)]
+    assert compressed_records == records
+    assert has_multiline_records(str(path), ',') and not has_multiline_records(COMMAS_FILE, ',')
+    assert [result.rows for result in results] == [2, 2]
+
+
+def test_iter_records_ranges_read_every_record_once():
+    # Arrange
+    size = os.path.getsize(COMMAS_FILE)
+    expected = [fields for _, fields in iter_records(COMMAS_FILE, ',')]
+
+    # Act
+    records = []
+    for start in range(0, size, 37):
+        records.extend(fields for _, fields in iter_records(COMMAS_FILE, ',', start, start + 37))
+
+    # Assert
+    assert records == expected
+
+
+BAD_ROWS = ("Greta,Thunberg,greta@future.com,sailboat,Fridays For Future,32’\n"
+            "\n"
+            "Jimmy,Buffet,jb@sailor.com,sailboat,Margaritaville,forty\n"
+            "Mandip,Singh Soin,mandip@ecotourism.net,motorboat\n"
+            "Ansel,Adams,a@adams.com,rv,Yosemite,22 ft\n")
+
+
+def _read_rejects(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        return [row[:3] for row in csv.reader(file)][1:]
+
+
+def test_insert_csv_to_db_writes_rejected_rows_and_loads_the_others(tmp_path):
+    # Arrange
+    path = tmp_path / 'bad.csv'
+    path.write_text(BAD_ROWS, encoding='utf-8')
+    reject_path = str(tmp_path / 'rejects.csv')
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+
+    # Act
+    with RejectFile(reject_path) as rejects:
+        inserted = insert_csv_to_db(str(path), ',', db_path, batch_size=2, rejects=rejects)
+
+    # Assert
+    assert inserted == 2
+    assert [row['email'] for row in get_entries('name', db_path)] == ['a@adams.com', 'greta@future.com']
+    assert rejects.count == 2
+    assert _read_rejects(reject_path) == [[str(path), '3', "invalid vehicle length: 'forty'"],
+                                          [str(path), '4', 'expected 6 fields but found 4']]
+
+
+def test_ingest_files_sends_rejected_rows_from_workers(tmp_path):
+    # Arrange
+    paths = []
+    for number in range(2):
+        path = tmp_path / f'bad-{number}.csv'
+        path.write_text(BAD_ROWS * 3, encoding='utf-8')
+        paths.append(str(path))
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+
+    # Act
+    with RejectFile(str(tmp_path / 'rejects.csv')) as rejects:
+        results, _ = ingest_files(paths, ',', db_path, workers=2, chunk_bytes=64, rejects=rejects)
+
+    # Assert
+    assert [(result.rows, result.error) for result in results] == [(6, None), (6, None)]
+    assert [(row[0], row[1]) for row in _read_rejects(tmp_path / 'rejects.csv')] == [
+        (path, line) for path in paths for line in ('3', '4', '8', '9', '13', '14')]
+
+
+def test_validate_only_reports_rejected_rows_without_a_database(tmp_path, monkeypatch, capsys):
+    # Arrange
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'bad.csv').write_text(BAD_ROWS, encoding='utf-8')
+    from outdoorsy import run_with_args
+    args = parse_args(['-f', 'bad.csv', '--validate-only', '--reject-file', 'rejects.csv'])
+
+    # Act
+    run_with_args(args)
+    result = validate_file(COMMAS_FILE)
+
+    # Assert
+    output = capsys.readouterr().out
+    assert "First 2 of 2 rejected rows" in output
+    assert "invalid vehicle length: 'forty'" in output
+    assert not (tmp_path / 'customers.db').exists()
+    assert len(_read_rejects(tmp_path / 'rejects.csv')) == 2
+    assert (result.rows, result.rejected) == (4, 0)
+
+
+@pytest.mark.parametrize('file, delimiter, message', [
+    ('junk.txt', [], "Could not detect the delimiter of"),
+    (COMMAS_FILE, ['-d', 'pipe'], "Please verify pipe is the correct delimiter"),
+])
+def test_upload_errors_are_handled_with_a_database_path(tmp_path, capsys, file, delimiter, message):
+    # Arrange
+    junk = tmp_path / 'junk.txt'
+    junk.write_text("nothing to see here\n", encoding='utf-8')
+    from outdoorsy import run_with_args
+    args = parse_args(['-f', str(tmp_path / file), *delimiter, '-db', str(tmp_path)])
+
+    # Act
+    run_with_args(args)
+
+    # Assert
+    output = capsys.readouterr().out
+    assert message in output
+    assert "File uploaded successfully" not in output
+    assert _count_customers(str(tmp_path / 'customers.db')) == 0
+
+
+def test_invalid_length_is_handled_with_a_database_path(tmp_path, capsys):
+    # Arrange
+    bad_length = tmp_path / 'bad_length.csv'
+    bad_length.write_text("Jane,Goodall,jane@gombe.org,RV,Gombe,long\n", encoding='utf-8')
+    from outdoorsy import run_with_args
+    args = parse_args(['-f', str(bad_length), '-d', 'comma', '-db', str(tmp_path)])
+
+    # Act
+    run_with_args(args)
+
+    # Assert
+    output = capsys.readouterr().out
+    assert "invalid vehicle length: 'long'" in output
+    assert "File uploaded successfully" not in output
+    assert _count_customers(str(tmp_path / 'customers.db')) == 0
+
+
+@pytest.mark.parametrize('module, extension', [(gzip, 'gz'), (bz2, 'bz2'), (lzma, 'xz')])
+def test_compressed_files_are_read_while_decompressing(tmp_path, module, extension):
+    # Arrange
+    path = str(tmp_path / f'pipes.txt.{extension}')
+    with open(PIPES_FILE, 'rb') as source, module.open(path, 'wb') as target:
+        target.write(source.read())
+    expected = list(iter_records(PIPES_FILE, '|'))
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+
+    # Act
+    detected = detect_compression(path)
+    delimiter = sniff_delimiter(path)
+    records = list(iter_records(path, delimiter))
+    after_first = list(iter_records(path, delimiter, expected[0][0]))
+    inserted = insert_csv_to_db(path, None, db_path)
+
+    # Assert
+    assert detected == module.__name__
+    assert delimiter == '|'
+    assert records == expected
+    assert after_first == expected[1:]
+    assert inserted == len(expected)
+
+
+def test_ingest_files_decompresses_files_in_workers(tmp_path):
+    # Arrange
+    paths = []
+    for number in range(3):
+        path = str(tmp_path / f'commas-{number}.csv.gz')
+        with open(COMMAS_FILE, 'rb') as source, gzip.open(path, 'wb') as target:
+            target.write(source.read())
+        paths.append(path)
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+
+    # Act
+    results, _ = ingest_files(paths, None, db_path, workers=2)
+
+    # Assert
+    rows = len(list(iter_records(COMMAS_FILE, ',')))
+    assert [(result.rows, result.error) for result in results] == [(rows, None)] * 3
+    assert len(get_entries('name', db_path)) == 3 * rows
+
+
+def test_insert_stream_from_stdin_detects_delimiter(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    with open(PIPES_FILE, encoding='utf-8') as file:
+        stream = io.StringIO(file.read())
+
+    # Act
+    inserted = insert_stream(read_lines(stream), None, db_path, batch_size=2)
+
+    # Assert
+    assert inserted == len(list(iter_records(PIPES_FILE, '|')))
+    assert get_entries('name', db_path) == get_entries('name', _loaded(tmp_path / 'file.db', PIPES_FILE, '|'))
+
+
+def test_insert_stream_commits_micro_batch_after_flush_interval(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    with open(COMMAS_FILE, encoding='utf-8') as file:
+        lines = file.readlines()
+    committed = []
+
+    def source():
+        yield from lines[:2]
+        time.sleep(0.05)
+        # An idle tick, as yielded by read_lines and follow_file while waiting for more lines.
+        yield None
+        committed.append(len(get_entries('name', db_path)))
+        yield from lines[2:]
+
+    # Act
+    inserted = insert_stream(source(), ',', db_path, batch_size=1000, flush_interval=0.01)
+
+    # Assert
+    assert committed == [2]
+    assert inserted == len(lines)
+
+
+def test_follow_file_reads_across_truncation_and_rotation(tmp_path):
+    # Arrange
+    path = tmp_path / 'customers.log'
+    path.write_text("a,1\nb,2\nc,", encoding='utf-8')
+    stop = threading.Event()
+    lines = follow_file(str(path), poll_interval=0.01, stop=stop)
+    read = []
+
+    def read_until_idle():
+        while (line := next(lines)) is not None:
+            read.append(line)
+
+    # Act
+    read_until_idle()
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write("3\n")
+    read_until_idle()
+    path.write_text("d,4\n", encoding='utf-8')
+    read_until_idle()
+    os.rename(path, tmp_path / 'customers.log.1')
+    with open(tmp_path / 'customers.log.1', 'a', encoding='utf-8') as file:
+        file.write("e,5")
+    path.write_text("f,6\n", encoding='utf-8')
+    read_until_idle()
+    stop.set()
+
+    # Assert
+    assert read == ['a,1', 'b,2', 'c,3', 'd,4', 'e,5', 'f,6']
+    assert list(lines) == []
+
+
+def _loaded(db_path, path, delimiter):
+    create_table(str(db_path))
+    insert_csv_to_db(path, delimiter, str(db_path))
+    return str(db_path)
+
+
+def test_write_lock_queues_writers_across_open_files(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    first = WriteLock(db_path)
+    second = WriteLock(db_path)
+    order = []
+
+    def write_second():
+        with second:
+            order.append('second')
+
+    # Act
+    with first:
+        writer = threading.Thread(target=write_second)
+        writer.start()
+        time.sleep(0.1)
+        order.append('first')
+    writer.join(timeout=5)
+
+    # Assert
+    assert order == ['first', 'second']
+    assert os.path.exists(db_path + '.lock')
+
+
+def test_begin_immediate_retries_while_database_is_locked(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    writer = sqlite3.connect(db_path, check_same_thread=False)
+    writer.execute("BEGIN IMMEDIATE;")
+    waiting = sqlite3.connect(db_path, timeout=0)
+    threading.Timer(0.2, writer.rollback).start()
+
+    # Act
+    begin_immediate(waiting, retries=10, backoff=0.05)
+
+    # Assert
+    assert waiting.in_transaction
+    waiting.rollback()
+    with pytest.raises(sqlite3.OperationalError):
+        writer.execute("BEGIN IMMEDIATE;")
+        begin_immediate(waiting, retries=1, backoff=0.01)
+
+
+def test_views_do_not_wait_for_a_concurrent_upload(loaded_db, tmp_path):
+    # Arrange
+    expected = get_entries('name', loaded_db)
+    close_connection(loaded_db)
+    path = tmp_path / 'more.csv'
+    path.write_text("Ansel,Adams,a@adams.com,rv,Yosemite,22 ft\n", encoding='utf-8')
+    lock = WriteLock(loaded_db)
+    lock.acquire()
+    writer = sqlite3.connect(loaded_db)
+    writer.execute("BEGIN IMMEDIATE;")
+    writer.execute("UPDATE change_counter SET changes = changes + 1;")
+    upload = threading.Thread(target=insert_csv_to_db, args=(str(path), ',', loaded_db), kwargs={'concurrent': True})
+
+    # Act
+    upload.start()
+    started = time.perf_counter()
+    during_upload = get_entries('name', loaded_db)
+    view_seconds = time.perf_counter() - started
+    time.sleep(0.1)
+    waiting = upload.is_alive()
+    writer.commit()
+    lock.release()
+    upload.join(timeout=5)
+
+    # Assert
+    assert waiting
+    assert during_upload == expected
+    assert view_seconds < 1
+    assert len(get_entries('name', loaded_db)) == len(expected) + 1
+
+
+def test_concurrent_uploads_from_several_processes(tmp_path):
+    # Arrange
+    paths = []
+    for number in range(3):
+        path = tmp_path / f'customers-{number}.csv'
+        path.write_text("".join(f"First,Last,{number}-{row}@example.com,rv,Van,{row} ft\n" for row in range(500)),
+                        encoding='utf-8')
+        paths.append(str(path))
+    command = [sys.executable, '-c', 'import outdoorsy; outdoorsy.main()', '-d', 'comma', '-db', str(tmp_path),
+               '--batch-size', '50', '--concurrent', '-f']
+
+    # Act
+    processes = [subprocess.Popen(command + [path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                 for path in paths]
+    outputs = [process.communicate(timeout=60)[0].decode() for process in processes]
+
+    # Assert
+    assert all("uploaded successfully" in output for output in outputs), outputs
+    assert len(get_entries('email', str(tmp_path / 'customers.db'))) == 1500
+
+
+def test_session_reads_every_sort_order_once(tmp_path, monkeypatch):
+    # Arrange
+    import outdoorsy.session
+    db_path = str(tmp_path / 'customers.db')
+    session = Session(render=format_results, upload=upload_files, page_size=2)
+    session.select_database(db_path)
+    session.upload(COMMAS_FILE, ',')
+    reads = []
+    monkeypatch.setattr(outdoorsy.session, 'get_entries',
+                        lambda sort_order, path: reads.append(sort_order) or get_entries(sort_order, path))
+
+    # Act
+    first_page = session.render_page('name', 1)
+    session.render_page('name', 2)
+    session.render_page('vehicle_type', 1)
+    cached_page = session.render_page('name', 1)
+
+    # Assert
+    assert reads == ['name', 'vehicle_type']
+    assert cached_page is first_page
+    assert session.page_count('name') == 2
+    assert first_page == format_results(get_entries('name', db_path)[:2])
+
+
+def test_session_is_invalidated_by_uploads(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    session = Session(render=format_results, upload=upload_files)
+    session.select_database(db_path)
+    session.upload(COMMAS_FILE, ',')
+    before = session.results('name')
+
+    # Act
+    session.upload(PIPES_FILE, '|')
+    after = session.results('name')
+    # An upload made outside the session, such as by another outdoorsy process, changes the change counter.
+    insert_csv_to_db(COMMAS_FILE, ',', db_path)
+    external = session.results('name')
+
+    # Assert
+    assert (len(before), len(after), len(external)) == (4, 8, 12)
+
+
+def test_run_interactively_keeps_the_selected_database(tmp_path, monkeypatch, capsys):
+    # Arrange
+    from outdoorsy.app import run_interactively
+    bad_length = tmp_path / 'bad-length.csv'
+    bad_length.write_text("Jane,Goodall,jane@gombe.org,RV,Gombe,long\n", encoding='utf-8')
+    not_text = tmp_path / 'not-text.csv'
+    not_text.write_bytes(b"\xff\xfe,\x00\n")
+    answers = iter(['1', COMMAS_FILE, 'comma', 'y', str(tmp_path),
+                    '1', COMMAS_FILE, 'comma',
+                    '1', str(bad_length), 'comma',
+                    '1', str(not_text), 'comma',
+                    '2', '1',
+                    '2', '2',
+                    '4'])
+    monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+
+    # Act
+    run_interactively()
+    output = capsys.readouterr().out
+
+    # Assert
+    # Uploading the same file a second time is skipped instead of adding its rows again.
+    assert output.count("4 rows were added") == 1
+    assert "it has already been uploaded" in output
+    assert _count_customers(str(tmp_path / 'customers.db')) == 4
+    assert "invalid vehicle length: 'long'" in output
+    assert "could not be read as UTF-8 text" in output
+    # The database path is only asked for by the first menu choice.
+    assert next(answers, None) is None
+    assert output.count("| First Name") == 2
+
+
+def test_get_entries_returns_result_set(loaded_db):
+    # Act
+    results = get_entries('email', loaded_db)
+
+    # Assert
+    rows = [tuple(row) for row in get_connection(loaded_db).execute(f"{SELECT_SQL} ORDER BY email, customers.rowid;")]
+    assert isinstance(results, ResultSet)
+    assert results == rows
+    assert len(results) == len(rows)
+    assert results[0]['email'] == rows[0][2] and results[-1][5] == rows[-1][5]
+    assert results[2:5] == rows[2:5]
+    assert list(results.column('vehicle_length')) == [row[5] for row in rows]
+    assert sorted(results.vehicle_types) == sorted({row[3] for row in rows})
+
+
+def test_result_set_sort_and_legacy_lengths():
+    # Arrange
+    results = ResultSet([('Ann', 'Lee', 'ann@x.com', 'RV', 'Big', 30), ('Bob', 'Ray', 'bob@x.com', 'van', 'Small', 12),
+                         ('Cy', 'Lee', 'cy@x.com', 'RV', 'Old', 30)])
+
+    # Act
+    results.sort('vehicle_length', 'first_name', reverse=True)
+    results.append(('Di', 'Moe', 'di@x.com', 'van', 'Odd', '12 ft'))
+
+    # Assert
+    assert [row['email'] for row in results] == ['cy@x.com', 'ann@x.com', 'bob@x.com', 'di@x.com']
+    assert results.column('vehicle_length') == [30, 30, 12, '12 ft']
+    with pytest.raises(IndexError):
+        results[4]
+
+
+def test_result_set_uses_less_memory_than_rows(tmp_path):
+    # Arrange
+    import tracemalloc
+    from benchmarks.datagen import write_file
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    insert_csv_to_db(write_file(str(tmp_path / 'customers.txt'), 5000, 'comma'), ',', db_path)
+
+    def held_bytes(read):
+        tracemalloc.start()
+        result = read()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        return held
+
+    # Act
+    row_list_bytes = held_bytes(lambda: get_connection(db_path).execute(SELECT_SQL).fetchall())
+    result_set_bytes = held_bytes(lambda: get_entries('email', db_path))
+
+    # Assert
+    assert result_set_bytes < row_list_bytes / 2
+
+
+def test_benchmark_data_generator(tmp_path):
+    # Arrange
+    from benchmarks.datagen import write_file
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+
+    # Act
+    path = write_file(str(tmp_path / 'customers.txt'), 500, 'pipe')
+    inserted = insert_csv_to_db(path, None, db_path)
+
+    # Assert
+    assert inserted == 500
+    again = write_file(str(tmp_path / 'again.txt'), 500, 'pipe')
+    with open(again, 'rb') as first, open(path, 'rb') as second:
+        assert first.read() == second.read()
+
+
+def test_stats_nested_stages_are_exclusive():
+    # Arrange
+    stats = Stats()
+    stats.enable()
+
+    # Act
+    with stats.stage('render'):
+        with stats.stage('fetch'):
+            sum(range(100000))
+
+    # Assert
+    assert stats.calls == {'fetch': 1, 'render': 1}
+    assert stats.seconds['render'] < stats.seconds['fetch']
+
+
+def test_stats_disabled_records_nothing():
+    stats = Stats()
+    with stats.stage('parse'):
+        stats.count('rows_inserted', 5)
+    assert stats.seconds == {} and stats.counters == {}
+
+
+def test_stats_hook_runs_around_outermost_stage():
+    # Arrange
+    stats = Stats()
+    entered = []
+
+    @contextmanager
+    def hook(name):
+        entered.append(name)
+        yield
+
+    stats.enable(hook=hook)
+
+    # Act
+    with stats.stage('render'):
+        with stats.stage('fetch'):
+            pass
+
+    # Assert
+    assert entered == ['render']
+
+
+def test_insert_csv_to_db_records_stats(tmp_path):
+    # Arrange
+    db_path = str(tmp_path / 'customers.db')
+    create_table(db_path)
+    STATS.enable()
+
+    # Act
+    try:
+        insert_csv_to_db(COMMAS_FILE, ',', db_path)
+        data = STATS.to_dict()
+    finally:
+        STATS.disable()
+
+    # Assert
+    assert data['counters']['rows_inserted'] == 4
+    assert {'open', 'parse', 'normalize', 'insert', 'commit'} <= set(data['stages'])
+
+
+def _import_times(*args):
+    """Runs outdoorsy with args under -X importtime and returns the cumulative import time of every module in ms."""
+    command = [sys.executable, '-X', 'importtime', '-c',
+               f"import sys; sys.argv = ['outdoorsy', *{list(args)!r}]; import outdoorsy; outdoorsy.main()"]
+    result = subprocess.run(command, capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:'):
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                # Top level imports are the ones without indentation.
+                times[name.strip()] = (int(cumulative) / 1000, not name[1:].startswith(' '))
+    return result, times
+
+
+@pytest.mark.parametrize('args', [['--version'], ['-h']])
+def test_version_and_help_skip_heavy_imports(args):
+    # Arrange / Act
+    result, times = _import_times(*args)
+
+    # Assert
+    assert result.returncode == 0
+    assert not HEAVY_MODULES & set(times)
+
+
+def test_version_startup_budget():
+    # Arrange / Act
+    result, times = _import_times('--version')
+    startup_ms = sum(milliseconds for name, (milliseconds, top_level) in times.items()
+                     if top_level and name.split('.')[0] == 'outdoorsy')
+
+    # Assert
+    assert result.stdout.strip().startswith('outdoorsy ')
+    assert startup_ms < STARTUP_BUDGET_MS
+